@@ -12,7 +12,6 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
-from pymongo import MongoClient
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,10 +21,48 @@ OPENAI_API_KEY=os.getenv("OPENAI_API_KEY")
 # Database name
 DB = 'lawpy'
 
-# Connect to MongoDB - using environment variable to determine if we're in Docker
+# MongoDB - using environment variable to determine if we're in Docker. Each worker
+# process creates its pooled client lazily on first use (see backend/mongo.py)
 MONGODB_HOST = os.environ.get('MONGODB_HOST', 'localhost')
-MONGODB_CLIENT = MongoClient(f'mongodb://{MONGODB_HOST}:27017/')
-MONGODB_DB = MONGODB_CLIENT[DB]
+MONGODB_URI = os.environ.get('MONGODB_URI', f'mongodb://{MONGODB_HOST}:27017/')
+MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 50))
+MONGODB_TIMEOUT_MS = int(os.environ.get('MONGODB_TIMEOUT_MS', 5000))
+
+# Search engine: 'mongo' runs the aggregation pipeline on every query, 'memory' answers
+# queries from an in-process inverted index (using Mongo until the index has loaded),
+# 'mmap' maps the binary index directory at SEARCH_INDEX_DIR
+SEARCH_ENGINE = os.environ.get('LAWPY_SEARCH_ENGINE', 'mongo')
+SEARCH_INDEX_DIR = os.environ.get('LAWPY_INDEX_DIR')
+# When SEARCH_INDEX_DIR is a segment directory (index_opinions.py --segments), how often
+# workers check it for a newly published generation (seconds)
+SEARCH_INDEX_REFRESH = int(os.environ.get('LAWPY_INDEX_REFRESH', 30))
+# With an in-process index, rank only this many results per query up front (0 ranks every
+# match); paginated_results continues the ranking when a deeper page is requested
+SEARCH_TOP_K = int(os.environ.get('LAWPY_SEARCH_TOP_K', 100))
+# Default ranking when a request does not pass 'ranking': 'matches' (distinct keywords, then
+# total count), 'bm25' (in-process engines only) or 'hybrid' (keyword ranking fused with the
+# dense vector ranking, see DENSE_INDEX_DIR)
+SEARCH_RANKING = os.environ.get('LAWPY_SEARCH_RANKING', 'matches')
+# Postings layout the MongoDB engine reads: 'documents' (keyword_postings, one document per
+# posting, ranked by an aggregation) or 'packed' (packed_postings, binary arrays per keyword)
+MONGO_POSTINGS = os.environ.get('LAWPY_MONGO_POSTINGS', 'documents')
+# api/SearchStream: most results streamed per query, and the first / largest chunk size
+SEARCH_STREAM_LIMIT = int(os.environ.get('LAWPY_SEARCH_STREAM_LIMIT', 1000))
+SEARCH_STREAM_CHUNK = 10
+SEARCH_STREAM_MAX_CHUNK = 200
+# Optional directory holding keyword_postings.json / document_entities.json to build the
+# in-memory index from, instead of reading the MongoDB collections
+SEARCH_INDEX_DATA_DIR = os.environ.get('LAWPY_INDEX_DATA_DIR')
+# Optional vocabulary directory (backend/vocabulary.py) mapping extracted keywords that are
+# not indexed terms onto at most VOCABULARY_MAX_EXPANSIONS real ones before retrieval
+VOCABULARY_DIR = os.environ.get('LAWPY_VOCABULARY_DIR')
+VOCABULARY_MAX_EXPANSIONS = int(os.environ.get('LAWPY_VOCABULARY_MAX_EXPANSIONS', 3))
+# Optional dense vector index (backend/dense_index.py, scripts/build_dense_index.py) for the
+# 'hybrid' ranking: inverted lists probed per query, and how deep the keyword and dense
+# rankings are fused
+DENSE_INDEX_DIR = os.environ.get('LAWPY_DENSE_INDEX_DIR')
+DENSE_NPROBE = int(os.environ.get('LAWPY_DENSE_NPROBE', 32))
+DENSE_FUSION_DEPTH = int(os.environ.get('LAWPY_DENSE_FUSION_DEPTH', 1000))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -66,6 +103,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'backend.timing.TimingMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -146,6 +184,52 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches: 'default' stays per-process; 'shared' is seen by every worker on the host (and
+# across hosts with Redis). Set REDIS_URL to use Redis (requires the redis package),
+# otherwise entries are kept as files under LAWPY_CACHE_DIR.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('LAWPY_CACHE_DIR', '/tmp/lawpy-cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Keyword extraction: 'llm' (OpenAI), 'offline' (match the question against the indexed
+# vocabulary, no network), or 'fallback' (LLM, offline when it fails or returns nothing)
+KEYWORD_EXTRACTOR = os.environ.get('LAWPY_KEYWORD_EXTRACTOR', 'llm')
+KEYWORD_EXTRACTOR_MAX = 10
+
+# Keyword extraction cache (backend/keywords.py)
+KEYWORD_CACHE_ALIAS = 'shared'
+KEYWORD_CACHE_TTL = int(os.environ.get('LAWPY_KEYWORD_CACHE_TTL', 24 * 60 * 60))
+KEYWORD_CACHE_LOCAL_SIZE = int(os.environ.get('LAWPY_KEYWORD_CACHE_LOCAL_SIZE', 1024))
+# How long other workers wait for an in-flight LLM call on the same question
+KEYWORD_CACHE_LOCK_TIMEOUT = 30
+
+# Ranked search results (packed document ids and scores), shared by all workers
+RESULT_CACHE_ALIAS = 'shared'
+RESULT_CACHE_TTL = int(os.environ.get('LAWPY_RESULT_CACHE_TTL', 1200))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('LAWPY_RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Per-process LRU of document url/title, filled one results page at a time
+DOCUMENT_CACHE_SIZE = int(os.environ.get('LAWPY_DOCUMENT_CACHE_SIZE', 10000))
+# Optional host-wide memory-mapped copy of document_entities (backend/doc_table.py), and
+# how often workers check it for a newly published version (seconds)
+DOCUMENT_TABLE_DIR = os.environ.get('LAWPY_DOCUMENT_TABLE_DIR')
+DOCUMENT_TABLE_REFRESH = int(os.environ.get('LAWPY_DOCUMENT_TABLE_REFRESH', 30))
+# Optional compressed opinion text store (backend/text_store.py, scripts/build_text_store.py);
+# when set, result items carry a highlighted snippet of about SNIPPET_LENGTH characters
+TEXT_STORE_DIR = os.environ.get('LAWPY_TEXT_STORE_DIR')
+SNIPPET_LENGTH = int(os.environ.get('LAWPY_SNIPPET_LENGTH', 240))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class BackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend'
+
+    def ready(self):
+        from . import doc_table, search_engine
+        doc_table.start()
+        if settings.SEARCH_ENGINE == 'memory':
+            search_engine.start_loading(settings.SEARCH_INDEX_DATA_DIR)
+        elif settings.SEARCH_ENGINE == 'mmap' and settings.SEARCH_INDEX_DIR:
+            search_engine.open_disk_index(settings.SEARCH_INDEX_DIR)
@@ -0,0 +1,382 @@
+"""
+Dense document vectors and an IVF nearest-neighbour index, built locally with NumPy.
+
+Keyword overlap misses opinions that discuss the same doctrine in different words. The
+dense index embeds every opinion as a low-dimensional LSA vector (TF-IDF over the
+indexed unigrams, reduced by a randomized truncated SVD), so a question lands near
+opinions sharing its topics even without shared keywords.
+
+Vectors are clustered with spherical k-means into about 4 * sqrt(num_docs) inverted
+lists; a query scores the centroids, then only the vectors of the DENSE_NPROBE closest
+lists. The "hybrid" ranking fuses the dense ranking with the keyword ranking by
+reciprocal rank fusion (fuse()).
+
+Dense index directory layout (written by scripts/build_dense_index.py):
+    meta.json               format version, byte order, dimensions and counts
+    terms.bin/.idx          UTF-8 terms in sorted order, offset-indexed
+    term_idf.bin            float32 idf per term
+    components.bin          float32 (num_terms, dims) term -> vector projection
+    centroids.bin           float32 (num_lists, dims) unit-length list centroids
+    list_offsets.bin        int64 offsets into the vectors per list (num_lists + 1)
+    vectors.bin             float32 (num_docs, dims) unit-length vectors, grouped by list
+    doc_ids.bin/.idx        document id of each vector, in the same order
+"""
+
+from array import array
+from collections import Counter
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .disk_index import _Column, _map, _write_column
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+RRF_K = 60
+
+
+def _csr_matmul(indptr, cols, vals, matrix, block=1 << 18):
+    """
+    Product of the sparse CSR matrix (indptr, cols, vals) with a dense matrix, about
+    block nonzeros at a time.
+    """
+    rows = len(indptr) - 1
+    out = np.zeros((rows, matrix.shape[1]), dtype=np.float32)
+    start = 0
+    while start < rows:
+        end = int(np.searchsorted(indptr, indptr[start] + block, side="right")) - 1
+        end = min(max(end, start + 1), rows)
+        lo, hi = indptr[start], indptr[end]
+        if lo < hi:
+            products = vals[lo:hi, None] * matrix[cols[lo:hi]]
+            starts = indptr[start:end] - lo
+            filled = indptr[start:end] < indptr[start + 1:end + 1]
+            out[start:end][filled] = np.add.reduceat(products, starts[filled], axis=0)
+        start = end
+    return out
+
+
+def _orthonormal(matrix):
+    return np.linalg.qr(matrix)[0].astype(np.float32)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def randomized_svd(csr, csc, num_cols, dims, oversample=10, iterations=4, seed=0):
+    """
+    The top dims right singular vectors of a sparse matrix (Halko et al. range finder).
+
+    Args:
+        csr (tuple): (indptr, cols, vals) of the matrix
+        csc (tuple): (indptr, rows, vals) of the matrix, i.e. the CSR of its transpose
+        num_cols (int): Number of columns
+        dims (int): Number of singular vectors
+
+    Returns:
+        numpy.ndarray: float32 (num_cols, dims)
+    """
+    rng = np.random.default_rng(seed)
+    width = min(dims + oversample, num_cols, len(csr[0]) - 1)
+    sketch = rng.standard_normal((num_cols, width)).astype(np.float32)
+    basis = _orthonormal(_csr_matmul(*csr, sketch))
+    for _ in range(iterations):
+        basis = _orthonormal(_csr_matmul(*csr, _orthonormal(_csr_matmul(*csc, basis))))
+    projected = _csr_matmul(*csc, basis).T         # basis^T X, (dims + oversample, num_cols)
+    _, _, vt = np.linalg.svd(projected, full_matrices=False)
+    return np.ascontiguousarray(vt[:dims].T, dtype=np.float32)
+
+
+def spherical_kmeans(vectors, num_lists, iterations=10, sample=None, seed=0, block=65536):
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Returns:
+        tuple: (float32 unit centroids (num_lists, dims), list number of every vector)
+    """
+    rng = np.random.default_rng(seed)
+    training = vectors
+    if sample and len(vectors) > sample:
+        training = vectors[rng.choice(len(vectors), sample, replace=False)]
+    centroids = training[rng.choice(len(training), num_lists, replace=False)].copy()
+
+    def assign(data):
+        labels = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), block):
+            labels[start:start + block] = np.argmax(data[start:start + block] @ centroids.T, axis=1)
+        return labels
+
+    for _ in range(iterations):
+        labels = assign(training)
+        # Per-list sums as the product of the (list x vector) assignment matrix
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=num_lists))))
+        members = np.argsort(labels, kind="stable")
+        sums = _csr_matmul(indptr, members, np.ones(len(members), dtype=np.float32), training)
+        empty = ~sums.any(axis=1)
+        # Restart empty lists from random vectors
+        sums[empty] = training[rng.choice(len(training), int(empty.sum()))]
+        centroids = _normalize(sums).astype(np.float32)
+    return centroids, assign(vectors)
+
+
+def build(out_dir, doc_ids, postings, dims=128, min_df=2, max_df=0.5, max_terms=50000, seed=0):
+    """
+    Build a dense index directory.
+
+    Args:
+        out_dir (str): Destination directory (written next to it and renamed into place)
+        doc_ids (list): Ids of the documents to embed
+        postings (iterable): (word, doc id, count) unigram postings
+        dims (int): Vector dimensions
+        min_df (int): Ignore words in fewer documents
+        max_df (float): Ignore words in a larger fraction of the documents
+        max_terms (int): Keep at most this many words, the most frequent first
+        seed (int): Seed of the random projections and clustering
+
+    Returns:
+        dict: The meta.json contents
+    """
+    docnos = {doc_id: docno for docno, doc_id in enumerate(doc_ids)}
+    num_docs = len(doc_ids)
+    words = {}
+    rows, cols, counts = array('i'), array('i'), array('f')
+    for word, doc_id, count in postings:
+        docno = docnos.get(doc_id)
+        if docno is None:
+            continue
+        rows.append(docno)
+        cols.append(words.setdefault(word, len(words)))
+        counts.append(count)
+    rows = np.frombuffer(rows, dtype=np.int32).astype(np.int64)
+    cols = np.frombuffer(cols, dtype=np.int32).astype(np.int64)
+    counts = np.frombuffer(counts, dtype=np.float32)
+
+    df = np.bincount(cols, minlength=len(words))
+    eligible = np.flatnonzero((df >= min_df) & (df <= max_df * num_docs))
+    eligible = eligible[np.argsort(-df[eligible], kind="stable")[:max_terms]]
+    names = np.array(list(words), dtype=object)
+    terms = sorted(names[eligible])
+    term_numbers = np.full(len(words), -1, dtype=np.int64)
+    term_numbers[[words[term] for term in terms]] = np.arange(len(terms))
+    idf = (np.log((1 + num_docs) / (1 + df[[words[term] for term in terms]])) + 1).astype(np.float32)
+
+    # Sublinear tf-idf, rows normalised to unit length
+    cols = term_numbers[cols]
+    kept = cols >= 0
+    rows, cols = rows[kept], cols[kept]
+    vals = (1 + np.log(counts[kept])) * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=vals.astype(np.float64) ** 2, minlength=num_docs))
+    vals = (vals / np.where(norms > 0, norms, 1)[rows]).astype(np.float32)
+
+    by_row = np.lexsort((cols, rows))
+    csr = (np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=num_docs)))), cols[by_row], vals[by_row])
+    by_col = np.lexsort((rows, cols))
+    csc = (np.concatenate(([0], np.cumsum(np.bincount(cols, minlength=len(terms))))), rows[by_col], vals[by_col])
+    dims = min(dims, len(terms), num_docs)
+
+    components = randomized_svd(csr, csc, len(terms), dims, seed=seed)
+    vectors = _normalize(_csr_matmul(*csr, components)).astype(np.float32)
+    num_lists = max(1, min(num_docs, int(4 * math.sqrt(num_docs))))
+    centroids, labels = spherical_kmeans(vectors, num_lists, sample=max(50 * num_lists, 10000), seed=seed)
+    order = np.argsort(labels, kind="stable")
+    list_offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=num_lists)))).astype(np.int64)
+
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    _write_column(tmp_dir, "terms", terms)
+    for name, data in (("term_idf", idf), ("components", components), ("centroids", centroids),
+                       ("list_offsets", list_offsets), ("vectors", vectors[order])):
+        np.ascontiguousarray(data).tofile(os.path.join(tmp_dir, f"{name}.bin"))
+    _write_column(tmp_dir, "doc_ids", (doc_ids[docno] for docno in order))
+    meta = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "dims": dims,
+        "num_terms": len(terms),
+        "num_docs": num_docs,
+        "num_lists": num_lists,
+        "created": time.time()
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(out_dir):
+        old_dir = f"{out_dir}.old-{os.getpid()}"
+        os.rename(out_dir, old_dir)
+        os.rename(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.rename(tmp_dir, out_dir)
+    return meta
+
+
+def build_from_json(data_dir, out_dir, **options):
+    """
+    Build a dense index from the document_entities.json / keyword_postings.json written by
+    scripts/process_opinions.py (documents with an entity, unigram postings).
+    """
+    doc_ids = []
+    with open(os.path.join(data_dir, "document_entities.json")) as f:
+        for line in f:
+            if line.strip():
+                entity = json.loads(line)
+                if entity.get("url") is not None:
+                    doc_ids.append(entity["id"])
+
+    def postings():
+        with open(os.path.join(data_dir, "keyword_postings.json")) as f:
+            for line in f:
+                if line.strip():
+                    posting = json.loads(line)
+                    if " " not in posting["keyword"]:
+                        yield posting["keyword"], posting["id"], posting["count"]
+
+    return build(out_dir, doc_ids, postings(), **options)
+
+
+class DenseIndex:
+    """
+    Read-only view over a dense index directory.
+    """
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported dense index format version {self.meta['version']} in {index_dir}")
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"Dense index {index_dir} was written on a {self.meta['byteorder']}-endian host")
+        dims = self.meta["dims"]
+
+        def matrix(name, dtype=np.float32, width=dims):
+            data = np.frombuffer(_map(os.path.join(index_dir, f"{name}.bin")), dtype=dtype)
+            return data.reshape(-1, width) if width else data
+
+        self.terms = _Column(index_dir, "terms")
+        self.term_idf = matrix("term_idf", width=None)
+        self.components = matrix("components")
+        self.centroids = matrix("centroids")
+        self.list_offsets = matrix("list_offsets", np.int64, None)
+        self.vectors = matrix("vectors")
+        self.doc_ids = _Column(index_dir, "doc_ids")
+
+    def __len__(self):
+        return self.meta["num_docs"]
+
+    def term_number(self, word):
+        key = word.encode('utf-8')
+        lo, hi = 0, len(self.terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.terms.raw(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.terms) and self.terms.raw(lo) == key:
+            return lo
+        return None
+
+    def embed(self, words):
+        """
+        Unit query vector of a bag of words (folded in like a document), or None.
+        """
+        numbers, weights = [], []
+        for word, count in Counter(words).items():
+            number = self.term_number(word)
+            if number is not None:
+                numbers.append(number)
+                weights.append((1 + math.log(count)) * self.term_idf[number])
+        if not numbers:
+            return None
+        vector = np.asarray(weights, dtype=np.float32) @ self.components[numbers]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def search(self, words, k, nprobe):
+        """
+        Return up to k (doc id, cosine similarity) pairs nearest to the words, best first.
+        """
+        vector = self.embed(words)
+        if vector is None:
+            return []
+        similarities = self.centroids @ vector
+        if nprobe < len(similarities):
+            probes = np.argpartition(-similarities, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(len(similarities))
+        positions = np.concatenate([np.arange(self.list_offsets[p], self.list_offsets[p + 1]) for p in probes])
+        if not len(positions):
+            return []
+        scores = self.vectors[positions] @ vector
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+        else:
+            top = np.argsort(-scores, kind="stable")
+        return [(self.doc_ids[int(positions[i])], float(scores[i])) for i in top]
+
+
+def fuse(keyword_results, dense_hits, k=RRF_K):
+    """
+    Reciprocal rank fusion of a keyword ranking and a dense ranking.
+
+    Every document scores sum(1 / (k + rank)) over the rankings it appears in. Keyword
+    result entries keep their fields; documents found only by the dense index get no
+    matched keywords.
+
+    Returns:
+        list: Result entries with the fused score under "score", best first
+    """
+    scores = {}
+    entries = {}
+    for rank, result in enumerate(keyword_results, 1):
+        scores[result["docId"]] = 1 / (k + rank)
+        entries[result["docId"]] = result
+    for rank, (doc_id, _) in enumerate(dense_hits, 1):
+        scores[doc_id] = scores.get(doc_id, 0) + 1 / (k + rank)
+    fused = []
+    for doc_id in sorted(scores, key=scores.get, reverse=True):
+        entry = dict(entries.get(doc_id) or {
+            "docId": doc_id, "distinctMatches": 0, "totalScore": 0, "matchedKeywords": []
+        })
+        entry.pop("bm25", None)
+        entry["score"] = scores[doc_id]
+        fused.append(entry)
+    return fused
+
+
+_dense = None
+_dense_lock = threading.Lock()
+_loaded = False
+
+
+def get_dense_index():
+    """
+    Map the dense index at DENSE_INDEX_DIR on first use; None when it is not configured.
+    """
+    global _dense, _loaded
+    from django.conf import settings
+    if _loaded:
+        return _dense
+    with _dense_lock:
+        if not _loaded and settings.DENSE_INDEX_DIR:
+            try:
+                _dense = DenseIndex(settings.DENSE_INDEX_DIR)
+                logger.info(f"Mapped dense index at {settings.DENSE_INDEX_DIR}: {len(_dense):,} documents, "
+                            f"{_dense.meta['dims']} dimensions, {_dense.meta['num_lists']:,} lists")
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to map dense index at {settings.DENSE_INDEX_DIR}: {e}")
+        _loaded = True
+    return _dense
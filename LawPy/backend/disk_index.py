@@ -0,0 +1,433 @@
+"""
+Binary on-disk inverted index that Django workers memory-map read-only.
+
+Written by scripts/process_opinions.py (--binary-index) from the same postings it
+writes as JSON lines. All workers on a host share one page-cache copy of the files,
+and opening the index only maps them, so a cold worker is ready in milliseconds.
+
+Index directory layout (all integers in the byte order recorded in meta.json):
+    meta.json           format version, byte order and counts
+    terms.bin           UTF-8 terms concatenated in sorted order
+    terms.idx           uint64 offsets into terms.bin (num_terms + 1)
+    term_stats.bin      int32 (document frequency, max count) per term
+    term_idf.bin        float64 BM25 idf per term
+    postings.idx        uint64 offsets into postings.bin (num_terms + 1)
+    postings.bin        per term: varint doc number deltas, then varint counts
+    doc_ids.bin/.idx    document id strings, offset-indexed like terms
+    doc_id_order.bin    int32 document numbers sorted by document id (id -> number lookup)
+    doc_id_keys.bin     the sorted document ids NUL-padded to the longest one, for
+                        vectorised membership tests (DocumentTable.contains)
+    urls.bin/.idx       document urls
+    titles.bin/.idx     document titles
+    doc_lengths.bin     int32 token count per document (BM25 length normalisation)
+    positions.idx       uint64 offsets into positions.bin (num_terms + 1), when meta
+                        "positions" is set
+    positions.bin       per word: varint position counts per posting, then varint
+                        position deltas (restarting at each document); empty for n-grams
+"""
+
+from array import array
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from .search_engine import BaseIndex, load_from_json
+
+FORMAT_VERSION = 3
+
+
+def encode_varints(values, out):
+    """
+    Append values (non-negative ints) to the bytearray out as LEB128 varints.
+    """
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def decode_varints(buf):
+    """
+    Decode every varint in buf at once.
+
+    Returns:
+        numpy.ndarray: int64 values
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # Position of each byte within its varint gives its 7-bit shift
+    shifts = np.arange(len(data), dtype=np.int64) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.int64) << (7 * shifts)
+    return np.add.reduceat(parts, starts)
+
+
+def _write_column(out_dir, name, strings):
+    offsets = array('Q', [0])
+    with open(os.path.join(out_dir, f"{name}.bin"), 'wb') as f:
+        position = 0
+        for value in strings:
+            data = value.encode('utf-8')
+            f.write(data)
+            position += len(data)
+            offsets.append(position)
+    with open(os.path.join(out_dir, f"{name}.idx"), 'wb') as f:
+        offsets.tofile(f)
+
+
+def write_documents(out_dir, doc_ids, urls, titles):
+    """
+    Write the document columns (ids, urls, titles and the id -> number lookup order).
+
+    Args:
+        out_dir (str): Directory to write into
+        doc_ids (list): Document id per dense document number
+        urls (iterable): Url per document number
+        titles (iterable): Title per document number
+    """
+    _write_column(out_dir, "doc_ids", doc_ids)
+    # Sorted on the UTF-8 bytes, the order DocumentTable.docno compares in
+    keys = [doc_id.encode('utf-8') for doc_id in doc_ids]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    with open(os.path.join(out_dir, "doc_id_order.bin"), 'wb') as f:
+        array('i', order).tofile(f)
+    width = max(map(len, keys), default=1)
+    np.array([keys[docno] for docno in order], dtype=f"S{width}").tofile(os.path.join(out_dir, "doc_id_keys.bin"))
+    _write_column(out_dir, "urls", urls)
+    _write_column(out_dir, "titles", titles)
+
+
+def write_index(index, out_dir):
+    """
+    Write an InMemoryIndex as a binary index directory.
+
+    The directory is written next to out_dir and renamed into place, so readers
+    never see a partially written index.
+
+    Args:
+        index (InMemoryIndex): Finalized index to write
+        out_dir (str): Destination directory
+    """
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # Documents without an entity never appear in results, so leave them out and
+    # renumber the rest; the mapping is monotonic so postings stay sorted
+    remap = {}
+    kept = []
+    for docno in range(len(index)):
+        if index.urls[docno] is not None:
+            remap[docno] = len(kept)
+            kept.append(docno)
+
+    terms = sorted(index.terms)
+    term_stats = array('i')
+    term_idf = array('d')
+    postings_offsets = array('Q', [0])
+    if index.has_positions:
+        _write_positions(index, tmp_dir, terms, remap)
+    with open(os.path.join(tmp_dir, "postings.bin"), 'wb') as f:
+        position = 0
+        for term in terms:
+            docs, counts = index.postings(term)
+            new_docs = []
+            new_counts = []
+            for docno, count in zip(docs, counts):
+                if docno in remap:
+                    new_docs.append(remap[docno])
+                    new_counts.append(count)
+            block = bytearray()
+            previous = 0
+            deltas = []
+            for docno in new_docs:
+                deltas.append(docno - previous)
+                previous = docno
+            encode_varints(deltas, block)
+            encode_varints(new_counts, block)
+            f.write(block)
+            position += len(block)
+            postings_offsets.append(position)
+            term_stats.append(len(new_docs))
+            term_stats.append(max(new_counts, default=0))
+            term_idf.append(index.idf(term))
+    with open(os.path.join(tmp_dir, "postings.idx"), 'wb') as f:
+        postings_offsets.tofile(f)
+    with open(os.path.join(tmp_dir, "term_stats.bin"), 'wb') as f:
+        term_stats.tofile(f)
+    with open(os.path.join(tmp_dir, "term_idf.bin"), 'wb') as f:
+        term_idf.tofile(f)
+    with open(os.path.join(tmp_dir, "doc_lengths.bin"), 'wb') as f:
+        array('i', (index.doc_lengths[docno] for docno in kept)).tofile(f)
+
+    _write_column(tmp_dir, "terms", terms)
+    write_documents(
+        tmp_dir,
+        [index.doc_ids[docno] for docno in kept],
+        (index.urls[docno] for docno in kept),
+        (index.titles[docno] for docno in kept)
+    )
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "num_terms": len(terms),
+        "num_docs": len(kept),
+        "num_postings": sum(term_stats[0::2]),
+        "avg_doc_length": index.avg_doc_length,
+        "positions": index.has_positions,
+        "created": time.time()
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(out_dir):
+        old_dir = f"{out_dir}.old-{os.getpid()}"
+        os.rename(out_dir, old_dir)
+        os.rename(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.rename(tmp_dir, out_dir)
+    return meta
+
+
+def _write_positions(index, out_dir, terms, remap):
+    offsets = array('Q', [0])
+    with open(os.path.join(out_dir, "positions.bin"), 'wb') as f:
+        position = 0
+        for term in terms:
+            number = index.terms[term]
+            start, end = index.term_offsets[number], index.term_offsets[number + 1]
+            block = bytearray()
+            if index.position_offsets[start] != index.position_offsets[end]:
+                sizes = []
+                deltas = []
+                for p in range(start, end):
+                    if index.postings_docs[p] not in remap:
+                        continue
+                    positions = index.positions_data[index.position_offsets[p]:index.position_offsets[p + 1]]
+                    sizes.append(len(positions))
+                    previous = 0
+                    for value in positions:
+                        deltas.append(value - previous)
+                        previous = value
+                encode_varints(sizes, block)
+                encode_varints(deltas, block)
+            f.write(block)
+            position += len(block)
+            offsets.append(position)
+    with open(os.path.join(out_dir, "positions.idx"), 'wb') as f:
+        offsets.tofile(f)
+
+
+def build_from_json(data_dir, out_dir):
+    """
+    Build a binary index directory from keyword_postings.json / document_entities.json.
+    """
+    return write_index(load_from_json(data_dir), out_dir)
+
+
+class _Column:
+    """
+    Offset-indexed UTF-8 strings backed by two memory-mapped files.
+    """
+
+    def __init__(self, index_dir, name):
+        self.data = _map(os.path.join(index_dir, f"{name}.bin"))
+        self.offsets = memoryview(_map(os.path.join(index_dir, f"{name}.idx"))).cast('Q')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i):
+        return self.raw(i).decode('utf-8')
+
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class DocumentTable:
+    """
+    Memory-mapped document columns: dense document number -> (doc id, url, title), and
+    doc id -> document number by binary search over the sorted id order.
+    """
+
+    def __init__(self, table_dir):
+        self.doc_ids = _Column(table_dir, "doc_ids")
+        self.doc_id_order = memoryview(_map(os.path.join(table_dir, "doc_id_order.bin"))).cast('i')
+        self.urls = _Column(table_dir, "urls")
+        self.titles = _Column(table_dir, "titles")
+        # Absent from tables written before it was added; contains() then looks ids up one by one
+        keys_path = os.path.join(table_dir, "doc_id_keys.bin")
+        self.doc_id_keys = None
+        if len(self.doc_ids) and os.path.exists(keys_path):
+            width = os.path.getsize(keys_path) // len(self.doc_ids)
+            self.doc_id_keys = np.frombuffer(_map(keys_path), dtype=f"S{width}")
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def doc_id(self, docno):
+        return self.doc_ids[docno]
+
+    def document(self, docno):
+        return self.doc_ids[docno], self.urls[docno], self.titles[docno]
+
+    def docno(self, doc_id):
+        """
+        Return the document number of a document id, or None if it is not in the table.
+        """
+        key = doc_id.encode('utf-8')
+        lo, hi = 0, len(self.doc_id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.doc_ids.raw(self.doc_id_order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.doc_id_order) and self.doc_ids.raw(self.doc_id_order[lo]) == key:
+            return self.doc_id_order[lo]
+        return None
+
+    def contains(self, doc_ids):
+        """
+        Return a boolean array telling which of the document ids are in the table.
+        """
+        if self.doc_id_keys is None:
+            return np.array([self.docno(doc_id) is not None for doc_id in doc_ids], dtype=bool)
+        keys = [doc_id.encode('utf-8') for doc_id in doc_ids]
+        width = self.doc_id_keys.dtype.itemsize
+        # Longer ids cannot be in the table, and NumPy would truncate them to a stored one
+        fits = np.array([len(key) <= width for key in keys], dtype=bool)
+        wanted = np.array(keys, dtype=f"S{width}") if keys else np.zeros(0, dtype=f"S{width}")
+        slots = np.minimum(np.searchsorted(self.doc_id_keys, wanted), len(self.doc_id_keys) - 1)
+        return fits & (self.doc_id_keys[slots] == wanted)
+
+
+class DiskIndex(BaseIndex):
+    """
+    Read-only view over a binary index directory.
+
+    Nothing is decoded up front: term lookup is a binary search over the mapped term
+    dictionary and a term's postings are decoded only when it is queried.
+    """
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version {self.meta['version']} in {index_dir}")
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"Index {index_dir} was written on a {self.meta['byteorder']}-endian host")
+        self.index_dir = index_dir
+        self.terms = _Column(index_dir, "terms")
+        self.term_stats = memoryview(_map(os.path.join(index_dir, "term_stats.bin"))).cast('i')
+        self.postings_offsets = memoryview(_map(os.path.join(index_dir, "postings.idx"))).cast('Q')
+        self.postings_data = _map(os.path.join(index_dir, "postings.bin"))
+        self.term_idf = memoryview(_map(os.path.join(index_dir, "term_idf.bin"))).cast('d')
+        self.doc_lengths = memoryview(_map(os.path.join(index_dir, "doc_lengths.bin"))).cast('i')
+        self.num_docs = self.meta["num_docs"]
+        self.avg_doc_length = self.meta["avg_doc_length"]
+        self.documents = DocumentTable(index_dir)
+        self.has_positions = self.meta.get("positions", False)
+        if self.has_positions:
+            self.positions_offsets = memoryview(_map(os.path.join(index_dir, "positions.idx"))).cast('Q')
+            self.positions_data = _map(os.path.join(index_dir, "positions.bin"))
+
+    def __len__(self):
+        return self.meta["num_docs"]
+
+    def term_number(self, keyword):
+        """
+        Return the term number of keyword, or None if it is not in the dictionary.
+        """
+        key = keyword.encode('utf-8')
+        lo, hi = 0, len(self.terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.terms.raw(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.terms) and self.terms.raw(lo) == key:
+            return lo
+        return None
+
+    def __contains__(self, keyword):
+        return self.term_number(keyword) is not None
+
+    def postings(self, keyword):
+        term = self.term_number(keyword)
+        if term is None:
+            return None
+        return self.decode_postings(term)
+
+    def decode_postings(self, term):
+        """
+        Return (doc numbers, counts) of a term number, e.g. to copy every term in order.
+        """
+        df = self.term_stats[2 * term]
+        start = self.postings_offsets[term]
+        values = decode_varints(self.postings_data[start:self.postings_offsets[term + 1]])
+        docs = array('q', np.cumsum(values[:df]).tobytes())
+        counts = array('q', values[df:].tobytes())
+        return docs, counts
+
+    def term_positions(self, keyword):
+        term = self.term_number(keyword) if self.has_positions else None
+        if term is None:
+            return None
+        return self.decode_positions(term)
+
+    def decode_positions(self, term):
+        """
+        Return (doc numbers, counts, positions) of a term number, or None without positions.
+        """
+        start, end = self.positions_offsets[term], self.positions_offsets[term + 1]
+        if start == end:
+            return None
+        df = self.term_stats[2 * term]
+        values = decode_varints(self.positions_data[start:end])
+        counts = values[:df]
+        # Deltas restart at each document: subtract the running sum where its document starts
+        running = np.cumsum(values[df:])
+        bases = np.concatenate(([0], running))[np.cumsum(counts) - counts]
+        positions = running - np.repeat(bases, counts)
+        docs = np.frombuffer(self.decode_postings(term)[0], dtype=np.int64)
+        return docs, counts, positions
+
+    def max_count(self, keyword):
+        return self.term_stats[2 * self.term_number(keyword) + 1]
+
+    def document_frequency(self, keyword):
+        term = self.term_number(keyword)
+        return 0 if term is None else self.term_stats[2 * term]
+
+    def idf(self, keyword):
+        return self.term_idf[self.term_number(keyword)]
+
+    def doc_id(self, docno):
+        return self.documents.doc_id(docno)
+
+    def document(self, docno):
+        return self.documents.document(docno)
+
+    def docno(self, doc_id):
+        return self.documents.docno(doc_id)
@@ -0,0 +1,218 @@
+"""
+Host-wide document metadata table (document_entities as memory-mapped columns).
+
+The table is a directory of versions, each holding the DocumentTable columns written by
+disk_index.write_documents (dense document numbers, offset-indexed UTF-8 ids, urls and
+titles, and the sorted id order for lookups), plus a CURRENT file naming the active
+version:
+
+    <DOCUMENT_TABLE_DIR>/CURRENT
+    <DOCUMENT_TABLE_DIR>/<version>/meta.json, doc_ids.bin/.idx, urls.bin/.idx, ...
+
+Every worker maps the current version read-only, so the host keeps one page-cache copy.
+Publishing a new version (scripts/process_opinions.py --document-table, or the first
+worker to start when none exists) writes it under a new name and then replaces CURRENT
+atomically; workers notice within DOCUMENT_TABLE_REFRESH seconds and remap, without a
+restart.
+
+With incremental indexing (scripts/index_opinions.py --segments --document-table) the
+version only points at the segment directory, {"segments": <root>} in its meta.json, and
+workers look documents up in the live segments of its current generation, so an indexing
+run does not rewrite the table.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from .disk_index import DocumentTable, write_documents
+
+logger = logging.getLogger(__name__)
+
+_CURRENT = "CURRENT"
+_BUILD_LOCK = ".building"
+_BUILD_LOCK_TIMEOUT = 60 * 60
+
+
+def publish(table_dir, entities):
+    """
+    Write a new table version from entity dicts and make it current.
+
+    Args:
+        table_dir (str): Table directory
+        entities (iterable): Dicts with id, url and title; entities without a url are skipped
+
+    Returns:
+        str: The published version name
+    """
+    doc_ids, urls, titles = [], [], []
+    for entity in entities:
+        if entity.get("url") is None:
+            continue
+        doc_ids.append(entity["id"])
+        urls.append(entity["url"])
+        titles.append(entity.get("title") or "")
+
+    def write(tmp_dir):
+        write_documents(tmp_dir, doc_ids, urls, titles)
+    return _publish(table_dir, {"num_docs": len(doc_ids)}, write)
+
+
+def publish_segments(table_dir, root):
+    """
+    Make the table follow the live documents of a segment directory (backend/segments.py).
+
+    Returns:
+        str: The current version name (unchanged when it already follows root)
+    """
+    root = os.path.abspath(root)
+    version = current_version(table_dir)
+    if version is not None and _read_meta(table_dir, version).get("segments") == root:
+        return version
+    return _publish(table_dir, {"segments": root}, lambda tmp_dir: None)
+
+
+def _read_meta(table_dir, version):
+    with open(os.path.join(table_dir, version, "meta.json")) as f:
+        return json.load(f)
+
+
+def _publish(table_dir, meta, write):
+    os.makedirs(table_dir, exist_ok=True)
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+    tmp_dir = os.path.join(table_dir, f"{version}.tmp")
+    os.makedirs(tmp_dir)
+    write(tmp_dir)
+    with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+        json.dump({**meta, "created": time.time()}, f)
+    os.rename(tmp_dir, os.path.join(table_dir, version))
+
+    current_tmp = os.path.join(table_dir, f"{_CURRENT}.tmp-{os.getpid()}")
+    with open(current_tmp, 'w') as f:
+        f.write(version)
+    previous = current_version(table_dir)
+    os.replace(current_tmp, os.path.join(table_dir, _CURRENT))
+
+    # Keep the previous version for workers that have not remapped yet; mapped files
+    # of older ones stay readable after removal until those workers remap
+    for name in os.listdir(table_dir):
+        path = os.path.join(table_dir, name)
+        if os.path.isdir(path) and name not in (version, previous) and not name.endswith(".tmp"):
+            shutil.rmtree(path, ignore_errors=True)
+    return version
+
+
+def publish_from_json(table_dir, data_dir):
+    """
+    Publish the table from the document_entities.json written by scripts/process_opinions.py.
+    """
+    def entities():
+        with open(os.path.join(data_dir, "document_entities.json")) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return publish(table_dir, entities())
+
+
+def publish_from_mongodb(table_dir, db):
+    return publish(table_dir, db["document_entities"].find({}, {"id": 1, "url": 1, "title": 1, "_id": 0}))
+
+
+def current_version(table_dir):
+    try:
+        with open(os.path.join(table_dir, _CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+_table = None
+_segments_root = None
+_version = None
+_checked = None    # time.monotonic() of the last CURRENT check; None before the first
+_lock = threading.Lock()
+
+
+def get_table():
+    """
+    Return this process's DocumentTable, remapping when a new version was published, or
+    the SegmentedIndex of the segment directory the current version follows.
+
+    Returns None when DOCUMENT_TABLE_DIR is not set or no version exists yet.
+    """
+    from django.conf import settings
+    table_dir = settings.DOCUMENT_TABLE_DIR
+    if not table_dir:
+        return None
+    now = time.monotonic()
+    if _checked is None or now - _checked >= settings.DOCUMENT_TABLE_REFRESH:
+        with _lock:
+            if _checked is None or now - _checked >= settings.DOCUMENT_TABLE_REFRESH:
+                _remap(table_dir, now)
+    if _segments_root is not None:
+        from . import segments
+        return segments.get_index(_segments_root)
+    return _table
+
+
+def _remap(table_dir, now):
+    global _table, _segments_root, _version, _checked
+    _checked = now
+    version = current_version(table_dir)
+    if version is None or version == _version:
+        return
+    try:
+        root = _read_meta(table_dir, version).get("segments")
+        if root is None:
+            _table, _segments_root = DocumentTable(os.path.join(table_dir, version)), None
+            logger.info(f"Mapped document table {version}: {len(_table):,} documents")
+        else:
+            _table, _segments_root = None, root
+            logger.info(f"Document table {version} follows the segments in {root}")
+        _version = version
+    except OSError as e:
+        logger.error(f"Failed to map document table {version}: {e}")
+
+
+def table_version():
+    return _version
+
+
+def _build(table_dir):
+    lock_path = os.path.join(table_dir, _BUILD_LOCK)
+    try:
+        os.makedirs(table_dir, exist_ok=True)
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        # Another worker on this host is building it, unless its lock is left over from a crash
+        if time.time() - os.path.getmtime(lock_path) > _BUILD_LOCK_TIMEOUT:
+            os.remove(lock_path)
+            _build(table_dir)
+        return
+    try:
+        from .mongo import get_database
+        started = time.perf_counter()
+        version = publish_from_mongodb(table_dir, get_database())
+        logger.info(f"Built document table {version} from MongoDB in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        logger.error(f"Failed to build document table: {e}")
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+def start():
+    """
+    Map the current table, or build the first version from MongoDB in the background.
+    """
+    from django.conf import settings
+    table_dir = settings.DOCUMENT_TABLE_DIR
+    if not table_dir:
+        return
+    if current_version(table_dir) is None:
+        threading.Thread(target=_build, args=(table_dir,), name="document-table-builder", daemon=True).start()
+    else:
+        get_table()
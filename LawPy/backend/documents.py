@@ -0,0 +1,125 @@
+"""
+Document metadata (url, title) for the results page being shown.
+
+Rankings carry document ids only. paginated_results looks up the ten or so documents
+on the requested page here: first in a bounded per-process LRU, then in the loaded
+search index or the host's document table (backend/doc_table.py), and finally in
+document_entities with one $in query for the rest.
+Documents without an entity are remembered too, so they are not queried again.
+With a text store (backend/text_store.py), items also get a highlighted snippet.
+"""
+
+from collections import OrderedDict
+import threading
+
+from django.conf import settings
+
+from . import doc_table, mongo, search_engine, text_store, timing
+
+_MISSING = ()
+_cache = OrderedDict()  # document id -> (url, title), or _MISSING if no entity exists
+_lock = threading.Lock()
+_stats = {"hits": 0, "index_lookups": 0, "table_lookups": 0, "mongo_lookups": 0}
+
+
+def _remember(found):
+    with _lock:
+        for doc_id, value in found.items():
+            _cache[doc_id] = value
+            _cache.move_to_end(doc_id)
+        while len(_cache) > settings.DOCUMENT_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def get_documents(doc_ids):
+    """
+    Look up url and title for a page of document ids.
+
+    Args:
+        doc_ids (list): Document ids
+
+    Returns:
+        dict: Document id -> (url, title) for the ids that have an entity
+    """
+    found = {}
+    missing = []
+    with _lock:
+        for doc_id in doc_ids:
+            value = _cache.get(doc_id)
+            if value is None:
+                missing.append(doc_id)
+            else:
+                _cache.move_to_end(doc_id)
+                found[doc_id] = value
+        _stats["hits"] += len(found)
+
+    looked_up = {}
+    for source, table in (("index_lookups", search_engine.get_index()), ("table_lookups", doc_table.get_table())):
+        if table is None or not missing:
+            continue
+        rest = []
+        for doc_id in missing:
+            docno = table.docno(doc_id)
+            if docno is None:
+                rest.append(doc_id)
+            else:
+                _, url, title = table.document(docno)
+                looked_up[doc_id] = (url, title)
+        with _lock:
+            _stats[source] += len(missing) - len(rest)
+        missing = rest
+    if missing:
+        looked_up.update((doc_id, _MISSING) for doc_id in missing)
+        with timing.stage("entity_lookup"):
+            entities = mongo.document_entities().find(
+                {"id": {"$in": missing}},
+                {"id": 1, "url": 1, "title": 1, "_id": 0}
+            )
+            for doc in entities:
+                looked_up[doc["id"]] = (doc["url"], doc.get("title", ""))
+        with _lock:
+            _stats["mongo_lookups"] += len(missing)
+
+    _remember(looked_up)
+    found.update(looked_up)
+    return {doc_id: value for doc_id, value in found.items() if value is not _MISSING}
+
+
+def hydrate(entries):
+    """
+    Turn ranked entries into the items shown to the client (title, url, matchedKeywords,
+    and snippet when a text store is configured).
+
+    Entries whose document has no entity are left out.
+    """
+    documents = get_documents([entry["docId"] for entry in entries])
+    items = []
+    shown = []
+    for entry in entries:
+        document = documents.get(entry["docId"])
+        if document is not None:
+            items.append({
+                "title": document[1],
+                "url": document[0],
+                "matchedKeywords": entry["matchedKeywords"]
+            })
+            shown.append(entry)
+
+    store = text_store.get_text_store()
+    if store is not None and items:
+        with timing.stage("snippets"):
+            for item, entry in zip(items, shown):
+                text = store.text(entry["docId"])
+                if text is not None:
+                    item["snippet"] = text_store.snippet(text, entry["matchedKeywords"], settings.SNIPPET_LENGTH)
+    return items
+
+
+def cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_cache)
+    stats["max_entries"] = settings.DOCUMENT_CACHE_SIZE
+    stats["table_version"] = doc_table.table_version()
+    return stats
+
@@ -0,0 +1,522 @@
+"""
+Keyword extraction for SubmitQuery.
+
+The OpenAI call that turns a question into search keywords is cached on a normalised
+form of the question, first in a small per-process LRU and then in the cache shared
+by all workers, and concurrent identical questions are coalesced so only one of them
+calls the LLM. KEYWORD_EXTRACTOR selects the LLM, the offline vocabulary matcher
+(backend/offline_keywords.py), or the LLM with the offline matcher as fallback.
+
+Coalescing across workers and the all-worker counters rely on an atomic add and incr,
+which Redis provides. The file-based shared cache implements both as a read followed by
+a write, so with it lock files and per-worker counter files are used instead.
+"""
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from asgiref.sync import sync_to_async
+from openai import AsyncOpenAI, OpenAI
+
+from . import offline_keywords, timing
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """
+    Fold case, punctuation and whitespace so equivalent questions share a cache entry.
+    """
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+def _messages(query):
+    prompt = f"""Role: You are a case-law search engine assistant.
+
+        Task: From the user's question, extract 5-10 key legal search terms.
+
+        Requirements:
+        - Return ONLY a JSON array of lowercase keywords
+        - No explanations or other text
+        - Each term should be specific and useful for legal search
+        - Avoid generic terms like "case" or "law" unless part of a specific phrase
+
+        Input: {query}"""
+
+    return [
+        {"role": "system", "content": "You are a legal keyword extractor. Respond only with a JSON object containing an array of keywords under the 'keywords' key."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _parse_keywords(content):
+    # Parse the JSON response
+    response_data = json.loads(content)
+
+    # Extract keywords from the response
+    if isinstance(response_data, dict) and 'keywords' in response_data:
+        keywords = response_data['keywords']
+    elif isinstance(response_data, list):
+        keywords = response_data
+    else:
+        logger.warning("Unexpected keyword response format; using no keywords")
+        keywords = []
+
+    return list(dict.fromkeys(keywords))  # Remove any duplicates, keep order
+
+
+def extract_keywords_llm(query):
+    """
+    Ask the LLM for 5-10 legal search keywords for the question.
+
+    Returns:
+        list: Keywords (possibly empty if the response had an unexpected format)
+    """
+    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=_messages(query),
+        temperature=0.4  # Lower temperature for more consistent output
+    )
+    return _parse_keywords(response.choices[0].message.content)
+
+
+_async_client = None
+
+
+async def aextract_keywords_llm(query):
+    """
+    Async variant of extract_keywords_llm, sharing one AsyncOpenAI client per process.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    response = await _async_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=_messages(query),
+        temperature=0.4  # Lower temperature for more consistent output
+    )
+    return _parse_keywords(response.choices[0].message.content)
+
+
+class _LocalLRU:
+    """
+    Size-bounded LRU with per-entry expiry, in front of the shared cache.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_local = _LocalLRU(settings.KEYWORD_CACHE_LOCAL_SIZE)
+_flights = {}
+_flights_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "local_hits": 0,
+    "shared_hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "llm_calls": 0,
+    "llm_errors": 0,
+    "llm_seconds": 0.0,
+    "offline": 0,
+    "fallbacks": 0,
+}
+
+_STATS_KEYS = ("shared_hits", "misses", "llm_calls")
+# This process's file of main counters when the shared cache is file-based
+_STATS_FILE = f"{socket.gethostname()}-{os.getpid()}-{time.time_ns()}.json"
+
+
+def _file_dir(shared, name):
+    """
+    Directory for lock or counter files next to a file-based shared cache, else None.
+    """
+    if not isinstance(shared, FileBasedCache):
+        return None
+    return os.path.join(settings.CACHES[settings.KEYWORD_CACHE_ALIAS]['LOCATION'], name)
+
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+        totals = {key: _stats[key] for key in _STATS_KEYS}
+    if name in _STATS_KEYS:
+        # Mirror the main counters in the shared cache so every worker reports the totals
+        shared = caches[settings.KEYWORD_CACHE_ALIAS]
+        stats_dir = _file_dir(shared, "keyword-stats")
+        if stats_dir is not None:
+            # No atomic incr: each worker writes its own totals, cache_stats adds them up
+            os.makedirs(stats_dir, exist_ok=True)
+            tmp_path = os.path.join(stats_dir, f".{_STATS_FILE}.{threading.get_ident()}")
+            with open(tmp_path, 'w') as f:
+                json.dump(totals, f)
+            os.replace(tmp_path, os.path.join(stats_dir, _STATS_FILE))
+            return
+        key = f"keyword_stats:{name}"
+        try:
+            shared.incr(key, value)
+        except ValueError:
+            shared.add(key, value, timeout=None)
+
+
+def _acquire(lock_key):
+    """
+    Take the cross-worker lock on a question; False if another worker holds it.
+    """
+    shared = caches[settings.KEYWORD_CACHE_ALIAS]
+    lock_dir = _file_dir(shared, "keyword-locks")
+    if lock_dir is None:
+        return shared.add(lock_key, 1, timeout=settings.KEYWORD_CACHE_LOCK_TIMEOUT)
+    os.makedirs(lock_dir, exist_ok=True)
+    path = os.path.join(lock_dir, lock_key.replace(":", "-"))
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        # Expires like the cache entry would, e.g. after the holder crashed
+        try:
+            if time.time() - os.path.getmtime(path) > settings.KEYWORD_CACHE_LOCK_TIMEOUT:
+                os.remove(path)
+                return _acquire(lock_key)
+        except FileNotFoundError:
+            return _acquire(lock_key)
+        return False
+
+
+def _held(lock_key):
+    shared = caches[settings.KEYWORD_CACHE_ALIAS]
+    lock_dir = _file_dir(shared, "keyword-locks")
+    if lock_dir is None:
+        return shared.get(lock_key) is not None
+    return os.path.exists(os.path.join(lock_dir, lock_key.replace(":", "-")))
+
+
+def _release(lock_key):
+    shared = caches[settings.KEYWORD_CACHE_ALIAS]
+    lock_dir = _file_dir(shared, "keyword-locks")
+    if lock_dir is None:
+        shared.delete(lock_key)
+        return
+    try:
+        os.remove(os.path.join(lock_dir, lock_key.replace(":", "-")))
+    except FileNotFoundError:
+        pass
+
+
+def _cache_key(normalized):
+    # Hashed so arbitrary question text is a valid key for every cache backend
+    return f"keywords:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()}"
+
+
+def _extract_and_store(query, key):
+    """
+    Call the LLM (unless another worker already did) and store the result.
+    """
+    shared = caches[settings.KEYWORD_CACHE_ALIAS]
+    lock_key = f"{key}:lock"
+    acquired = _acquire(lock_key)
+    if not acquired:
+        # Another worker is asking the LLM the same question; wait for its answer
+        deadline = time.monotonic() + settings.KEYWORD_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            keywords = shared.get(key)
+            if keywords is not None:
+                _count("coalesced")
+                return keywords
+            # Released without an answer (the call failed): take over, unless another waiter did
+            if not _held(lock_key) and _acquire(lock_key):
+                acquired = True
+                keywords = shared.get(key)
+                if keywords is not None:
+                    _release(lock_key)
+                    _count("coalesced")
+                    return keywords
+                break
+
+    try:
+        _count("misses")
+        _count("llm_calls")
+        started = time.perf_counter()
+        try:
+            with timing.stage("llm"):
+                keywords = extract_keywords_llm(query)
+        except Exception:
+            _count("llm_errors")
+            raise
+        finally:
+            _count("llm_seconds", time.perf_counter() - started)
+        if keywords:
+            shared.set(key, keywords, timeout=settings.KEYWORD_CACHE_TTL)
+        return keywords
+    finally:
+        # Only the holder releases: after a timeout the lock may belong to another worker
+        if acquired:
+            _release(lock_key)
+
+
+def extract_keywords(query):
+    """
+    Return the search keywords for a question using the configured extractor.
+
+    Args:
+        query (str): The user's question
+
+    Returns:
+        list: Keywords for the search
+    """
+    mode = settings.KEYWORD_EXTRACTOR
+    if mode == 'offline':
+        _count("offline")
+        return offline_keywords.extract_keywords(query, settings.KEYWORD_EXTRACTOR_MAX)
+
+    try:
+        keywords = llm_keywords(query)
+    except Exception:
+        if mode != 'fallback':
+            raise
+        logger.warning("LLM keyword extraction failed, using offline extractor", exc_info=True)
+        keywords = []
+    if not keywords and mode == 'fallback':
+        _count("fallbacks")
+        keywords = offline_keywords.extract_keywords(query, settings.KEYWORD_EXTRACTOR_MAX)
+    return keywords
+
+
+def llm_keywords(query):
+    """
+    Return the LLM's keywords for a question, calling the LLM only on a cache miss.
+
+    Args:
+        query (str): The user's question
+
+    Returns:
+        list: Keywords for the search
+    """
+    normalized = normalize_query(query)
+    key = _cache_key(normalized)
+
+    keywords = _local.get(key)
+    if keywords is not None:
+        _count("local_hits")
+        return keywords
+
+    keywords = caches[settings.KEYWORD_CACHE_ALIAS].get(key)
+    if keywords is not None:
+        _count("shared_hits")
+        _local.set(key, keywords, settings.KEYWORD_CACHE_TTL)
+        return keywords
+
+    # Single flight within this process: the first caller extracts, the rest wait for it
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        _count("coalesced")
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _extract_and_store(query, key)
+        if flight.result:
+            _local.set(key, flight.result, settings.KEYWORD_CACHE_TTL)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+async def _acount(name, value=1):
+    if name in _STATS_KEYS:
+        await sync_to_async(_count, thread_sensitive=False)(name, value)
+    else:
+        _count(name, value)
+
+
+_async_flights = {}
+
+
+async def aextract_keywords(query):
+    """
+    Async variant of extract_keywords for the ASGI query endpoint.
+    """
+    mode = settings.KEYWORD_EXTRACTOR
+    offline = sync_to_async(offline_keywords.extract_keywords, thread_sensitive=False)
+    if mode == 'offline':
+        _count("offline")
+        return await offline(query, settings.KEYWORD_EXTRACTOR_MAX)
+
+    try:
+        keywords = await allm_keywords(query)
+    except Exception:
+        if mode != 'fallback':
+            raise
+        logger.warning("LLM keyword extraction failed, using offline extractor", exc_info=True)
+        keywords = []
+    if not keywords and mode == 'fallback':
+        _count("fallbacks")
+        keywords = await offline(query, settings.KEYWORD_EXTRACTOR_MAX)
+    return keywords
+
+
+async def allm_keywords(query):
+    """
+    Async variant of llm_keywords: same caches, coalescing on the event loop.
+    """
+    key = _cache_key(normalize_query(query))
+
+    keywords = _local.get(key)
+    if keywords is not None:
+        _count("local_hits")
+        return keywords
+
+    shared = caches[settings.KEYWORD_CACHE_ALIAS]
+    keywords = await shared.aget(key)
+    if keywords is not None:
+        await _acount("shared_hits")
+        _local.set(key, keywords, settings.KEYWORD_CACHE_TTL)
+        return keywords
+
+    flight = _async_flights.get(key)
+    if flight is not None:
+        _count("coalesced")
+        return await asyncio.shield(flight)
+
+    flight = _async_flights[key] = asyncio.get_running_loop().create_future()
+    try:
+        keywords = await _aextract_and_store(query, key)
+        if keywords:
+            _local.set(key, keywords, settings.KEYWORD_CACHE_TTL)
+        flight.set_result(keywords)
+        return keywords
+    except Exception as e:
+        flight.set_exception(e)
+        # Followers re-raise it; mark it retrieved so an unwaited future does not warn
+        flight.exception()
+        raise
+    finally:
+        del _async_flights[key]
+
+
+async def _aextract_and_store(query, key):
+    shared = caches[settings.KEYWORD_CACHE_ALIAS]
+    lock_key = f"{key}:lock"
+    acquire = sync_to_async(_acquire, thread_sensitive=False)
+    release = sync_to_async(_release, thread_sensitive=False)
+    acquired = await acquire(lock_key)
+    if not acquired:
+        deadline = time.monotonic() + settings.KEYWORD_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            keywords = await shared.aget(key)
+            if keywords is not None:
+                _count("coalesced")
+                return keywords
+            if not await sync_to_async(_held, thread_sensitive=False)(lock_key) and await acquire(lock_key):
+                acquired = True
+                keywords = await shared.aget(key)
+                if keywords is not None:
+                    await release(lock_key)
+                    _count("coalesced")
+                    return keywords
+                break
+
+    try:
+        await _acount("misses")
+        await _acount("llm_calls")
+        started = time.perf_counter()
+        try:
+            with timing.stage("llm"):
+                keywords = await aextract_keywords_llm(query)
+        except Exception:
+            _count("llm_errors")
+            raise
+        finally:
+            _count("llm_seconds", time.perf_counter() - started)
+        if keywords:
+            await shared.aset(key, keywords, timeout=settings.KEYWORD_CACHE_TTL)
+        return keywords
+    finally:
+        if acquired:
+            await release(lock_key)
+
+
+def cache_stats():
+    """
+    Hit/miss counters for this process, plus totals across workers from the shared cache.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"] + stats["coalesced"]
+    stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+    stats["avg_llm_seconds"] = stats["llm_seconds"] / stats["llm_calls"] if stats["llm_calls"] else 0.0
+    shared = caches[settings.KEYWORD_CACHE_ALIAS]
+    stats_dir = _file_dir(shared, "keyword-stats")
+    if stats_dir is None:
+        totals = shared.get_many([f"keyword_stats:{name}" for name in _STATS_KEYS])
+        stats["all_workers"] = {name: totals.get(f"keyword_stats:{name}", 0) for name in _STATS_KEYS}
+        return stats
+    # Totals of every worker that has run with this cache directory, including exited ones
+    stats["all_workers"] = dict.fromkeys(_STATS_KEYS, 0)
+    for name in os.listdir(stats_dir) if os.path.isdir(stats_dir) else []:
+        if name.startswith("."):
+            continue
+        try:
+            with open(os.path.join(stats_dir, name)) as f:
+                totals = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        for key in _STATS_KEYS:
+            stats["all_workers"][key] += totals.get(key, 0)
+    return stats
@@ -0,0 +1,147 @@
+"""
+MongoDB data access for the backend.
+
+Each worker process owns one MongoClient, created on first use and reused by every
+request, so connection setup and the TLS/handshake cost stay off the request path.
+The client is never created at import time and is recreated when the process id
+changes, which keeps it safe with gunicorn's pre-fork model (pymongo clients must
+not be shared across a fork).
+"""
+
+import os
+import threading
+
+from django.conf import settings
+from pymongo import MongoClient, monitoring
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events for the client of this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "pools_created": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checked_out": 0,
+        }
+
+    def _add(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def pool_created(self, event):
+        self._add("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures")
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.counters["checkouts"] += 1
+            self.counters["checked_out"] += 1
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        counters["open_connections"] = counters["connections_created"] - counters["connections_closed"]
+        return counters
+
+
+_client = None
+_client_pid = None
+_stats = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return this process's MongoClient, creating it on first use or after a fork.
+    """
+    global _client, _client_pid, _stats
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # A client inherited from the parent process is abandoned, not closed:
+            # its sockets belong to the parent
+            _stats = PoolStats()
+            _client = MongoClient(
+                settings.MONGODB_URI,
+                maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+                serverSelectionTimeoutMS=settings.MONGODB_TIMEOUT_MS,
+                event_listeners=[_stats],
+            )
+            _client_pid = pid
+    return _client
+
+
+def get_database():
+    return get_client()[settings.DB]
+
+
+def keyword_postings():
+    """
+    The keyword_postings collection: one {keyword, id, count} document per posting.
+    """
+    return get_database()["keyword_postings"]
+
+
+def packed_postings():
+    """
+    The packed_postings collection: binary doc id / count arrays per keyword chunk.
+    """
+    return get_database()["packed_postings"]
+
+
+def document_entities():
+    """
+    The document_entities collection: one {id, url, title, length} document per opinion.
+    """
+    return get_database()["document_entities"]
+
+
+def pool_stats():
+    """
+    Connection pool statistics for this process's client.
+
+    Returns:
+        dict: Event counters, or {"connected": False} before the client is created
+    """
+    if _client is None or _client_pid != os.getpid():
+        return {"connected": False, "pid": os.getpid()}
+    stats = _stats.snapshot()
+    stats["connected"] = True
+    stats["pid"] = _client_pid
+    stats["max_pool_size"] = settings.MONGODB_MAX_POOL_SIZE
+    return stats
@@ -0,0 +1,63 @@
+"""
+Offline keyword extraction against the indexed vocabulary.
+
+The question goes through the same cleaning, tokenisation and stop-word removal as the
+indexer (backend/tokenizer.py). Indexed keywords are at most three tokens long, so a
+scan over the question's unigrams, bigrams and trigrams, probing each in the index's
+own term dictionary (a hash table in memory, a binary search over the mapped sorted
+dictionary on disk), finds every vocabulary entry the question contains without
+building a second copy of the vocabulary. Every emitted keyword therefore exists in
+the postings. Candidates are ranked by IDF so rare, specific terms come first.
+"""
+
+from . import mongo, search_engine, vocabulary
+from .tokenizer import keep_bigram, keep_trigram, keep_unigram, ngrams, tokenize
+
+
+def candidate_terms(query):
+    """
+    The 1-3 word keywords the indexer would have produced for the question text.
+    """
+    words = tokenize(query)
+    candidates = [word for word in words if keep_unigram(word)]
+    candidates.extend(gram for gram in ngrams(words, 2) if keep_bigram(gram))
+    candidates.extend(gram for gram in ngrams(words, 3) if keep_trigram(gram))
+    return list(dict.fromkeys(candidates))
+
+
+def extract_keywords(query, max_keywords=10, index=None):
+    """
+    Return up to max_keywords indexed terms found in the question, rarest first.
+
+    Uses the in-process search index when one is loaded, then the mapped vocabulary at
+    VOCABULARY_DIR (ranked by document frequency). Failing both, the candidates are
+    checked in one query against the postings collection MONGO_POSTINGS selects (no IDF
+    available, so longer phrases are preferred).
+
+    Args:
+        query (str): The user's question
+        max_keywords (int): Maximum number of keywords to return
+        index (BaseIndex): Index to match against (defaults to the loaded one)
+
+    Returns:
+        list: Keywords that all occur in the postings
+    """
+    candidates = candidate_terms(query)
+    if not candidates:
+        return []
+
+    index = index if index is not None else search_engine.get_index()
+    terms = vocabulary.get_vocabulary() if index is None else None
+    if index is not None:
+        found = [(index.idf(term), term.count(' '), term) for term in candidates if term in index]
+    elif terms is not None:
+        dfs = [(terms.df(term), term) for term in candidates]
+        found = [(-df, term.count(' '), term) for df, term in dfs if df]
+    else:
+        from django.conf import settings
+        postings = mongo.packed_postings() if settings.MONGO_POSTINGS == 'packed' else mongo.keyword_postings()
+        existing = set(postings.distinct("keyword", {"keyword": {"$in": candidates}}))
+        found = [(0.0, term.count(' '), term) for term in candidates if term in existing]
+
+    found.sort(key=lambda item: (-item[0], -item[1]))
+    return [term for _, _, term in found[:max_keywords]]
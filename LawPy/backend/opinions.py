@@ -0,0 +1,276 @@
+"""
+Readers for the scraped opinions, shared by the offline scripts.
+
+The scraper stores opinions in MongoDB (court_listener_db.opinions) and they are exported
+to data/opinions.json as one JSON array. The readers stream: the export is parsed one
+opinion at a time, so memory stays flat however large the file is.
+
+scripts/convert_opinions.py splits the export into JSON lines shards (data/opinions/
+part-00000.jsonl, ...) holding only _id, link, title, textBlock and scrapedAt. Shards can
+be read in parallel, by one indexing worker or Spark task each, instead of parsing one array.
+
+Every reader yields the fields the indexer uses, with missing values as "" like the Spark
+job's na.fill(""), and the time the text was scraped ([seconds, increment] of the
+scrapedAt timestamp the scraper sets with textBlock, or None for opinions scraped before
+it did):
+    {"doc_id": str, "url": str, "title": str, "text": str, "scraped_at": list}
+
+Incremental indexing (scripts/index_opinions.py --segments) reads only the opinions added
+or re-scraped since a source mark, {"last_id": newest _id, "scraped_at": newest
+scrapedAt}: MongoDB answers that with a range query, the files are filtered while they
+are read (changed_since).
+"""
+
+import glob
+import json
+import os
+
+_READ_SIZE = 1 << 20
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def iter_json_array(f, read_size=_READ_SIZE):
+    """
+    Yield the elements of the JSON array in a text file one by one.
+
+    Args:
+        f (file): File opened in text mode, positioned at the array
+        read_size (int): Characters read at a time
+
+    Returns:
+        generator: The decoded elements
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    exhausted = False
+    while True:
+        while position < len(buffer) and buffer[position] in _WHITESPACE:
+            position += 1
+        if position == len(buffer):
+            if exhausted:
+                raise ValueError("Unexpected end of JSON array")
+            buffer, position = f.read(read_size), 0
+            exhausted = not buffer
+            continue
+
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("Expected a JSON array")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        if buffer[position] == ",":
+            position += 1
+            continue
+
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+            if isinstance(element, (int, float)) and not isinstance(element, bool):
+                # A number only ends at a delimiter: "-25000000000." may continue with "0"
+                # in the next read
+                complete = exhausted or (end < len(buffer) and buffer[end] in _DELIMITERS)
+            else:
+                complete = end < len(buffer) or exhausted
+        except json.JSONDecodeError:
+            complete = False
+        if not complete:
+            # The element continues past the buffer: read on, more each time for huge ones
+            more = f.read(max(read_size, len(buffer) - position))
+            if not more:
+                if exhausted:
+                    raise ValueError("Unexpected end of JSON array")
+                exhausted = True
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        yield element
+        position = end
+        if position > read_size:
+            buffer, position = buffer[position:], 0
+
+
+def _text(value):
+    return value if isinstance(value, str) else ""
+
+
+def _scraped_at(value):
+    # Extended JSON {"$timestamp": {"t": ..., "i": ...}} or a bson Timestamp
+    if isinstance(value, dict) and isinstance(value.get("$timestamp"), dict):
+        return [value["$timestamp"].get("t", 0), value["$timestamp"].get("i", 0)]
+    if hasattr(value, "time") and hasattr(value, "inc"):
+        return [value.time, value.inc]
+    return None
+
+
+def _exported(opinion):
+    doc_id = opinion.get("_id")
+    if isinstance(doc_id, dict):
+        doc_id = doc_id.get("$oid")
+    return {
+        "doc_id": _text(doc_id),
+        "url": _text(opinion.get("link")),
+        "title": _text(opinion.get("title")),
+        "text": _text(opinion.get("textBlock")),
+        "scraped_at": _scraped_at(opinion.get("scrapedAt")),
+    }
+
+
+def opinions_from_json(path):
+    """
+    Stream the opinions of the JSON export (an array of Extended JSON documents).
+    """
+    with open(path, encoding='utf-8') as f:
+        for opinion in iter_json_array(f):
+            yield _exported(opinion)
+
+
+def shard_paths(directory):
+    """
+    Return the JSON lines shards written by scripts/convert_opinions.py, in order.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "part-*.jsonl")))
+    if not paths:
+        raise FileNotFoundError(f"No opinion shards (part-*.jsonl) in {directory}")
+    return paths
+
+
+def default_input(shards_dir="data/opinions", json_path="data/opinions.json"):
+    """
+    Return the opinions input to use when none is given: the shards, unless the exported
+    array was written after them (a newer export that was not converted yet).
+    """
+    if not os.path.isdir(shards_dir):
+        return json_path
+    paths = glob.glob(os.path.join(shards_dir, "part-*.jsonl"))
+    converted = max((os.path.getmtime(path) for path in paths), default=0.0)
+    if os.path.exists(json_path) and os.path.getmtime(json_path) > converted:
+        print(f"⚠️ {json_path} is newer than the shards in {shards_dir}; reading it instead "
+              f"(run scripts/convert_opinions.py to update the shards)")
+        return json_path
+    return shards_dir
+
+
+def opinions_from_shard(path):
+    """
+    Stream the opinions of one shard.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield _exported(json.loads(line))
+
+
+def opinions_from_shards(directory):
+    """
+    Stream the opinions of every shard in directory, in order.
+    """
+    for path in shard_paths(directory):
+        yield from opinions_from_shard(path)
+
+
+def changed_since(opinions, since, mark):
+    """
+    Yield the opinions added (newer _id) or re-scraped (newer scrapedAt) after the since
+    mark, or all of them when it is None.
+
+    Args:
+        opinions (iterable): Opinions as yielded by the readers above
+        since (dict): Source mark of the previous run, or None
+        mark (dict): Updated with the newest _id and scrapedAt seen while iterating
+
+    Returns:
+        generator: The opinions to compare with the index
+    """
+    for opinion in opinions:
+        doc_id, scraped_at = opinion["doc_id"], opinion["scraped_at"]
+        # ObjectId hex strings start with the creation time, so they compare chronologically
+        if mark["last_id"] is None or doc_id > mark["last_id"]:
+            mark["last_id"] = doc_id
+        if scraped_at is not None and (mark["scraped_at"] is None or scraped_at > mark["scraped_at"]):
+            mark["scraped_at"] = scraped_at
+        if (since is None or doc_id > (since["last_id"] or "")
+                or scraped_at is not None and (since["scraped_at"] is None or scraped_at > since["scraped_at"])):
+            yield opinion
+
+
+def mongodb_mark(uri, database="court_listener_db", collection="opinions"):
+    """
+    Return the source mark of the scraper's collection: its newest _id and scrapedAt.
+    """
+    import pymongo
+    client = pymongo.MongoClient(uri)
+    try:
+        opinions = client[database][collection]
+        opinions.create_index("scrapedAt", name="scraped_at_idx")
+        newest = opinions.find_one({}, {"_id": 1}, sort=[("_id", pymongo.DESCENDING)])
+        scraped = opinions.find_one({"scrapedAt": {"$exists": True}}, {"scrapedAt": 1},
+                                    sort=[("scrapedAt", pymongo.DESCENDING)])
+        return {
+            "last_id": str(newest["_id"]) if newest else None,
+            "scraped_at": _scraped_at(scraped["scrapedAt"]) if scraped else None,
+        }
+    finally:
+        client.close()
+
+
+def mongodb_ids(uri, database="court_listener_db", collection="opinions", batch_size=10000):
+    """
+    Stream the _id of every opinion of the scraper's collection, as strings.
+    """
+    import pymongo
+    client = pymongo.MongoClient(uri)
+    try:
+        for opinion in client[database][collection].find({}, {"_id": 1}, batch_size=batch_size):
+            yield str(opinion["_id"])
+    finally:
+        client.close()
+
+
+def _mongodb_range(since, until):
+    # The opinions with an _id or scrapedAt in (since, until]; both bounds are marks
+    from bson import ObjectId, Timestamp
+    if until["last_id"] is None:
+        return {"_id": {"$exists": False}}
+    inserted = {"$lte": ObjectId(until["last_id"])}
+    if since is None:
+        return {"_id": inserted}
+    if since["last_id"] is not None:
+        inserted["$gt"] = ObjectId(since["last_id"])
+    ranges = [{"_id": inserted}]
+    if until["scraped_at"] is not None:
+        scraped = {"$lte": Timestamp(*until["scraped_at"])}
+        if since["scraped_at"] is not None:
+            scraped["$gt"] = Timestamp(*since["scraped_at"])
+        ranges.append({"scrapedAt": scraped})
+    return {"$or": ranges}
+
+
+def opinions_from_mongodb(uri, database="court_listener_db", collection="opinions", batch_size=500,
+                          since=None, until=None):
+    """
+    Stream the opinions of the scraper's collection.
+
+    With until (a mark from mongodb_mark) only the opinions added or re-scraped after the
+    since mark and up to until are read, using the _id and scrapedAt indexes.
+    """
+    import pymongo
+    client = pymongo.MongoClient(uri)
+    try:
+        query = {} if until is None else _mongodb_range(since, until)
+        projection = {"link": 1, "title": 1, "textBlock": 1, "scrapedAt": 1}
+        cursor = client[database][collection].find(query, projection, batch_size=batch_size)
+        for opinion in cursor:
+            yield {
+                "doc_id": str(opinion["_id"]),
+                "url": _text(opinion.get("link")),
+                "title": _text(opinion.get("title")),
+                "text": _text(opinion.get("textBlock")),
+                "scraped_at": _scraped_at(opinion.get("scrapedAt")),
+            }
+    finally:
+        client.close()
@@ -0,0 +1,114 @@
+"""
+Packed per-term postings for MongoDB (the packed_postings collection).
+
+Instead of one keyword_postings document per (keyword, doc id, count), each keyword has
+one document per CHUNK_SIZE postings:
+
+    {"keyword": str, "chunk": int, "df": int, "docs": BinData, "counts": BinData}
+
+docs holds the chunk's document ids (ObjectIds) as 12 raw bytes each, sorted; counts
+holds the matching counts as LEB128 varints (disk_index.encode_varints). Written by
+scripts/process_opinions.py --packed-postings as Extended JSON for mongoimport, and
+read by views.search_packed, which decodes the chunks with NumPy and ranks client-side.
+"""
+
+import base64
+import json
+
+import numpy as np
+
+from .disk_index import decode_varints, encode_varints
+from .tokenizer import group_terms
+
+CHUNK_SIZE = 100000
+ID_BYTES = 12
+
+
+def pack(keyword, postings):
+    """
+    Build the packed documents of one keyword.
+
+    Args:
+        keyword (str): The keyword
+        postings (list): (doc id hex string, count) pairs, in any order
+
+    Returns:
+        list: Documents for the packed_postings collection (docs/counts as bytes)
+    """
+    postings = sorted(postings)
+    documents = []
+    for chunk, start in enumerate(range(0, len(postings), CHUNK_SIZE)):
+        part = postings[start:start + CHUNK_SIZE]
+        counts = bytearray()
+        encode_varints([count for _, count in part], counts)
+        documents.append({
+            "keyword": keyword,
+            "chunk": chunk,
+            "df": len(part),
+            "docs": b"".join(bytes.fromhex(doc_id) for doc_id, _ in part),
+            "counts": bytes(counts),
+        })
+    return documents
+
+
+def to_extended_json(document):
+    """
+    Serialise a packed document as a canonical Extended JSON line for mongoimport.
+    """
+    encoded = dict(document)
+    for field in ("docs", "counts"):
+        encoded[field] = {"$binary": {"base64": base64.b64encode(document[field]).decode("ascii"), "subType": "00"}}
+    return json.dumps(encoded)
+
+
+def decode(document):
+    """
+    Return (doc ids as a 'V12' array, counts as an int64 array) of a packed document.
+    """
+    docs = np.frombuffer(document["docs"], dtype=f"V{ID_BYTES}")
+    counts = decode_varints(document["counts"]) if document["df"] else np.zeros(0, dtype=np.int64)
+    return docs, counts
+
+
+def rank(documents, keywords, limit):
+    """
+    Rank documents by distinct keywords matched, then total count, then doc id.
+
+    Args:
+        documents (iterable): Packed documents of the keywords (any chunk order)
+        keywords (list): The query keywords; a group keyword (vocabulary.resolve_keywords)
+            counts once for any of its terms
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Result entries (docId, distinctMatches, totalScore, matchedKeywords)
+    """
+    keywords = list(dict.fromkeys(keywords))
+    groups = {term: i for i, keyword in enumerate(keywords) for term in group_terms(keyword)}
+    doc_parts, count_parts, group_parts = [], [], []
+    for document in documents:
+        docs, counts = decode(document)
+        doc_parts.append(docs)
+        count_parts.append(counts)
+        group_parts.append(np.full(len(docs), groups[document["keyword"]], dtype=np.int64))
+    if not doc_parts:
+        return []
+
+    candidates, slots = np.unique(np.concatenate(doc_parts), return_inverse=True)
+    totals = np.bincount(slots, weights=np.concatenate(count_parts)).astype(np.int64)
+    # One row per keyword: whether any of its terms occurs in the candidate
+    matched = np.zeros((len(keywords), len(candidates)), dtype=bool)
+    matched[np.concatenate(group_parts), slots] = True
+    distinct = matched.sum(axis=0)
+
+    # candidates are sorted by id, so a stable sort keeps ties in doc id order
+    order = np.lexsort((-totals, -distinct))[:limit]
+    results = []
+    for slot in order:
+        results.append({
+            "docId": candidates[slot].tobytes().hex(),
+            "distinctMatches": int(distinct[slot]),
+            "totalScore": int(totals[slot]),
+            "matchedKeywords": [keyword for i, keyword in enumerate(keywords) if matched[i, slot]],
+        })
+    return results
@@ -0,0 +1,255 @@
+"""
+Compact cache of ranked search results, shared by all workers.
+
+An entry holds only what ranking produced: document ids (12 bytes per ObjectId), total
+counts, a bitmap of the matched keywords (one bit per keyword, as many bytes as the
+keyword list needs) and, for BM25, the score, each packed into a flat array. Titles and
+urls are looked up for the requested page only. Entries are keyed on the normalised
+keyword set and ranking, so different phrasings of a question that extract the same
+keywords share one entry; a small alias entry maps the question itself to that key for
+paginated_results. The hybrid ranking also embeds the question text, so its entries are
+keyed on the normalised question as well.
+
+Total size across all workers is bounded by RESULT_CACHE_MAX_BYTES through a ledger of
+entry sizes kept in the shared cache, evicting the least recently used entries first.
+Workers update the ledger under a lock taken with the cache's atomic add (Redis), or a
+lock file next to a file-based cache, whose add is a read followed by a write. An update
+that cannot get the lock within _LEDGER_LOCK_WAIT is skipped, and its entry simply lives
+until its TTL.
+"""
+
+from array import array
+from contextlib import contextmanager
+import hashlib
+import os
+import pickle
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+from . import timing
+from .keywords import normalize_query
+
+_OBJECT_ID = re.compile(r'^[0-9a-f]{24}$')
+_LEDGER_KEY = "results:ledger"
+_LEDGER_LOCK_KEY = "results-ledger-lock"
+_LEDGER_LOCK_WAIT = 1.0
+# Lets the lock of a worker that died holding it expire
+_LEDGER_LOCK_TIMEOUT = 10
+
+
+def normalize_keyword(keyword):
+    return ' '.join(str(keyword).lower().split())
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def results_key(keywords, ranking, query=None):
+    """
+    Cache key for a keyword set under a ranking, independent of keyword order and case.
+
+    The hybrid ranking depends on the question itself (its dense search embeds the
+    question text), so its key includes the normalised question.
+    """
+    normalized = sorted({normalize_keyword(keyword) for keyword in keywords})
+    if ranking == 'hybrid':
+        normalized.append(chr(30) + normalize_query(query or ''))
+    return f"results:{ranking}:{_digest(chr(31).join(normalized))}"
+
+
+def alias_key(query, ranking):
+    return f"results_alias:{ranking}:{_digest(normalize_query(query))}"
+
+
+class RankedResults:
+    """
+    Ranked document ids and scores packed into flat arrays.
+
+    Supports len() and slicing (returning result dicts without title/url), so it can be
+    handed to django.core.paginator.Paginator directly.
+    """
+
+    def __init__(self, keywords, ranking, exhausted=True):
+        self.keywords = list(keywords)      # bit i of a mask is keywords[i]
+        self.ranking = ranking
+        self.exhausted = exhausted          # False when a top-k ranking can be continued
+        self.ids = b""                      # 12-byte ObjectIds, or NUL-separated UTF-8 ids
+        self.id_width = 12
+        self.totals = array('I')
+        self.masks = bytearray()            # mask_width little-endian bytes per result
+        self.mask_width = (len(self.keywords) + 7) // 8
+        self.scores = array('f')
+
+    @classmethod
+    def from_results(cls, keywords, ranking, results, exhausted=True):
+        """
+        Pack result dicts (as returned by the search engines) into a RankedResults.
+        """
+        ranked = cls(sorted(set(keywords)), ranking, exhausted)
+        bits = {keyword: 1 << i for i, keyword in enumerate(ranked.keywords)}
+        doc_ids = [result["docId"] for result in results]
+        if all(_OBJECT_ID.match(doc_id) for doc_id in doc_ids):
+            ranked.ids = b"".join(bytes.fromhex(doc_id) for doc_id in doc_ids)
+        else:
+            ranked.ids = "\0".join(doc_ids).encode('utf-8')
+            ranked.id_width = 0
+        for result in results:
+            ranked.totals.append(result["totalScore"])
+            mask = sum(bits.get(keyword, 0) for keyword in set(result["matchedKeywords"]))
+            ranked.masks += mask.to_bytes(ranked.mask_width, 'little')
+            if ranked.score_field in result:
+                ranked.scores.append(result[ranked.score_field])
+        return ranked
+
+    @property
+    def score_field(self):
+        # BM25 scores, or fused scores of the hybrid ranking
+        return "score" if self.ranking == "hybrid" else "bm25"
+
+    def __len__(self):
+        return len(self.totals)
+
+    def _doc_id(self, i):
+        if self.id_width:
+            return self.ids[i * self.id_width:(i + 1) * self.id_width].hex()
+        return self.ids.decode('utf-8').split("\0")[i]
+
+    def entry(self, i):
+        mask = int.from_bytes(self.masks[i * self.mask_width:(i + 1) * self.mask_width], 'little')
+        matched = [keyword for bit, keyword in enumerate(self.keywords) if mask >> bit & 1]
+        entry = {
+            "docId": self._doc_id(i),
+            "distinctMatches": len(matched),
+            "totalScore": self.totals[i],
+            "matchedKeywords": matched,
+        }
+        if self.scores:
+            entry[self.score_field] = self.scores[i]
+        return entry
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.entry(i) for i in range(*index.indices(len(self)))]
+        return self.entry(index)
+
+
+def _lock_path(shared):
+    if not isinstance(shared, FileBasedCache):
+        return None
+    return os.path.join(settings.CACHES[settings.RESULT_CACHE_ALIAS]['LOCATION'], _LEDGER_LOCK_KEY)
+
+
+def _take_lock(shared):
+    path = _lock_path(shared)
+    if path is None:
+        return shared.add(_LEDGER_LOCK_KEY, 1, timeout=_LEDGER_LOCK_TIMEOUT)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(path) > _LEDGER_LOCK_TIMEOUT:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        return False
+
+
+def _drop_lock(shared):
+    path = _lock_path(shared)
+    if path is None:
+        shared.delete(_LEDGER_LOCK_KEY)
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def _ledger_lock(shared):
+    """
+    Hold the all-worker ledger lock; yields False if it could not be taken in time.
+    """
+    deadline = time.monotonic() + _LEDGER_LOCK_WAIT
+    locked = _take_lock(shared)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.002)
+        locked = _take_lock(shared)
+    try:
+        yield locked
+    finally:
+        if locked:
+            _drop_lock(shared)
+
+
+def _update_ledger(key, size=None):
+    """
+    Record key as most recently used (with its size when just stored) and evict the
+    least recently used entries beyond the byte budget.
+    """
+    shared = caches[settings.RESULT_CACHE_ALIAS]
+    with _ledger_lock(shared) as locked:
+        if not locked:
+            return
+        ledger = shared.get(_LEDGER_KEY) or {}
+        previous = ledger.pop(key, None)
+        if size is None:
+            size = previous
+        if size is None:
+            return
+        ledger[key] = size
+        total = sum(ledger.values())
+        evicted = []
+        while total > settings.RESULT_CACHE_MAX_BYTES and len(ledger) > 1:
+            oldest = next(iter(ledger))
+            total -= ledger.pop(oldest)
+            evicted.append(oldest)
+        shared.set(_LEDGER_KEY, ledger, timeout=None)
+    if evicted:
+        shared.delete_many(evicted)
+
+
+def store(query, ranked):
+    """
+    Cache ranked results and point the question's alias at them.
+
+    Returns:
+        str: The results key
+    """
+    shared = caches[settings.RESULT_CACHE_ALIAS]
+    key = results_key(ranked.keywords, ranked.ranking, query)
+    shared.set(key, ranked, timeout=settings.RESULT_CACHE_TTL)
+    if query:
+        shared.set(alias_key(query, ranked.ranking), key, timeout=settings.RESULT_CACHE_TTL)
+    size = len(pickle.dumps(ranked, pickle.HIGHEST_PROTOCOL))
+    timing.record("cache_bytes", size)
+    _update_ledger(key, size)
+    return key
+
+
+def lookup_key(query, ranking):
+    return caches[settings.RESULT_CACHE_ALIAS].get(alias_key(query, ranking))
+
+
+def load(key):
+    """
+    Return the RankedResults stored under key, or None.
+
+    key comes from the client, so anything but a results entry (the ledger, cached
+    keywords, a made-up key) is treated as a miss.
+    """
+    if not isinstance(key, str) or not key.startswith("results:") or key == _LEDGER_KEY:
+        return None
+    ranked = caches[settings.RESULT_CACHE_ALIAS].get(key)
+    # Entries stored before masks had a variable width count as misses too
+    if not isinstance(ranked, RankedResults) or not hasattr(ranked, "mask_width"):
+        return None
+    _update_ledger(key)
+    return ranked
@@ -0,0 +1,691 @@
+"""
+In-process inverted index for keyword search.
+
+Loads the keyword postings into compact array-backed storage (term dictionary ->
+contiguous int32 doc number and count arrays, document ids interned to dense ints)
+and answers the same "distinct matches, then total count" ranking as the MongoDB
+aggregation in views.search_documents, without a round trip per query.
+"""
+
+from array import array
+import bisect
+from collections import OrderedDict
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from .tokenizer import group_terms, tokenize
+
+logger = logging.getLogger(__name__)
+
+# '"foster parents"~5': all the words within a window of 5 tokens, in any order
+_PROXIMITY = re.compile(r'^"(.+)"~(\d+)$')
+_PHRASE_CACHE_SIZE = 256
+_phrase_lock = threading.Lock()
+
+
+def bm25_idf(num_docs, df):
+    """
+    BM25 inverse document frequency (the +1 variant, never negative).
+    """
+    return math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+
+
+def _phrase_matches(lists):
+    """
+    Documents containing the words at their offsets, and the number of occurrences.
+
+    Each posting position becomes the key (doc << 32) | (position - offset), so one
+    occurrence of the phrase is a key present in every word's list.
+    """
+    keys = None
+    for offset, docs, counts, positions in lists:
+        starts = positions - offset
+        word_keys = (np.repeat(docs, counts) << 32) | starts
+        word_keys = word_keys[starts >= 0]
+        keys = word_keys if keys is None else np.intersect1d(keys, word_keys, assume_unique=True)
+    return np.unique(keys >> 32, return_counts=True)
+
+
+def _window_matches(lists, window):
+    """
+    Documents containing all the words within window consecutive tokens (in any order),
+    and the number of such minimal windows.
+    """
+    candidates = lists[0][1]
+    for _, docs, _, _ in lists[1:]:
+        candidates = np.intersect1d(candidates, docs, assume_unique=True)
+    per_word = []
+    for _, docs, counts, positions in lists:
+        ends = np.cumsum(counts)
+        slots = np.searchsorted(docs, candidates)
+        per_word.append((ends[slots] - counts[slots], ends[slots], positions))
+
+    matched_docs, matched_counts = [], []
+    for i, docno in enumerate(candidates):
+        events = sorted(
+            (int(position), word)
+            for word, (starts, ends, positions) in enumerate(per_word)
+            for position in positions[starts[i]:ends[i]]
+        )
+        seen = [0] * len(lists)
+        covered = 0
+        left = 0
+        windows = 0
+        for position, word in events:
+            if seen[word] == 0:
+                covered += 1
+            seen[word] += 1
+            # Shrink from the left while every word stays covered
+            while seen[events[left][1]] > 1:
+                seen[events[left][1]] -= 1
+                left += 1
+            # Minimal when the newest word is the only occurrence of it left in the window
+            if covered == len(lists) and seen[word] == 1 and position - events[left][0] < window:
+                windows += 1
+        if windows:
+            matched_docs.append(docno)
+            matched_counts.append(windows)
+    return np.array(matched_docs, dtype=np.int64), np.array(matched_counts, dtype=np.int64)
+
+
+class BaseIndex:
+    """
+    Ranking shared by the index implementations.
+
+    Subclasses provide postings(keyword) -> (doc numbers, counts) sorted by doc number,
+    keyword in index, max_count(keyword), idf(keyword), document_frequency(keyword), doc_id(docno),
+    document(docno) -> (doc id, url, title), docno(doc id) -> doc number or None, and the
+    doc_lengths array, num_docs and avg_doc_length used by BM25. Only documents with an
+    entity have postings.
+
+    A group keyword ("custodial|custodian|custody", vocabulary.resolve_keywords) matches
+    the documents of any of its terms, with their counts summed, and ranks as one keyword.
+
+    Indexes built with token positions (has_positions) also provide
+    term_positions(word) -> (doc numbers, counts, positions) as int64 arrays, positions
+    grouped per document in doc order. Keywords that are not indexed terms are then
+    evaluated positionally: phrases ("best interests child", e.g. with the n-gram
+    postings left out) and proximity queries ('"foster parents"~5').
+
+    Rankings return document ids and scores only; url and title are looked up for the
+    page being shown (backend/documents.py).
+    """
+
+    has_positions = False
+
+    def term(self, keyword):
+        """
+        Return (doc numbers, counts, max count, idf) for a keyword, or None if nothing matches.
+        """
+        postings = self.postings(keyword)
+        if postings is not None:
+            return postings[0], postings[1], self.max_count(keyword), self.idf(keyword)
+        alternatives = group_terms(keyword)
+        if len(alternatives) == 1 and not self.has_positions:
+            return None
+        with _phrase_lock:
+            cache = self.__dict__.setdefault("_phrases", OrderedDict())
+            if keyword in cache:
+                cache.move_to_end(keyword)
+                return cache[keyword]
+        if len(alternatives) > 1:
+            term = self._group_term(alternatives)
+        else:
+            term = self._positional_term(keyword)
+        with _phrase_lock:
+            cache[keyword] = term
+            while len(cache) > _PHRASE_CACHE_SIZE:
+                cache.popitem(last=False)
+        return term
+
+    def _group_term(self, alternatives):
+        docs_parts, counts_parts = [], []
+        for alternative in alternatives:
+            term = self.term(alternative)
+            if term is not None:
+                docs_parts.append(np.asarray(term[0], dtype=np.int64))
+                counts_parts.append(np.asarray(term[1], dtype=np.int64))
+        if not docs_parts:
+            return None
+        docs, slots = np.unique(np.concatenate(docs_parts), return_inverse=True)
+        counts = np.bincount(slots, weights=np.concatenate(counts_parts)).astype(np.int64)
+        return (
+            array('q', docs.tobytes()),
+            array('q', counts.tobytes()),
+            int(counts.max()),
+            bm25_idf(self.num_docs, len(docs)),
+        )
+
+    def _positional_term(self, keyword):
+        match = _PROXIMITY.match(keyword)
+        phrase, window = (match.group(1), int(match.group(2))) if match else (keyword, None)
+        # Same normalisation as the n-grams; empty tokens keep their position
+        words = [(offset, word) for offset, word in enumerate(tokenize(phrase)) if word]
+        if window is not None:
+            words = list({word: (offset, word) for offset, word in reversed(words)}.values())
+        if len(words) < 2:
+            return None
+        lists = []
+        for offset, word in words:
+            positional = self.term_positions(word)
+            if positional is None:
+                return None
+            lists.append((offset, *positional))
+        if window is None:
+            docs, counts = _phrase_matches(lists)
+        else:
+            docs, counts = _window_matches(lists, window)
+        if not len(docs):
+            return None
+        return (
+            array('q', docs.astype(np.int64).tobytes()),
+            array('q', counts.astype(np.int64).tobytes()),
+            int(counts.max()),
+            bm25_idf(self.num_docs, len(docs)),
+        )
+
+    def search(self, keywords, limit=100000):
+        """
+        Rank documents containing any of the keywords.
+
+        Args:
+            keywords (list): Keywords to match
+            limit (int): Maximum number of results to return
+
+        Returns:
+            list: Result dicts shaped like views.search_documents output
+        """
+        matches = {}  # doc number -> [distinct matches, total score, matched keywords]
+        for keyword in dict.fromkeys(keywords):
+            term = self.term(keyword)
+            if term is None:
+                continue
+            for docno, count in zip(term[0], term[1]):
+                entry = matches.get(docno)
+                if entry is None:
+                    matches[docno] = [1, count, [keyword]]
+                else:
+                    entry[0] += 1
+                    entry[1] += count
+                    entry[2].append(keyword)
+
+        ranked = sorted(matches.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+
+        return [
+            {
+                "docId": self.doc_id(docno),
+                "distinctMatches": distinct,
+                "totalScore": total,
+                "matchedKeywords": matched
+            }
+            for docno, (distinct, total, matched) in ranked[:limit]
+        ]
+
+    def search_top_k(self, keywords, k):
+        """
+        Return the first k results of search() without scoring every matching document.
+
+        The "distinct matches, then total count" order is folded into one additive score,
+        distinct * bonus + total, with bonus larger than any possible total. Each term then
+        contributes at most bonus + its max count, and MaxScore uses these upper bounds to
+        stop reading the postings of terms that cannot lift a document into the top k on
+        their own; those terms are only probed for documents found through the others.
+
+        Args:
+            keywords (list): Keywords to match
+            k (int): Number of results wanted
+
+        Returns:
+            tuple: (results shaped like search(), True if no further results exist)
+        """
+        terms = []
+        for keyword in dict.fromkeys(keywords):
+            term = self.term(keyword)
+            if term is not None and len(term[0]):
+                terms.append((keyword, term[0], term[1], term[2]))
+        if not terms or k <= 0:
+            return [], not terms
+
+        bonus = sum(term[3] for term in terms) + 1
+        # Frequent terms first, so they are the first to become non-essential
+        terms.sort(key=lambda term: -len(term[1]))
+        upper_bounds = []
+        cumulative = 0
+        for term in terms:
+            cumulative += bonus + term[3]
+            upper_bounds.append(cumulative)
+
+        positions = [0] * len(terms)
+        heap = []            # (score, -docno, matched keywords), smallest score on top
+        threshold = -1       # score to beat once the heap holds k documents
+        non_essential = 0    # terms[:non_essential] are only probed, never iterated
+
+        while non_essential < len(terms):
+            docno = None
+            for i in range(non_essential, len(terms)):
+                if positions[i] < len(terms[i][1]):
+                    candidate = terms[i][1][positions[i]]
+                    if docno is None or candidate < docno:
+                        docno = candidate
+            if docno is None:
+                break
+
+            score = 0
+            matched = []
+            for i in range(non_essential, len(terms)):
+                docs = terms[i][1]
+                if positions[i] < len(docs) and docs[positions[i]] == docno:
+                    score += bonus + terms[i][2][positions[i]]
+                    matched.append(terms[i][0])
+                    positions[i] += 1
+
+            pruned = False
+            for i in range(non_essential - 1, -1, -1):
+                if score + upper_bounds[i] <= threshold:
+                    pruned = True
+                    break
+                docs = terms[i][1]
+                positions[i] = bisect.bisect_left(docs, docno, positions[i])
+                if positions[i] < len(docs) and docs[positions[i]] == docno:
+                    score += bonus + terms[i][2][positions[i]]
+                    matched.append(terms[i][0])
+            if pruned or score <= threshold:
+                continue
+
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -docno, matched))
+            else:
+                heapq.heapreplace(heap, (score, -docno, matched))
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while non_essential < len(terms) and upper_bounds[non_essential] <= threshold:
+                    non_essential += 1
+
+        order = {keyword: i for i, keyword in enumerate(dict.fromkeys(keywords))}
+        results = []
+        for score, negdocno, matched in sorted(heap, reverse=True):
+            results.append({
+                "docId": self.doc_id(-negdocno),
+                "distinctMatches": score // bonus,
+                "totalScore": score % bonus,
+                "matchedKeywords": sorted(matched, key=order.__getitem__)
+            })
+        return results, len(results) < k
+
+    def search_bm25(self, keywords, limit=100000, k1=1.2, b=0.75):
+        """
+        Rank documents by BM25 over the keywords, scoring whole postings arrays at once.
+
+        Args:
+            keywords (list): Keywords to match
+            limit (int): Maximum number of results to return
+            k1 (float): Term frequency saturation
+            b (float): Document length normalisation
+
+        Returns:
+            list: Result dicts shaped like search(), plus a "bm25" score
+        """
+        keywords = list(dict.fromkeys(keywords))
+        doc_parts, weight_parts, count_parts, keyword_parts = [], [], [], []
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+        length_norm = k1 / self.avg_doc_length * b
+        for number, keyword in enumerate(keywords):
+            term = self.term(keyword)
+            if term is None or not len(term[0]):
+                continue
+            docs = np.frombuffer(term[0], dtype=term[0].typecode)
+            tf = np.frombuffer(term[1], dtype=term[1].typecode).astype(np.float64)
+            denominator = tf + k1 * (1 - b) + length_norm * doc_lengths[docs]
+            doc_parts.append(docs)
+            weight_parts.append(term[3] * tf * (k1 + 1) / denominator)
+            count_parts.append(tf)
+            keyword_parts.append(np.full(len(docs), number, dtype=np.int64))
+        if not doc_parts:
+            return []
+
+        # Gather scores per document over the concatenated postings of all terms
+        candidates, slots = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(slots, weights=np.concatenate(weight_parts))
+        totals = np.bincount(slots, weights=np.concatenate(count_parts))
+        # One row per keyword: whether it matched the candidate
+        matched = np.zeros((len(keywords), len(candidates)), dtype=bool)
+        matched[np.concatenate(keyword_parts), slots] = True
+
+        if limit < len(candidates):
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        # Ties are broken by doc number, as in the other rankings
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+
+        results = []
+        for slot in top:
+            keywords_matched = [keyword for number, keyword in enumerate(keywords) if matched[number, slot]]
+            results.append({
+                "docId": self.doc_id(int(candidates[slot])),
+                "distinctMatches": len(keywords_matched),
+                "totalScore": int(totals[slot]),
+                "matchedKeywords": keywords_matched,
+                "bm25": float(scores[slot])
+            })
+        return results
+
+
+class TopKCursor:
+    """
+    Lazily continued top-k ranking for one keyword set.
+
+    Asking for results past the ranked prefix re-runs search_top_k with a larger k;
+    set k to the length of a previously ranked prefix to continue from it.
+    """
+
+    def __init__(self, keywords, window=100, ranking='matches'):
+        self.keywords = list(keywords)
+        self.ranking = ranking
+        self.k = 0
+        self.window = window
+        self.results = []
+        self.exhausted = False
+
+    def fetch(self, index, end):
+        """
+        Make sure the first end results are ranked (or all of them, if fewer exist).
+        """
+        if self.exhausted or end <= len(self.results):
+            return self
+        k = max(end, self.window, 2 * self.k)
+        if self.ranking == 'bm25':
+            self.results = index.search_bm25(self.keywords, k)
+            self.exhausted = len(self.results) < k
+        else:
+            self.results, self.exhausted = index.search_top_k(self.keywords, k)
+        self.k = k
+        return self
+
+
+class InMemoryIndex(BaseIndex):
+    """
+    Compact inverted index held in the worker process.
+
+    Postings of term number t live in postings_docs / postings_counts between
+    term_offsets[t] and term_offsets[t + 1], sorted by dense document number. With
+    positions, posting p's token positions are positions_data[position_offsets[p]:
+    position_offsets[p + 1]] (empty for n-grams).
+    """
+
+    def __init__(self):
+        self.doc_ids = []       # dense doc number -> document id string
+        self.urls = []          # dense doc number -> url (None when no entity exists)
+        self.titles = []        # dense doc number -> title
+        self.doc_lengths = array('i')   # dense doc number -> tokens after stop words (-1 if unknown)
+        self.docnos = {}        # document id string -> dense doc number
+        self.terms = {}         # keyword -> term number
+        self.term_offsets = array('q', [0])
+        self.postings_docs = array('i')
+        self.postings_counts = array('i')
+        self.term_max_counts = array('i')
+        self.term_idf = array('d')
+        self.position_offsets = array('q', [0])
+        self.positions_data = array('i')
+        self.num_docs = 0
+        self.avg_doc_length = 1.0
+        self._pending = {}      # keyword -> (docs, counts) while building
+        self._pending_positions = {}    # keyword -> {doc number: positions} while building
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def intern_document(self, doc_id, url=None, title="", length=None):
+        """
+        Return the dense doc number for doc_id, assigning a new one if needed.
+        """
+        docno = self.docnos.get(doc_id)
+        if docno is None:
+            docno = len(self.doc_ids)
+            self.docnos[doc_id] = docno
+            self.doc_ids.append(doc_id)
+            self.urls.append(url)
+            self.titles.append(title or "")
+            self.doc_lengths.append(-1 if length is None else length)
+        elif url is not None:
+            self.urls[docno] = url
+            self.titles[docno] = title or ""
+            if length is not None:
+                self.doc_lengths[docno] = length
+        return docno
+
+    def add_posting(self, keyword, doc_id, count):
+        """
+        Buffer one (keyword, doc id, count) posting; call finalize() when done.
+        """
+        docno = self.intern_document(doc_id)
+        pending = self._pending.get(keyword)
+        if pending is None:
+            pending = self._pending[keyword] = (array('i'), array('i'))
+        pending[0].append(docno)
+        pending[1].append(count)
+
+    def add_positions(self, keyword, doc_id, positions):
+        """
+        Buffer the sorted token positions of a word in a document; its posting is added
+        separately with add_posting().
+        """
+        docno = self.intern_document(doc_id)
+        self._pending_positions.setdefault(keyword, {})[docno] = array('i', positions)
+
+    def finalize(self):
+        """
+        Pack the buffered postings into the contiguous per-term arrays and compute the
+        BM25 statistics.
+
+        Postings of documents without an entity are dropped: they can never be returned,
+        and per-document ranking is unaffected by them.
+        """
+        unigram_lengths = [0] * len(self.doc_ids)
+        urls = self.urls
+        self.has_positions = bool(self._pending_positions)
+        for keyword in sorted(self._pending):
+            docs, counts = self._pending[keyword]
+            order = sorted((i for i in range(len(docs)) if urls[docs[i]] is not None), key=docs.__getitem__)
+            if not order:
+                continue
+            self.terms[keyword] = len(self.term_offsets) - 1
+            self.postings_docs.extend(docs[i] for i in order)
+            self.postings_counts.extend(counts[i] for i in order)
+            self.term_offsets.append(len(self.postings_docs))
+            if self.has_positions:
+                word_positions = self._pending_positions.get(keyword, {})
+                for i in order:
+                    self.positions_data.extend(word_positions.get(docs[i], ()))
+                    self.position_offsets.append(len(self.positions_data))
+            self.term_max_counts.append(max(counts[i] for i in order))
+            if " " not in keyword:
+                for i in order:
+                    unigram_lengths[docs[i]] += counts[i]
+        self._pending = {}
+        self._pending_positions = {}
+
+        # Entities exported before lengths were recorded fall back to their unigram counts
+        for docno, length in enumerate(self.doc_lengths):
+            if length < 0:
+                self.doc_lengths[docno] = unigram_lengths[docno]
+        self.num_docs = num_docs = sum(1 for url in urls if url is not None)
+        total_length = sum(length for docno, length in enumerate(self.doc_lengths) if urls[docno] is not None)
+        self.avg_doc_length = total_length / num_docs if num_docs and total_length else 1.0
+        for term in range(len(self.terms)):
+            df = self.term_offsets[term + 1] - self.term_offsets[term]
+            self.term_idf.append(bm25_idf(num_docs, df))
+        return self
+
+    def postings(self, keyword):
+        """
+        Return (doc numbers, counts) for keyword as array slices, or None.
+        """
+        term = self.terms.get(keyword)
+        if term is None:
+            return None
+        start, end = self.term_offsets[term], self.term_offsets[term + 1]
+        return self.postings_docs[start:end], self.postings_counts[start:end]
+
+    def __contains__(self, keyword):
+        return keyword in self.terms
+
+    def term_positions(self, keyword):
+        """
+        Return (doc numbers, counts, positions) int64 arrays for a word, or None.
+        """
+        term = self.terms.get(keyword) if self.has_positions else None
+        if term is None:
+            return None
+        start, end = self.term_offsets[term], self.term_offsets[term + 1]
+        offsets = np.frombuffer(self.position_offsets, dtype=np.int64)[start:end + 1]
+        if offsets[0] == offsets[-1]:
+            return None
+        docs = np.frombuffer(self.postings_docs, dtype=np.int32)[start:end].astype(np.int64)
+        positions = np.frombuffer(self.positions_data, dtype=np.int32)[offsets[0]:offsets[-1]].astype(np.int64)
+        return docs, np.diff(offsets), positions
+
+    def max_count(self, keyword):
+        return self.term_max_counts[self.terms[keyword]]
+
+    def document_frequency(self, keyword):
+        term = self.terms.get(keyword)
+        if term is None:
+            return 0
+        return self.term_offsets[term + 1] - self.term_offsets[term]
+
+    def idf(self, keyword):
+        return self.term_idf[self.terms[keyword]]
+
+    def doc_id(self, docno):
+        return self.doc_ids[docno]
+
+    def document(self, docno):
+        return self.doc_ids[docno], self.urls[docno], self.titles[docno]
+
+    def docno(self, doc_id):
+        docno = self.docnos.get(doc_id)
+        if docno is None or self.urls[docno] is None:
+            return None
+        return docno
+
+
+def load_from_mongodb(db):
+    """
+    Build an InMemoryIndex from the document_entities and keyword_postings collections of db.
+    """
+    index = InMemoryIndex()
+    for doc in db["document_entities"].find({}, {"id": 1, "url": 1, "title": 1, "length": 1, "_id": 0}):
+        index.intern_document(doc["id"], doc.get("url"), doc.get("title", ""), doc.get("length"))
+    for posting in db["keyword_postings"].find({}, {"keyword": 1, "id": 1, "count": 1, "_id": 0}):
+        index.add_posting(posting["keyword"], posting["id"], posting["count"])
+    return index.finalize()
+
+
+def load_from_json(data_dir):
+    """
+    Build an InMemoryIndex from the JSON line files written by scripts/process_opinions.py,
+    with token positions when keyword_positions.json is present.
+    """
+    index = InMemoryIndex()
+    with open(os.path.join(data_dir, "document_entities.json")) as f:
+        for line in f:
+            if line.strip():
+                doc = json.loads(line)
+                index.intern_document(doc["id"], doc.get("url"), doc.get("title", ""), doc.get("length"))
+    with open(os.path.join(data_dir, "keyword_postings.json")) as f:
+        for line in f:
+            if line.strip():
+                posting = json.loads(line)
+                index.add_posting(posting["keyword"], posting["id"], posting["count"])
+    # Written by process_opinions.py --positions
+    positions_file = os.path.join(data_dir, "keyword_positions.json")
+    if os.path.exists(positions_file):
+        with open(positions_file) as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    index.add_positions(row["keyword"], row["id"], row["positions"])
+    return index.finalize()
+
+
+_index = None
+_loader = None
+_segments_dir = None
+_lock = threading.Lock()
+
+
+def _load(source):
+    global _index
+    started = time.perf_counter()
+    try:
+        if source:
+            index = load_from_json(source)
+        else:
+            from .mongo import get_database
+            index = load_from_mongodb(get_database())
+    except Exception as e:
+        logger.error(f"Failed to load in-memory search index: {e}")
+        return
+    _index = index
+    logger.info(
+        f"Loaded in-memory search index: {len(index.terms):,} terms, {len(index):,} documents, "
+        f"{len(index.postings_docs):,} postings in {time.perf_counter() - started:.1f}s"
+    )
+
+
+def start_loading(source=None):
+    """
+    Load the index in a background thread so the worker can serve (via Mongo) meanwhile.
+    """
+    global _loader
+    with _lock:
+        if _loader is None:
+            _loader = threading.Thread(target=_load, args=(source,), name="search-index-loader", daemon=True)
+            _loader.start()
+
+
+def open_disk_index(index_dir):
+    """
+    Memory-map a binary index directory written by process_opinions.py --binary-index,
+    or a segment directory written by index_opinions.py --segments (backend/segments.py).
+    """
+    global _index, _segments_dir
+    from .disk_index import DiskIndex
+    from . import segments
+    if segments.is_segmented(index_dir):
+        _segments_dir = index_dir
+        segments.get_index(index_dir)
+        return
+    try:
+        _index = DiskIndex(index_dir)
+    except Exception as e:
+        logger.error(f"Failed to open binary search index at {index_dir}: {e}")
+        return
+    logger.info(f"Mapped binary search index at {index_dir}: {_index.meta['num_terms']:,} terms, {len(_index):,} documents")
+
+
+def set_index(index):
+    """
+    Serve searches from an already built index (used by the benchmarks).
+    """
+    global _index
+    _index = index
+
+
+def get_index():
+    """
+    Return the loaded index, or None while it is loading or when it failed to load.
+    """
+    if _segments_dir is not None:
+        from . import segments
+        return segments.get_index(_segments_dir)
+    return _index
@@ -0,0 +1,500 @@
+"""
+Segmented binary index for incremental indexing.
+
+A segment directory holds several binary indexes (disk_index format), each built from
+the opinions added or changed in one indexing run, and a manifest naming the live ones:
+
+    <root>/manifest.json            format version, generation, segments, and the source
+                                    high-water mark the last run indexed up to
+    <root>/seg-000001/              a binary index directory (the initial full build)
+    <root>/seg-000001/fingerprints.bin
+                                    uint64 content fingerprint per document of the segment
+    <root>/seg-000004/              a delta segment
+    <root>/seg-000001.deleted-000004.bin
+                                    int32 tombstones: document numbers of seg-000001
+                                    that were deleted or replaced by a newer segment
+
+A run only reads the opinions added or changed since the high-water mark (newer _id or
+scrapedAt, see backend/opinions.py) and compares their fingerprints with the live
+copies', so re-scraped opinions whose content is unchanged are not indexed again.
+
+Files are never modified: every change writes new files and then replaces the manifest
+atomically (the generation increases by one). Files the new generation no longer uses
+are removed when the generation after it is published, so workers still mapping the
+previous one keep working. One writer at a time holds the write lock, so an indexing
+run and a merge never publish over each other.
+
+scripts/index_opinions.py --segments adds a delta segment per run;
+scripts/merge_segments.py merges small segments (each document is merged into a larger
+segment a logarithmic number of times) and compacts segments with many tombstones.
+Workers serving LAWPY_INDEX_DIR see a new generation within SEARCH_INDEX_REFRESH seconds.
+"""
+
+from array import array
+import bisect
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from .disk_index import DiskIndex, write_index
+from .search_engine import BaseIndex, InMemoryIndex, bm25_idf, load_from_json
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+_WRITE_LOCK = ".writing"
+_WRITE_LOCK_TIMEOUT = 6 * 60 * 60
+_TERM_CACHE_SIZE = 256
+
+
+def fingerprint(opinion):
+    """
+    Content fingerprint of an opinion (url, title and text) for change detection.
+    """
+    content = "\0".join((opinion["url"], opinion["title"], opinion["text"]))
+    return int.from_bytes(hashlib.blake2b(content.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def is_segmented(root):
+    return os.path.exists(os.path.join(root, MANIFEST))
+
+
+def read_manifest(root):
+    """
+    Return the current manifest of a segment directory (an empty one if none exists).
+    """
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"version": FORMAT_VERSION, "generation": 0, "segments": [], "source": None, "retired": []}
+    if manifest["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported segment manifest version {manifest['version']} in {root}; "
+                         f"index it again into a new directory")
+    return manifest
+
+
+@contextmanager
+def write_lock(root):
+    """
+    Hold the segment directory's write lock, waiting for another writer to finish.
+    """
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, _WRITE_LOCK)
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            # Left over from a crashed writer
+            try:
+                if time.time() - os.path.getmtime(path) > _WRITE_LOCK_TIMEOUT:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(1)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def _files(manifest):
+    files = {entry["name"] for entry in manifest["segments"]}
+    files.update(entry["deleted"] for entry in manifest["segments"] if entry["deleted"])
+    return files
+
+
+def _publish(root, previous, segments, source):
+    """
+    Replace the manifest with the next generation and remove what the one before no longer used.
+    """
+    manifest = {
+        "version": FORMAT_VERSION,
+        "generation": previous["generation"] + 1,
+        "segments": segments,
+        "source": source,
+        "created": time.time()
+    }
+    used = _files(manifest)
+    for name in previous.get("retired", []):
+        if name not in used:
+            path = os.path.join(root, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+    manifest["retired"] = sorted(_files(previous) - used)
+
+    tmp_path = os.path.join(root, f"{MANIFEST}.tmp-{os.getpid()}")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(root, MANIFEST))
+    return manifest
+
+
+def _tombstones(root, entry):
+    if not entry["deleted"]:
+        return np.zeros(0, dtype=np.int32)
+    return np.fromfile(os.path.join(root, entry["deleted"]), dtype=np.int32)
+
+
+def _write_fingerprints(segment_dir, fingerprints):
+    # In the segment's document order
+    segment = DiskIndex(segment_dir)
+    values = np.array([fingerprints[segment.doc_id(docno)] for docno in range(len(segment))], dtype=np.uint64)
+    values.tofile(os.path.join(segment_dir, "fingerprints.bin"))
+
+
+def add_segment(root, data_dir, fingerprints, replaced, source=None):
+    """
+    Publish a new generation with the documents indexed into data_dir as a new segment.
+
+    Call with the write lock held.
+
+    Args:
+        root (str): Segment directory
+        data_dir (str): Directory with the JSON output of the changed documents (as written
+            by scripts/index_opinions.py), or None when documents were only deleted
+        fingerprints (dict): Document id -> fingerprint of the documents in data_dir
+        replaced (iterable): Ids of the documents deleted or changed since the previous
+            generation; their copies in the existing segments get tombstones
+        source (dict): Source high-water mark the documents were read up to, recorded
+            for the next run (the previous one when None)
+
+    Returns:
+        dict: The published manifest
+    """
+    previous = read_manifest(root)
+    generation = previous["generation"] + 1
+    segments = [dict(entry) for entry in previous["segments"]]
+
+    # Tombstone the live copy of every replaced document (newest segment first)
+    indexes = [DiskIndex(os.path.join(root, entry["name"])) for entry in segments]
+    deleted = [set(_tombstones(root, entry).tolist()) for entry in segments]
+    added = [False] * len(segments)
+    for doc_id in replaced:
+        for i in range(len(segments) - 1, -1, -1):
+            docno = indexes[i].docno(doc_id)
+            if docno is not None and docno not in deleted[i]:
+                deleted[i].add(docno)
+                added[i] = True
+                break
+    for i, entry in enumerate(segments):
+        if added[i]:
+            entry["deleted"] = f"{entry['name']}.deleted-{generation:06d}.bin"
+            with open(os.path.join(root, entry["deleted"]), 'wb') as f:
+                array('i', sorted(deleted[i])).tofile(f)
+            entry["num_deleted"] = len(deleted[i])
+
+    if data_dir is not None:
+        name = f"seg-{generation:06d}"
+        meta = write_index(load_from_json(data_dir), os.path.join(root, name))
+        _write_fingerprints(os.path.join(root, name), fingerprints)
+        segments.append({"name": name, "num_docs": meta["num_docs"], "deleted": None, "num_deleted": 0})
+
+    return _publish(root, previous, segments, previous["source"] if source is None else source)
+
+
+def merge_plan(manifest, max_segments=8, max_deleted=0.3):
+    """
+    Choose the segments to rewrite.
+
+    The newest segments are merged while their combined live size reaches the next older
+    segment's, like carries in a binary counter, so every document is rewritten a
+    logarithmic number of times; more are merged while there are over max_segments.
+    Segments with more than max_deleted of their documents tombstoned are compacted.
+
+    Returns:
+        list: Lists of adjacent segment positions, each to be rewritten as one segment
+    """
+    entries = manifest["segments"]
+    sizes = [entry["num_docs"] - entry["num_deleted"] for entry in entries]
+    plan = []
+    merged = 1
+    total = sizes[-1] if sizes else 0
+    while merged < len(sizes) and (len(sizes) - merged + 1 > max_segments or total >= sizes[-merged - 1]):
+        merged += 1
+        total += sizes[-merged]
+    tail = list(range(len(sizes) - merged, len(sizes))) if merged > 1 else []
+    for position, entry in enumerate(entries):
+        if position not in tail and entry["num_docs"] and entry["num_deleted"] / entry["num_docs"] > max_deleted:
+            plan.append([position])
+    if tail:
+        plan.append(tail)
+    return plan
+
+
+def _rewrite(root, entries, out_dir):
+    # Live documents and postings of the segments, in segment order, into a new one
+    index = InMemoryIndex()
+    sources = []
+    fingerprints = []
+    for entry in entries:
+        segment = DiskIndex(os.path.join(root, entry["name"]))
+        alive = np.ones(len(segment), dtype=bool)
+        alive[_tombstones(root, entry)] = False
+        doc_ids = [segment.doc_id(docno) for docno in range(len(segment))]
+        for docno in np.flatnonzero(alive).tolist():
+            _, url, title = segment.document(docno)
+            index.intern_document(doc_ids[docno], url, title, segment.doc_lengths[docno])
+        sources.append((segment, alive, doc_ids))
+        fingerprints.append(np.fromfile(os.path.join(segment.index_dir, "fingerprints.bin"), dtype=np.uint64)[alive])
+
+    # Terms by number, in dictionary order, without looking each one up
+    for segment, alive, doc_ids in sources:
+        for term in range(len(segment.terms)):
+            keyword = segment.terms[term]
+            docs, counts = segment.decode_postings(term)
+            docs = np.frombuffer(docs, dtype=np.int64)
+            keep = alive[docs]
+            for docno, count in zip(docs[keep].tolist(), np.frombuffer(counts, dtype=np.int64)[keep].tolist()):
+                index.add_posting(keyword, doc_ids[docno], count)
+            positional = segment.decode_positions(term) if segment.has_positions else None
+            if positional is not None:
+                docs, position_counts, positions = positional
+                ends = np.cumsum(position_counts).tolist()
+                position_counts, positions = position_counts.tolist(), positions.tolist()
+                for i in np.flatnonzero(alive[docs]).tolist():
+                    index.add_positions(keyword, doc_ids[docs[i]], positions[ends[i] - position_counts[i]:ends[i]])
+    meta = write_index(index.finalize(), out_dir)
+    # Every live document has an entity, so the new document numbers follow the interning order
+    np.concatenate(fingerprints).tofile(os.path.join(out_dir, "fingerprints.bin"))
+    return meta
+
+
+def merge(root, max_segments=8, max_deleted=0.3):
+    """
+    Merge and compact segments by merge_plan and publish the result.
+
+    Call with the write lock held.
+
+    Returns:
+        dict: The published manifest, or None when nothing needed merging
+    """
+    previous = read_manifest(root)
+    plan = merge_plan(previous, max_segments, max_deleted)
+    if not plan:
+        return None
+    generation = previous["generation"] + 1
+    segments = list(previous["segments"])
+    # Replace from the back so earlier positions stay valid
+    for number, positions in sorted(enumerate(plan), key=lambda item: -item[1][0]):
+        name = f"seg-{generation:06d}-{number}"
+        started = time.perf_counter()
+        meta = _rewrite(root, [segments[position] for position in positions], os.path.join(root, name))
+        logger.info(f"Merged {len(positions)} segment(s) into {name}: {meta['num_docs']:,} documents "
+                    f"in {time.perf_counter() - started:.1f}s")
+        segments[positions[0]:positions[-1] + 1] = [
+            {"name": name, "num_docs": meta["num_docs"], "deleted": None, "num_deleted": 0}
+        ]
+    return _publish(root, previous, segments, previous["source"])
+
+
+class SegmentedIndex(BaseIndex):
+    """
+    Read-only view over the segments of one manifest generation.
+
+    Document numbers are global: each segment's numbers are offset by the documents of
+    the segments before it. Postings are gathered from every segment with the
+    tombstoned documents removed, and idf and the BM25 statistics count live documents
+    only.
+    """
+
+    def __init__(self, root, manifest=None, opened=None):
+        manifest = manifest or read_manifest(root)
+        opened = opened or {}
+        self.root = root
+        self.generation = manifest["generation"]
+        self.names = []
+        self.segments = []
+        self.alive = []
+        self.bases = []
+        base = 0
+        for entry in manifest["segments"]:
+            segment = opened.get(entry["name"]) or DiskIndex(os.path.join(root, entry["name"]))
+            alive = np.ones(len(segment), dtype=bool)
+            alive[_tombstones(root, entry)] = False
+            self.names.append(entry["name"])
+            self.segments.append(segment)
+            self.alive.append(alive)
+            self.bases.append(base)
+            base += len(segment)
+        self.size = base
+
+        lengths = [np.frombuffer(segment.doc_lengths, dtype=np.int32) for segment in self.segments]
+        self.doc_lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int32)
+        live = np.concatenate(self.alive) if self.alive else np.zeros(0, dtype=bool)
+        self.num_docs = int(live.sum())
+        total_length = int(self.doc_lengths[live].sum())
+        self.avg_doc_length = total_length / self.num_docs if self.num_docs and total_length else 1.0
+        self.has_positions = bool(self.segments) and all(segment.has_positions for segment in self.segments)
+        self._fingerprints = [None] * len(self.segments)
+        self._terms = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _merged(self, keyword):
+        # (docs, counts, max count) of the live postings in all segments, or None
+        with self._lock:
+            if keyword in self._terms:
+                self._terms.move_to_end(keyword)
+                return self._terms[keyword]
+        docs_parts, counts_parts = [], []
+        for segment, alive, base in zip(self.segments, self.alive, self.bases):
+            postings = segment.postings(keyword)
+            if postings is None:
+                continue
+            docs = np.frombuffer(postings[0], dtype=np.int64)
+            keep = alive[docs]
+            docs_parts.append(docs[keep] + base)
+            counts_parts.append(np.frombuffer(postings[1], dtype=np.int64)[keep])
+        merged = None
+        if docs_parts and sum(len(docs) for docs in docs_parts):
+            counts = np.concatenate(counts_parts)
+            merged = (array('q', np.concatenate(docs_parts).tobytes()), array('q', counts.tobytes()), int(counts.max()))
+        with self._lock:
+            self._terms[keyword] = merged
+            while len(self._terms) > _TERM_CACHE_SIZE:
+                self._terms.popitem(last=False)
+        return merged
+
+    def postings(self, keyword):
+        merged = self._merged(keyword)
+        return None if merged is None else merged[:2]
+
+    def __contains__(self, keyword):
+        return self._merged(keyword) is not None
+
+    def term_positions(self, keyword):
+        if not self.has_positions:
+            return None
+        docs_parts, counts_parts, positions_parts = [], [], []
+        for segment, alive, base in zip(self.segments, self.alive, self.bases):
+            positional = segment.term_positions(keyword)
+            if positional is None:
+                continue
+            docs, counts, positions = positional
+            keep = alive[docs]
+            docs_parts.append(docs[keep] + base)
+            counts_parts.append(counts[keep])
+            positions_parts.append(positions[np.repeat(keep, counts)])
+        if not docs_parts or not sum(len(docs) for docs in docs_parts):
+            return None
+        return np.concatenate(docs_parts), np.concatenate(counts_parts), np.concatenate(positions_parts)
+
+    def max_count(self, keyword):
+        return self._merged(keyword)[2]
+
+    def document_frequency(self, keyword):
+        merged = self._merged(keyword)
+        return 0 if merged is None else len(merged[0])
+
+    def idf(self, keyword):
+        return bm25_idf(self.num_docs, self.document_frequency(keyword))
+
+    def _locate(self, docno):
+        i = bisect.bisect_right(self.bases, docno) - 1
+        return self.segments[i], docno - self.bases[i]
+
+    def doc_id(self, docno):
+        segment, local = self._locate(docno)
+        return segment.doc_id(local)
+
+    def document(self, docno):
+        segment, local = self._locate(docno)
+        return segment.document(local)
+
+    def docno(self, doc_id):
+        for i in range(len(self.segments) - 1, -1, -1):
+            local = self.segments[i].docno(doc_id)
+            if local is not None and self.alive[i][local]:
+                return self.bases[i] + local
+        return None
+
+    def contains(self, doc_ids):
+        """
+        Return a boolean array telling which of the document ids have a live copy.
+        """
+        found = np.zeros(len(doc_ids), dtype=bool)
+        pending = np.arange(len(doc_ids))
+        # The newest segment holding an id has its only possibly live copy
+        for i in range(len(self.segments) - 1, -1, -1):
+            if not len(pending):
+                break
+            held = self.segments[i].documents.contains([doc_ids[j] for j in pending.tolist()])
+            alive = self.alive[i]
+            if alive.all():
+                found[pending[held]] = True
+            else:
+                for k in np.flatnonzero(held).tolist():
+                    found[pending[k]] = alive[self.segments[i].docno(doc_ids[pending[k]])]
+            pending = pending[~held]
+        return found
+
+    def live_ids(self):
+        """
+        Yield the id of every live document.
+        """
+        for segment, alive in zip(self.segments, self.alive):
+            for docno in np.flatnonzero(alive).tolist():
+                yield segment.doc_id(docno)
+
+    def fingerprint(self, doc_id):
+        """
+        Return the content fingerprint of a document's live copy, or None if it has none.
+        """
+        docno = self.docno(doc_id)
+        if docno is None:
+            return None
+        i = bisect.bisect_right(self.bases, docno) - 1
+        if self._fingerprints[i] is None:
+            path = os.path.join(self.segments[i].index_dir, "fingerprints.bin")
+            self._fingerprints[i] = np.fromfile(path, dtype=np.uint64)
+        return int(self._fingerprints[i][docno - self.bases[i]])
+
+
+_indexes = {}
+_checked = {}
+_lock = threading.Lock()
+
+
+def get_index(root):
+    """
+    Return this process's SegmentedIndex of root, reopening it when a new generation was published.
+    """
+    from django.conf import settings
+    now = time.monotonic()
+    index = _indexes.get(root)
+    if index is not None and now - _checked[root] < settings.SEARCH_INDEX_REFRESH:
+        return index
+    with _lock:
+        index = _indexes.get(root)
+        if index is not None and now - _checked[root] < settings.SEARCH_INDEX_REFRESH:
+            return index
+        _checked[root] = now
+        try:
+            manifest = read_manifest(root)
+            if index is None or manifest["generation"] != index.generation:
+                # Segments never change under a name, so the mapped ones are reused
+                opened = dict(zip(index.names, index.segments)) if index is not None else {}
+                index = _indexes[root] = SegmentedIndex(root, manifest, opened)
+                logger.info(f"Mapped segmented search index at {root}, generation {index.generation}: "
+                            f"{len(index.segments)} segments, {index.num_docs:,} documents")
+        except (OSError, ValueError) as e:
+            # E.g. a segment removed by a newer generation before it was mapped; retry later
+            logger.error(f"Failed to map segmented search index at {root}: {e}")
+    return index
@@ -1,3 +1,767 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import math
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.test import Client, SimpleTestCase, override_settings
+
+from .dense_index import fuse
+from .disk_index import DiskIndex, write_index
+from .opinions import _exported, changed_since, iter_json_array
+from .result_cache import RankedResults
+from .search_engine import InMemoryIndex
+from .text_store import TextStore, TextStoreWriter, snippet, train_dictionary
+from .vocabulary import Vocabulary, write_vocabulary
+from . import keywords, mongo, offline_keywords, packed_postings, result_cache, search_engine, segments, views
+
+WORDS = [
+    "custody", "visitation", "adoption", "guardian", "support", "appeal", "court", "parent",
+    "child", "trust", "estate", "divorce", "alimony", "relocation", "testimony", "evidence",
+]
+
+
+def make_opinions(count, seed):
+    """
+    Deterministic opinions: {"doc_id", "url", "title", "tokens"}.
+    """
+    rng = random.Random(seed)
+    opinions = []
+    for i in range(count):
+        tokens = [rng.choice(WORDS) for _ in range(rng.randint(3, 40))]
+        opinions.append({"doc_id": f"{seed:04d}{i:08d}", "url": f"https://x/{seed}/{i}",
+                         "title": f"Case {seed}-{i}", "tokens": tokens})
+    return opinions
+
+
+def build_index(opinions, orphans=()):
+    """
+    InMemoryIndex with unigram counts and positions, plus postings of orphans (no entity).
+    """
+    index = InMemoryIndex()
+    for opinion in opinions:
+        index.intern_document(opinion["doc_id"], opinion["url"], opinion["title"], len(opinion["tokens"]))
+        positions = {}
+        for position, token in enumerate(opinion["tokens"]):
+            positions.setdefault(token, []).append(position)
+        for token, token_positions in positions.items():
+            index.add_posting(token, opinion["doc_id"], len(token_positions))
+            index.add_positions(token, opinion["doc_id"], token_positions)
+    for doc_id in orphans:
+        index.add_posting("custody", doc_id, 5)
+    return index.finalize()
+
+
+def write_json(opinions, data_dir):
+    """
+    Write opinions as the JSON lines files of scripts/index_opinions.py.
+    """
+    os.makedirs(data_dir)
+    with open(os.path.join(data_dir, "document_entities.json"), 'w') as entities, \
+            open(os.path.join(data_dir, "keyword_postings.json"), 'w') as postings:
+        for opinion in opinions:
+            entities.write(json.dumps({"id": opinion["doc_id"], "url": opinion["url"], "title": opinion["title"],
+                                       "length": len(opinion["tokens"])}) + "\n")
+            counts = {}
+            for token in opinion["tokens"]:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.write(json.dumps({"keyword": token, "id": opinion["doc_id"], "count": count}) + "\n")
+    return data_dir
+
+
+def comparable(results):
+    """
+    Results as a doc id ordered list; document numbers (the tie-break) differ between
+    indexes of the same documents.
+    """
+    return sorted(
+        (result["docId"], result["distinctMatches"], result["totalScore"], sorted(result["matchedKeywords"]),
+         round(result.get("bm25", 0.0), 9))
+        for result in results
+    )
+
+
+QUERIES = [
+    ["custody"],
+    ["custody", "visitation"],
+    ["adoption", "guardian", "appeal", "trust"],
+    ["estate", "nonexistent"],
+    ["custody|guardian", "appeal"],
+    ['"child support"', "court"],
+    ['"custody appeal"~4', "evidence", "divorce"],
+]
+
+
+class TempDirTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+
+class DiskIndexRoundTripTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.opinions = make_opinions(300, seed=1)
+        self.memory = build_index(self.opinions, orphans=["orphan-1", "orphan-2"])
+        write_index(self.memory, os.path.join(self.tmp, "index"))
+        self.disk = DiskIndex(os.path.join(self.tmp, "index"))
+
+    def test_documents_round_trip(self):
+        self.assertEqual(len(self.disk), len(self.opinions))
+        for opinion in self.opinions:
+            docno = self.disk.docno(opinion["doc_id"])
+            self.assertIsNotNone(docno)
+            self.assertEqual(self.disk.document(docno), (opinion["doc_id"], opinion["url"], opinion["title"]))
+            self.assertEqual(self.disk.doc_lengths[docno], len(opinion["tokens"]))
+        self.assertIsNone(self.disk.docno("orphan-1"))
+        ids = [self.opinions[0]["doc_id"], "orphan-1", self.opinions[-1]["doc_id"] + "0", "", "~"]
+        self.assertEqual(self.disk.documents.contains(ids).tolist(), [True, False, False, False, False])
+        self.assertEqual(self.disk.documents.contains([]).tolist(), [])
+        self.assertAlmostEqual(self.disk.avg_doc_length, self.memory.avg_doc_length)
+
+    def test_terms_round_trip(self):
+        self.assertEqual(sorted(self.disk.terms), sorted(self.memory.terms))
+        for keyword in self.memory.terms:
+            memory_docs, memory_counts = self.memory.postings(keyword)
+            disk_docs, disk_counts = self.disk.postings(keyword)
+            self.assertEqual(
+                [(self.disk.doc_id(docno), count) for docno, count in zip(disk_docs, disk_counts)],
+                [(self.memory.doc_id(docno), count) for docno, count in zip(memory_docs, memory_counts)],
+            )
+            self.assertEqual(self.disk.max_count(keyword), self.memory.max_count(keyword))
+            self.assertEqual(self.disk.document_frequency(keyword), self.memory.document_frequency(keyword))
+            self.assertAlmostEqual(self.disk.idf(keyword), self.memory.idf(keyword))
+
+    def test_positions_round_trip(self):
+        self.assertTrue(self.disk.has_positions)
+        for keyword in WORDS:
+            memory_docs, memory_sizes, memory_positions = self.memory.term_positions(keyword)
+            disk_docs, disk_sizes, disk_positions = self.disk.term_positions(keyword)
+            self.assertEqual(list(disk_sizes), list(memory_sizes))
+            self.assertEqual(list(disk_positions), list(memory_positions))
+            self.assertEqual([self.disk.doc_id(d) for d in disk_docs], [self.memory.doc_id(d) for d in memory_docs])
+
+    def test_searches_match(self):
+        for keywords in QUERIES:
+            with self.subTest(keywords=keywords):
+                self.assertEqual(comparable(self.disk.search(keywords)), comparable(self.memory.search(keywords)))
+                self.assertEqual(comparable(self.disk.search_bm25(keywords)),
+                                 comparable(self.memory.search_bm25(keywords)))
+
+
+class SearchTopKTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = build_index(make_opinions(500, seed=2))
+
+    def test_top_k_is_prefix_of_search(self):
+        rng = random.Random(3)
+        queries = QUERIES + [rng.sample(WORDS, rng.randint(1, 6)) for _ in range(30)]
+        for keywords in queries:
+            full = self.index.search(keywords)
+            for k in (1, 5, 10, 100, 1000):
+                with self.subTest(keywords=keywords, k=k):
+                    results, exhausted = self.index.search_top_k(keywords, k)
+                    self.assertEqual(results, full[:k])
+                    if exhausted:
+                        self.assertEqual(len(results), len(full))
+
+    def test_no_matches(self):
+        self.assertEqual(self.index.search_top_k(["nonexistent"], 10), ([], True))
+
+
+class SegmentedIndexTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = os.path.join(self.tmp, "segments")
+        os.makedirs(self.root)
+        self.current = {}
+        self.fingerprints = {}
+        self.deleted = set()
+        self.runs = 0
+
+    def run_update(self, opinions, deleted=()):
+        """
+        Publish one incremental run: the given opinions are added or replace their
+        previous versions, the deleted ids are removed.
+        """
+        self.runs += 1
+        replaced = [opinion["doc_id"] for opinion in opinions if opinion["doc_id"] in self.current]
+        replaced += [doc_id for doc_id in deleted if doc_id in self.current]
+        for doc_id in deleted:
+            self.current.pop(doc_id, None)
+            self.deleted.add(doc_id)
+        for opinion in opinions:
+            self.current[opinion["doc_id"]] = opinion
+        data_dir = write_json(opinions, os.path.join(self.tmp, f"delta-{self.runs}")) if opinions else None
+        fingerprints = {opinion["doc_id"]: self.runs for opinion in opinions}
+        self.fingerprints.update(fingerprints)
+        with segments.write_lock(self.root):
+            segments.add_segment(self.root, data_dir, fingerprints, replaced, {"last_id": str(self.runs), "scraped_at": None})
+
+    def assert_matches_rebuild(self):
+        full_dir = os.path.join(self.tmp, f"full-{self.runs}")
+        write_index(build_index(list(self.current.values())), full_dir)
+        full = DiskIndex(full_dir)
+        segmented = segments.SegmentedIndex(self.root)
+        self.assertEqual(segmented.num_docs, full.num_docs)
+        self.assertAlmostEqual(segmented.avg_doc_length, full.avg_doc_length)
+        self.assertEqual(sorted(segmented.live_ids()), sorted(self.current))
+        self.assertEqual(segments.read_manifest(self.root)["source"]["last_id"], str(self.runs))
+        gone = sorted(self.deleted - set(self.current))
+        self.assertEqual(segmented.contains(list(self.current) + gone).tolist(), [True] * len(self.current) + [False] * len(gone))
+        for doc_id in self.current:
+            self.assertEqual(segmented.document(segmented.docno(doc_id)), full.document(full.docno(doc_id)))
+            self.assertEqual(segmented.fingerprint(doc_id), self.fingerprints[doc_id])
+        for doc_id in gone:
+            self.assertIsNone(segmented.fingerprint(doc_id))
+        for keywords in QUERIES:
+            if any(keyword.startswith('"') for keyword in keywords):
+                continue   # the deltas are written without positions
+            with self.subTest(keywords=keywords, generation=segments.read_manifest(self.root)["generation"]):
+                self.assertEqual(comparable(segmented.search(keywords)), comparable(full.search(keywords)))
+                self.assertEqual(comparable(segmented.search_bm25(keywords)), comparable(full.search_bm25(keywords)))
+                self.assertEqual(
+                    [(r["distinctMatches"], r["totalScore"]) for r in segmented.search_top_k(keywords, 10)[0]],
+                    [(r["distinctMatches"], r["totalScore"]) for r in full.search_top_k(keywords, 10)[0]],
+                )
+
+    def test_incremental_runs_and_merges_match_rebuild(self):
+        base = make_opinions(200, seed=4)
+        self.run_update(base)
+        self.assert_matches_rebuild()
+
+        # Changed, added and deleted documents
+        changed = [dict(opinion, tokens=opinion["tokens"][::-1] + ["relocation"]) for opinion in base[:30]]
+        self.run_update(changed + make_opinions(40, seed=5), deleted=[opinion["doc_id"] for opinion in base[150:170]])
+        self.assert_matches_rebuild()
+
+        # A run with deletions only
+        self.run_update([], deleted=[opinion["doc_id"] for opinion in base[30:60]])
+        self.assert_matches_rebuild()
+
+        self.run_update(make_opinions(10, seed=6))
+        self.assert_matches_rebuild()
+
+        with segments.write_lock(self.root):
+            manifest = segments.merge(self.root, max_segments=1, max_deleted=0.1)
+        self.assertEqual(len(manifest["segments"]), 1)
+        self.assertEqual(manifest["segments"][0]["num_deleted"], 0)
+        self.assert_matches_rebuild()
+
+    def test_merge_plan(self):
+        def manifest(*sizes, deleted=None):
+            deleted = deleted or [0] * len(sizes)
+            return {"segments": [{"num_docs": size, "num_deleted": gone} for size, gone in zip(sizes, deleted)]}
+
+        self.assertEqual(segments.merge_plan(manifest()), [])
+        self.assertEqual(segments.merge_plan(manifest(100)), [])
+        self.assertEqual(segments.merge_plan(manifest(100, 10)), [])
+        self.assertEqual(segments.merge_plan(manifest(100, 10, 10)), [[1, 2]])
+        self.assertEqual(segments.merge_plan(manifest(100, 10, 5, 5), max_segments=8), [[1, 2, 3]])
+        self.assertEqual(segments.merge_plan(manifest(100, 50, 10), max_segments=2), [[1, 2]])
+        self.assertEqual(segments.merge_plan(manifest(100, 10, deleted=[50, 0])), [[0]])
+
+
+class ChangedSinceTests(SimpleTestCase):
+    def test_yields_opinions_added_or_scraped_after_the_mark(self):
+        opinions = [
+            {"doc_id": "65a000000000000000000001", "scraped_at": None},
+            {"doc_id": "65a000000000000000000002", "scraped_at": [100, 1]},
+            {"doc_id": "65a000000000000000000003", "scraped_at": [200, 4]},
+            {"doc_id": "65a000000000000000000004", "scraped_at": [150, 2]},
+        ]
+        mark = {"last_id": None, "scraped_at": None}
+        self.assertEqual(list(changed_since(opinions, None, mark)), opinions)
+        self.assertEqual(mark, {"last_id": "65a000000000000000000004", "scraped_at": [200, 4]})
+
+        since = {"last_id": "65a000000000000000000003", "scraped_at": [150, 2]}
+        mark = dict(since)
+        changed = [opinion["doc_id"][-1] for opinion in changed_since(opinions, since, mark)]
+        self.assertEqual(changed, ["3", "4"])
+        self.assertEqual(mark, {"last_id": "65a000000000000000000004", "scraped_at": [200, 4]})
+
+        mark = dict(mark)
+        self.assertEqual(list(changed_since(opinions, mark, mark)), [])
+
+    def test_scraped_at_from_extended_json(self):
+        opinion = _exported({"_id": {"$oid": "65a0"}, "textBlock": "x", "scrapedAt": {"$timestamp": {"t": 7, "i": 3}}})
+        self.assertEqual(opinion["scraped_at"], [7, 3])
+        self.assertIsNone(_exported({"_id": {"$oid": "65a0"}})["scraped_at"])
+
+
+class IterJsonArrayTests(SimpleTestCase):
+    def test_elements_split_at_every_read_size(self):
+        values = [-25000000000.0, 1e-7, 12345678901234, True, None, "a, b]", {"c": [1, 2.5e10]}, [3, -4], 0, 1E+300]
+        for text in (json.dumps(values), json.dumps(values, indent=2)):
+            for read_size in range(1, 40):
+                with self.subTest(read_size=read_size):
+                    self.assertEqual(list(iter_json_array(io.StringIO(text), read_size)), values)
+
+    def test_number_continued_in_next_read(self):
+        self.assertEqual(list(iter_json_array(io.StringIO("[-25000000000.0]"), 7)), [-25000000000.0])
+
+    def test_truncated_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('[{"a": 1}, 2'), 4))
+
+
+class SharedCacheTestCase(TempDirTestCase):
+    """
+    Runs with the shared cache in files under a temporary directory.
+    """
+
+    def setUp(self):
+        super().setUp()
+        override = self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                       'LOCATION': os.path.join(self.tmp, "cache")},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class KeywordCacheTests(SharedCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+        patcher = mock.patch.object(keywords, "extract_keywords_llm", self.fake_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(keywords._local.entries.clear)
+        keywords._local.entries.clear()
+
+    def fake_llm(self, query):
+        with self.calls_lock:
+            self.calls += 1
+        time.sleep(0.2)
+        return ["custody", query.split()[-1]]
+
+    def stats_delta(self, before):
+        after = keywords.cache_stats()
+        return {name: after[name] - before[name] for name in ("local_hits", "shared_hits", "misses", "coalesced")}
+
+    def test_hit_and_miss_counters(self):
+        before = keywords.cache_stats()
+        self.assertEqual(keywords.llm_keywords("Who gets custody?"), ["custody", "custody?"])
+        self.assertEqual(keywords.llm_keywords("who gets   CUSTODY"), ["custody", "custody?"])
+        keywords._local.entries.clear()
+        keywords.llm_keywords("Who gets custody?")
+        self.assertEqual(self.stats_delta(before), {"local_hits": 1, "shared_hits": 1, "misses": 1, "coalesced": 0})
+        self.assertEqual(self.calls, 1)
+
+    def test_single_flight_within_process(self):
+        before = keywords.cache_stats()
+        threads = [threading.Thread(target=keywords.llm_keywords, args=("visitation schedule",)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.stats_delta(before)["coalesced"], 4)
+
+    def test_waits_for_other_worker(self):
+        key = keywords._cache_key("relocation")
+        self.assertTrue(keywords._acquire(f"{key}:lock"))
+
+        def other_worker():
+            time.sleep(0.2)
+            caches["shared"].set(key, ["relocation"])
+            keywords._release(f"{key}:lock")
+
+        threading.Thread(target=other_worker).start()
+        self.assertEqual(keywords._extract_and_store("relocation", key), ["relocation"])
+        self.assertEqual(self.calls, 0)
+
+    def test_takes_over_lock_released_without_answer(self):
+        key = keywords._cache_key("alimony")
+        lock_key = f"{key}:lock"
+        self.assertTrue(keywords._acquire(lock_key))
+        threading.Timer(0.1, keywords._release, args=(lock_key,)).start()
+        self.assertEqual(keywords._extract_and_store("alimony", key), ["custody", "alimony"])
+        self.assertEqual(self.calls, 1)
+        self.assertFalse(keywords._held(lock_key))
+
+    def test_does_not_release_lock_it_did_not_take(self):
+        key = keywords._cache_key("estate")
+        lock_key = f"{key}:lock"
+        self.assertTrue(keywords._acquire(lock_key))
+        with self.settings(KEYWORD_CACHE_LOCK_TIMEOUT=0.2):
+            self.assertEqual(keywords._extract_and_store("estate", key), ["custody", "estate"])
+        self.assertTrue(keywords._held(lock_key))
+
+    def test_file_lock(self):
+        lock_key = "keywords:test:lock"
+        self.assertTrue(keywords._acquire(lock_key))
+        self.assertFalse(keywords._acquire(lock_key))
+        self.assertTrue(keywords._held(lock_key))
+        keywords._release(lock_key)
+        self.assertFalse(keywords._held(lock_key))
+        self.assertTrue(keywords._acquire(lock_key))
+
+        # A lock left by a crashed worker expires
+        path = os.path.join(self.tmp, "cache", "keyword-locks", lock_key.replace(":", "-"))
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+        self.assertTrue(keywords._acquire(lock_key))
+        self.assertFalse(keywords._acquire(lock_key))
+
+    def test_all_worker_counters_add_up_worker_files(self):
+        stats_dir = os.path.join(self.tmp, "cache", "keyword-stats")
+        os.makedirs(stats_dir)
+        with open(os.path.join(stats_dir, "other-worker.json"), 'w') as f:
+            json.dump({"shared_hits": 2, "misses": 3, "llm_calls": 3}, f)
+        own = {name: keywords.cache_stats()[name] for name in keywords._STATS_KEYS}
+        keywords.llm_keywords("guardian ad litem")
+        totals = keywords.cache_stats()["all_workers"]
+        self.assertEqual(totals, {"shared_hits": own["shared_hits"] + 2, "misses": own["misses"] + 4,
+                                  "llm_calls": own["llm_calls"] + 4})
+
+
+def hex_opinions(count, seed):
+    """
+    make_opinions with ObjectId-like ids, in id order.
+    """
+    return [dict(opinion, doc_id=f"{seed:08x}{i:016x}") for i, opinion in enumerate(make_opinions(count, seed))]
+
+
+class BM25Tests(SimpleTestCase):
+    def test_hand_computed_scores(self):
+        index = build_index([
+            {"doc_id": "a", "url": "u", "title": "t", "tokens": ["custody", "custody", "appeal"]},
+            {"doc_id": "b", "url": "u", "title": "t", "tokens": ["appeal", "court"]},
+            {"doc_id": "c", "url": "u", "title": "t", "tokens": ["court", "court", "court", "court"]},
+        ])
+        k1, b, avgdl = 1.2, 0.75, 3.0
+        idf_custody = math.log(1 + (3 - 1 + 0.5) / (1 + 0.5))
+        idf_appeal = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+
+        def weight(idf, tf, length):
+            return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+
+        results = index.search_bm25(["custody", "appeal"])
+        self.assertEqual([result["docId"] for result in results], ["a", "b"])
+        self.assertAlmostEqual(results[0]["bm25"], weight(idf_custody, 2, 3) + weight(idf_appeal, 1, 3))
+        self.assertAlmostEqual(results[1]["bm25"], weight(idf_appeal, 1, 2))
+        self.assertEqual(results[0]["matchedKeywords"], ["custody", "appeal"])
+        self.assertEqual((results[0]["distinctMatches"], results[0]["totalScore"]), (2, 3))
+        self.assertEqual(index.search_bm25(["custody", "appeal"], limit=1), results[:1])
+
+    def test_matched_keywords_beyond_float_precision(self):
+        # Keyword bits past 2**53 used to be lost when the masks were summed as floats
+        words = [f"w{i:03d}" for i in range(80)]
+        index = build_index([
+            {"doc_id": "a", "url": "u", "title": "t", "tokens": words},
+            {"doc_id": "b", "url": "u", "title": "t", "tokens": words[::7] + ["custody"]},
+        ])
+        results = {result["docId"]: result for result in index.search_bm25(words)}
+        for expected in index.search(words):
+            self.assertEqual(results[expected["docId"]]["matchedKeywords"], expected["matchedKeywords"])
+        self.assertEqual(len(results["a"]["matchedKeywords"]), 80)
+
+
+class PhraseTests(TempDirTestCase):
+    @staticmethod
+    def occurrences(opinion, first, second):
+        tokens = opinion["tokens"]
+        return sum(1 for i in range(len(tokens) - 1) if tokens[i] == first and tokens[i + 1] == second)
+
+    @staticmethod
+    def minimal_windows(opinion, first, second, window):
+        # For two words a minimal window is a pair of neighbouring occurrences of different words
+        events = [(i, token) for i, token in enumerate(opinion["tokens"]) if token in (first, second)]
+        return sum(1 for (p, u), (q, v) in zip(events, events[1:]) if u != v and q - p < window)
+
+    def test_phrase_and_proximity_match_brute_force(self):
+        opinions = make_opinions(300, seed=7)
+        memory = build_index(opinions)
+        write_index(memory, os.path.join(self.tmp, "index"))
+        disk = DiskIndex(os.path.join(self.tmp, "index"))
+        for index in (memory, disk):
+            for first, second in (("custody", "appeal"), ("child", "support"), ("court", "court")):
+                expected = {opinion["doc_id"]: self.occurrences(opinion, first, second) for opinion in opinions}
+                phrase = f'"{first} {second}"'
+                with self.subTest(index=type(index).__name__, phrase=phrase):
+                    found = {result["docId"]: result["totalScore"] for result in index.search([phrase])}
+                    self.assertEqual(found, {doc_id: count for doc_id, count in expected.items() if count})
+            for window in (1, 2, 5):
+                expected = {opinion["doc_id"]: self.minimal_windows(opinion, "custody", "evidence", window)
+                            for opinion in opinions}
+                proximity = f'"custody evidence"~{window}'
+                with self.subTest(index=type(index).__name__, proximity=proximity):
+                    found = {result["docId"]: result["totalScore"] for result in index.search([proximity])}
+                    self.assertEqual(found, {doc_id: count for doc_id, count in expected.items() if count})
+
+
+class VocabularyTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        write_vocabulary(os.path.join(self.tmp, "vocabulary"), {
+            "custody": 50, "custodial": 20, "custodian": 5, "foster parents": 9, "foster parent": 2,
+            "visitation": 30, "visitation rights": 12, "vacation": 3, "appeal": 40,
+        })
+        self.vocabulary = Vocabulary(os.path.join(self.tmp, "vocabulary"))
+
+    def test_resolution_steps(self):
+        resolve = self.vocabulary.resolve
+        self.assertEqual(resolve("appeal", 3), ["appeal"])
+        self.assertEqual(resolve("Appeal", 3), ["appeal"])
+        self.assertEqual(resolve("foster parentes", 3), ["foster parents", "foster parent"])
+        self.assertEqual(resolve("visitaton rights", 3), ["visitation rights"])
+        self.assertEqual(resolve("custod*", 3), ["custody", "custodial", "custodian"])
+        self.assertEqual(resolve("custod*", 2), ["custody", "custodial"])
+        self.assertEqual(resolve("zebra", 3), [])
+
+    def test_group_keyword_ranks_as_one_keyword(self):
+        index = build_index([
+            {"doc_id": "a", "url": "u", "title": "t", "tokens": ["custody", "custodial", "appeal"]},
+            {"doc_id": "b", "url": "u", "title": "t", "tokens": ["custodian", "custodian"]},
+        ])
+        results = {result["docId"]: result for result in index.search(["custodial|custodian|custody", "appeal"])}
+        self.assertEqual(results["a"]["distinctMatches"], 2)
+        self.assertEqual(results["a"]["totalScore"], 3)
+        self.assertEqual(results["b"]["distinctMatches"], 1)
+        self.assertEqual(results["b"]["totalScore"], 2)
+
+    def test_offline_keywords_rank_by_document_frequency(self):
+        with mock.patch.object(search_engine, "get_index", return_value=None), \
+                mock.patch("backend.vocabulary.get_vocabulary", return_value=self.vocabulary):
+            self.assertEqual(offline_keywords.extract_keywords("custody appeal, visitation rights"),
+                             ["visitation rights", "visitation", "appeal", "custody"])
+
+
+class OfflineKeywordsMongoTests(SimpleTestCase):
+    def extract(self, postings):
+        collection = mock.Mock()
+        collection.distinct.return_value = ["custody"]
+        with mock.patch.object(search_engine, "get_index", return_value=None), \
+                mock.patch("backend.vocabulary.get_vocabulary", return_value=None), \
+                mock.patch.object(mongo, postings, return_value=collection), \
+                mock.patch.object(mongo, "keyword_postings" if postings == "packed_postings" else "packed_postings",
+                                  side_effect=AssertionError("wrong postings collection")):
+            return offline_keywords.extract_keywords("custody appeal")
+
+    @override_settings(MONGO_POSTINGS='packed')
+    def test_packed_postings_vocabulary(self):
+        self.assertEqual(self.extract("packed_postings"), ["custody"])
+
+    @override_settings(MONGO_POSTINGS='documents')
+    def test_keyword_postings_vocabulary(self):
+        self.assertEqual(self.extract("keyword_postings"), ["custody"])
+
+
+class PackedPostingsTests(SimpleTestCase):
+    def test_rank_matches_index_order(self):
+        opinions = hex_opinions(400, seed=8)
+        index = build_index(opinions)
+        queries = [keywords for keywords in QUERIES if not any(keyword.startswith('"') for keyword in keywords)]
+        with mock.patch.object(packed_postings, "CHUNK_SIZE", 7):
+            for keywords in queries:
+                documents = []
+                for keyword in keywords:
+                    for term in keyword.split("|"):
+                        postings = index.postings(term)
+                        if postings is not None:
+                            pairs = [(index.doc_id(docno), count) for docno, count in zip(*postings)]
+                            # Chunks may arrive in any order
+                            documents[:0] = packed_postings.pack(term, pairs)
+                with self.subTest(keywords=keywords):
+                    for limit in (5, 100000):
+                        self.assertEqual(packed_postings.rank(documents, keywords, limit), index.search(keywords, limit))
+
+    def test_extended_json_round_trip(self):
+        document = packed_postings.pack("custody", [("65a000000000000000000002", 3), ("65a000000000000000000001", 300)])[0]
+        encoded = json.loads(packed_postings.to_extended_json(document))
+        decoded = dict(encoded, **{field: base64.b64decode(encoded[field]["$binary"]["base64"])
+                                   for field in ("docs", "counts")})
+        docs, counts = packed_postings.decode(decoded)
+        self.assertEqual([doc.tobytes().hex() for doc in docs], ["65a000000000000000000001", "65a000000000000000000002"])
+        self.assertEqual(counts.tolist(), [300, 3])
+
+
+class FuseTests(SimpleTestCase):
+    def test_reciprocal_rank_fusion(self):
+        keyword_results = [
+            {"docId": doc_id, "distinctMatches": 1, "totalScore": 1, "matchedKeywords": ["custody"], "bm25": 1.0}
+            for doc_id in ("a", "b", "c")
+        ]
+        fused = fuse(keyword_results, [("c", 0.9), ("d", 0.8)], k=60)
+        self.assertEqual([entry["docId"] for entry in fused], ["c", "a", "b", "d"])
+        self.assertAlmostEqual(fused[0]["score"], 1 / 63 + 1 / 61)
+        self.assertAlmostEqual(fused[1]["score"], 1 / 61)
+        self.assertAlmostEqual(fused[3]["score"], 1 / 62)
+        self.assertEqual(fused[3]["matchedKeywords"], [])
+        self.assertNotIn("bm25", fused[0])
+        self.assertIn("bm25", keyword_results[2])
+
+
+class TextStoreTests(TempDirTestCase):
+    def test_round_trip_across_blocks(self):
+        rng = random.Random(9)
+        texts = {f"{i:024x}": " ".join(rng.choice(WORDS + ["é", "§", "—"]) for _ in range(rng.randint(0, 3000)))
+                 for i in range(60)}
+        store_dir = os.path.join(self.tmp, "texts")
+        writer = TextStoreWriter(store_dir, zdict=train_dictionary(list(texts.values())[:20]))
+        for doc_id, text in texts.items():
+            writer.add(doc_id, text)
+        meta = writer.close()
+        self.assertGreater(meta["num_blocks"], 1)
+        store = TextStore(store_dir)
+        self.assertEqual(len(store), len(texts))
+        for doc_id, text in reversed(list(texts.items())):
+            self.assertEqual(store.text(doc_id), text)
+        self.assertIsNone(store.text("missing"))
+
+    def test_snippet_escapes_and_marks_whole_words(self):
+        text = "<b>Intro</b> & preamble. " + "filler " * 60 + "The Custody order & custodial <script> rights."
+        result = snippet(text, ["custody", "rights"], length=80)
+        self.assertIn("<mark>Custody</mark>", result)
+        self.assertIn("<mark>rights</mark>", result)
+        self.assertIn("&lt;script&gt;", result)
+        self.assertIn("&amp;", result)
+        self.assertNotIn("<mark>custodial", result)
+        self.assertNotIn("<script>", result)
+        self.assertTrue(result.startswith("…"))
+        self.assertEqual(snippet("<i>a</i> text", ["zebra"]), "&lt;i&gt;a&lt;/i&gt; text")
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        override = self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'results-default'},
+            'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'results-shared'},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(caches['shared'].clear)
+
+    def ranked(self, keyword, count=50):
+        results = [
+            {"docId": f"{i:024x}", "distinctMatches": 1, "totalScore": i + 1,
+             "matchedKeywords": [keyword] + (["custody"] if i % 2 else []), "bm25": i / 4}
+            for i in range(count)
+        ]
+        return results, RankedResults.from_results([keyword, "custody"], "bm25", results)
+
+    def test_round_trip(self):
+        results, ranked = self.ranked("appeal")
+        key = result_cache.store("Appeal of a custody order?", ranked)
+        loaded = result_cache.load(result_cache.lookup_key("appeal of a  custody order", "bm25"))
+        self.assertEqual(result_cache.lookup_key("appeal of a  custody order", "bm25"), key)
+        for result in results:
+            result["distinctMatches"] = len(result["matchedKeywords"])
+            result["matchedKeywords"] = sorted(result["matchedKeywords"])
+        self.assertEqual(loaded[:], results)
+        self.assertEqual(loaded[3:5], results[3:5])
+
+    def test_wide_keyword_masks(self):
+        keywords = [f"keyword {i:02d}" for i in range(70)]
+        results = [{"docId": "not-an-object-id", "distinctMatches": 3, "totalScore": 3,
+                    "matchedKeywords": [keywords[0], keywords[37], keywords[69]]}]
+        ranked = RankedResults.from_results(keywords, "matches", results)
+        self.assertEqual(ranked[0], results[0])
+
+    def test_byte_ledger_evicts_least_recently_used(self):
+        entries = [self.ranked(f"keyword {i}")[1] for i in range(4)]
+        size = max(len(pickle.dumps(ranked, pickle.HIGHEST_PROTOCOL)) for ranked in entries)
+        with self.settings(RESULT_CACHE_MAX_BYTES=int(2.5 * size)):
+            first = result_cache.store(None, entries[0])
+            second = result_cache.store(None, entries[1])
+            self.assertIsNotNone(result_cache.load(first))   # first is now the most recently used
+            third = result_cache.store(None, entries[2])
+            self.assertIsNone(result_cache.load(second))
+            self.assertIsNotNone(result_cache.load(first))
+            self.assertIsNotNone(result_cache.load(third))
+            ledger = caches['shared'].get(result_cache._LEDGER_KEY)
+            self.assertEqual(list(ledger), [first, third])
+            self.assertLessEqual(sum(ledger.values()), 2.5 * size)
+
+    def test_foreign_keys_are_misses(self):
+        caches['shared'].set("keywords:x", ["custody"])
+        self.assertIsNone(result_cache.load("keywords:x"))
+        self.assertIsNone(result_cache.load(result_cache._LEDGER_KEY))
+        self.assertIsNone(result_cache.load(None))
+
+
+class ResultCacheLedgerLockTests(SharedCacheTestCase):
+    def ranked(self, i):
+        results = [{"docId": f"{j:024x}", "distinctMatches": 1, "totalScore": 1, "matchedKeywords": [f"k{i}"]}
+                   for j in range(20)]
+        return RankedResults.from_results([f"k{i}"], "matches", results)
+
+    def test_concurrent_stores_are_all_recorded(self):
+        threads = [threading.Thread(target=result_cache.store, args=(None, self.ranked(i))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ledger = caches['shared'].get(result_cache._LEDGER_KEY)
+        self.assertEqual(len(ledger), 8)
+
+    def test_held_lock_skips_the_update_until_it_expires(self):
+        shared = caches['shared']
+        self.assertTrue(result_cache._take_lock(shared))
+        with mock.patch.object(result_cache, "_LEDGER_LOCK_WAIT", 0.05):
+            key = result_cache.store(None, self.ranked(0))
+            self.assertIsNotNone(result_cache.load(key))
+            self.assertIsNone(shared.get(result_cache._LEDGER_KEY))
+            # A lock left by a worker that died is taken over once it is older than the timeout
+            with mock.patch.object(result_cache, "_LEDGER_LOCK_TIMEOUT", 0):
+                time.sleep(0.01)
+                result_cache.store(None, self.ranked(0))
+        self.assertEqual(list(shared.get(result_cache._LEDGER_KEY)), [key])
+        self.assertTrue(result_cache._take_lock(shared))
+        result_cache._drop_lock(shared)
+
+
+class SearchStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.index = build_index(make_opinions(300, seed=10))
+        previous = search_engine.get_index()
+        search_engine.set_index(self.index)
+        self.addCleanup(search_engine.set_index, previous)
+        override = self.settings(SEARCH_STREAM_CHUNK=4, SEARCH_STREAM_MAX_CHUNK=8)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_chunks_grow_and_stop_at_limit(self):
+        for ranking in ("matches", "bm25"):
+            expected = (self.index.search_bm25 if ranking == "bm25" else self.index.search)(["custody", "appeal"])
+            with self.subTest(ranking=ranking):
+                chunks = list(views._ranked_chunks("q", ["custody", "appeal"], ranking, 25, 4))
+                self.assertEqual([len(chunk) for chunk in chunks], [4, 8, 8, 5])
+                self.assertEqual([entry["docId"] for chunk in chunks for entry in chunk],
+                                 [result["docId"] for result in expected[:25]])
+
+    def test_stream_events(self):
+        with mock.patch.object(keywords, "extract_keywords", return_value=["custody"]):
+            response = Client().get("/api/SearchStream", {"query": "custody", "limit": 10})
+            events = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(events[0], {"type": "keywords", "keywords": ["custody"]})
+        self.assertEqual([(event["offset"], len(event["items"])) for event in events[1:-1]], [(0, 4), (4, 6)])
+        self.assertEqual(events[-1], {"type": "done", "totalItems": 10})
+        urls = [item["url"] for event in events[1:-1] for item in event["items"]]
+        self.assertEqual(urls, [self.index.document(self.index.docno(result["docId"]))[1]
+                                for result in self.index.search(["custody"], 10)])
+
+    def test_invalid_limit(self):
+        for limit in ("0", "-3", "ten"):
+            with self.subTest(limit=limit):
+                self.assertEqual(Client().get("/api/SearchStream", {"query": "x", "limit": limit}).status_code, 400)
+
+    def test_invalid_pagination(self):
+        for params in ({"limit": "0"}, {"limit": "-1"}, {"page": "0"}, {"page": "-2"}, {"page": "two"}):
+            with self.subTest(params=params):
+                self.assertEqual(Client().get("/api/results/", dict(params, query="x")).status_code, 400)
+        self.assertEqual(Client().get("/api/results/", {"query": "x", "page": 1, "limit": 1}).status_code, 200)
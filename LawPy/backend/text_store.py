@@ -0,0 +1,307 @@
+"""
+Compressed store of the opinion texts, with random access by document id, for snippets.
+
+Texts are appended in blocks of about BLOCK_SIZE bytes of UTF-8 (an opinion longer than
+that gets a block of its own), each block compressed with zlib against a preset
+dictionary built from frequent phrases of a sample of the opinions, so even a single
+short opinion compresses well. Reading one opinion decompresses only its block; the
+last few decompressed blocks are kept per process.
+
+Text store directory layout (written by scripts/build_text_store.py):
+    meta.json           format version, byte order, counts and sizes
+    zdict.bin           zlib preset dictionary
+    blocks.bin          compressed blocks, concatenated
+    blocks.idx          uint64 offsets into blocks.bin (num_blocks + 1)
+    doc_ids.bin/.idx    document ids, offset-indexed, in storage order
+    doc_id_order.bin    int32 storage numbers sorted by document id (id lookup)
+    locations.bin       uint32 (block, start, end) per document: its bytes in the
+                        decompressed block
+
+snippet() picks the passage with the most distinct keyword words and highlights them.
+"""
+
+from array import array
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+import html
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import zlib
+
+from .disk_index import _Column, _map, _write_column
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+BLOCK_SIZE = 64 * 1024
+DICTIONARY_SIZE = 32 * 1024
+_BLOCK_CACHE_SIZE = 64
+_WORD = re.compile(r"[a-z]+")
+
+
+def train_dictionary(samples, size=DICTIONARY_SIZE, phrase_words=4):
+    """
+    Build a zlib preset dictionary from frequent word sequences of sample texts.
+
+    zlib has no dictionary trainer; phrases occurring in many samples make a good
+    dictionary, with the most frequent ones last (closest to the data, cheapest to refer to).
+
+    Args:
+        samples (iterable): Sample texts
+        size (int): Dictionary size in bytes (zlib uses at most 32 KB)
+        phrase_words (int): Words per phrase
+
+    Returns:
+        bytes: The dictionary
+    """
+    counts = Counter()
+    for text in samples:
+        words = text.split()
+        counts.update({" ".join(words[i:i + phrase_words]) + " " for i in range(len(words) - phrase_words + 1)})
+    chosen = []
+    used = 0
+    for phrase, count in counts.most_common():
+        if count < 2:
+            break
+        encoded = phrase.encode('utf-8')
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+class TextStoreWriter:
+    """
+    Writes a text store directory: add() each opinion, then close().
+
+    The directory is written next to out_dir and renamed into place on close().
+    """
+
+    def __init__(self, out_dir, zdict=b"", level=9):
+        self.out_dir = out_dir
+        self.tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.zdict = zdict
+        self.level = level
+        self.blocks = open(os.path.join(self.tmp_dir, "blocks.bin"), 'wb')
+        self.block_offsets = array('Q', [0])
+        self.locations = array('I')
+        self.doc_ids = []
+        self.pending = bytearray()
+        self.raw_bytes = 0
+
+    def add(self, doc_id, text):
+        encoded = (text or "").encode('utf-8')
+        if self.pending and len(self.pending) + len(encoded) > BLOCK_SIZE:
+            self._flush()
+        start = len(self.pending)
+        self.pending += encoded
+        self.locations.extend((len(self.block_offsets) - 1, start, len(self.pending)))
+        self.doc_ids.append(doc_id)
+        self.raw_bytes += len(encoded)
+
+    def _flush(self):
+        compressor = zlib.compressobj(self.level, zdict=self.zdict) if self.zdict else zlib.compressobj(self.level)
+        block = compressor.compress(bytes(self.pending)) + compressor.flush()
+        self.blocks.write(block)
+        self.block_offsets.append(self.block_offsets[-1] + len(block))
+        self.pending = bytearray()
+
+    def close(self):
+        """
+        Finish the store and move it into place.
+
+        Returns:
+            dict: The meta.json contents
+        """
+        if self.pending:
+            self._flush()
+        self.blocks.close()
+        with open(os.path.join(self.tmp_dir, "blocks.idx"), 'wb') as f:
+            self.block_offsets.tofile(f)
+        with open(os.path.join(self.tmp_dir, "locations.bin"), 'wb') as f:
+            self.locations.tofile(f)
+        with open(os.path.join(self.tmp_dir, "zdict.bin"), 'wb') as f:
+            f.write(self.zdict)
+        _write_column(self.tmp_dir, "doc_ids", self.doc_ids)
+        with open(os.path.join(self.tmp_dir, "doc_id_order.bin"), 'wb') as f:
+            array('i', sorted(range(len(self.doc_ids)), key=lambda i: self.doc_ids[i].encode('utf-8'))).tofile(f)
+        meta = {
+            "version": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "num_docs": len(self.doc_ids),
+            "num_blocks": len(self.block_offsets) - 1,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.block_offsets[-1] + len(self.zdict),
+            "created": time.time()
+        }
+        with open(os.path.join(self.tmp_dir, "meta.json"), 'w') as f:
+            json.dump(meta, f)
+
+        if os.path.exists(self.out_dir):
+            old_dir = f"{self.out_dir}.old-{os.getpid()}"
+            os.rename(self.out_dir, old_dir)
+            os.rename(self.tmp_dir, self.out_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.rename(self.tmp_dir, self.out_dir)
+        return meta
+
+
+class TextStore:
+    """
+    Read-only view over a text store directory.
+    """
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported text store format version {self.meta['version']} in {store_dir}")
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"Text store {store_dir} was written on a {self.meta['byteorder']}-endian host")
+        with open(os.path.join(store_dir, "zdict.bin"), 'rb') as f:
+            self.zdict = f.read()
+        self.blocks = _map(os.path.join(store_dir, "blocks.bin"))
+        self.block_offsets = memoryview(_map(os.path.join(store_dir, "blocks.idx"))).cast('Q')
+        self.locations = memoryview(_map(os.path.join(store_dir, "locations.bin"))).cast('I')
+        self.doc_ids = _Column(store_dir, "doc_ids")
+        self.doc_id_order = memoryview(_map(os.path.join(store_dir, "doc_id_order.bin"))).cast('i')
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.meta["num_docs"]
+
+    def _number(self, doc_id):
+        key = doc_id.encode('utf-8')
+        lo, hi = 0, len(self.doc_id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.doc_ids.raw(self.doc_id_order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.doc_id_order) and self.doc_ids.raw(self.doc_id_order[lo]) == key:
+            return self.doc_id_order[lo]
+        return None
+
+    def _block(self, number):
+        with self._lock:
+            block = self._blocks.get(number)
+            if block is not None:
+                self._blocks.move_to_end(number)
+                return block
+        data = self.blocks[self.block_offsets[number]:self.block_offsets[number + 1]]
+        decompressor = zlib.decompressobj(zdict=self.zdict) if self.zdict else zlib.decompressobj()
+        block = decompressor.decompress(data) + decompressor.flush()
+        with self._lock:
+            self._blocks[number] = block
+            while len(self._blocks) > _BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return block
+
+    def text(self, doc_id):
+        """
+        Return the opinion text of a document id, or None if it is not in the store.
+        """
+        number = self._number(doc_id)
+        if number is None:
+            return None
+        block, start, end = self.locations[3 * number:3 * number + 3]
+        return self._block(block)[start:end].decode('utf-8')
+
+
+@lru_cache(maxsize=1024)
+def _keyword_pattern(words):
+    # Longest first, so a word is not cut short by one of its prefixes
+    alternatives = "|".join(sorted(map(re.escape, words), key=len, reverse=True))
+    return re.compile(r"\b(?:" + alternatives + r")\b", re.IGNORECASE)
+
+
+def snippet(text, keywords, length=240):
+    """
+    The passage of about length characters with the most distinct keyword words, HTML-escaped,
+    with those words wrapped in <mark>.
+
+    Keywords are matched word by word (indexed phrases have their stop words removed),
+    case-insensitively and on whole words. Without any match the opening of the text is used.
+    """
+    words = frozenset(word for keyword in keywords for word in _WORD.findall(keyword.lower()) if len(word) > 1)
+    pattern = _keyword_pattern(words) if words else None
+
+    start = 0
+    if pattern is not None:
+        # Slide a window of half the snippet over the matches and keep the first one with
+        # the most distinct words, stopping as soon as one has all the words the text contains
+        lowered = text.lower()
+        present = sum(1 for word in words if word in lowered)
+        best_position, best_count = None, 0
+        window = deque()
+        seen = Counter()
+        for match in pattern.finditer(text):
+            word = match.group(0).lower()
+            window.append((match.start(), word))
+            seen[word] += 1
+            while match.start() - window[0][0] > length // 2:
+                _, dropped = window.popleft()
+                seen[dropped] -= 1
+                if not seen[dropped]:
+                    del seen[dropped]
+            if len(seen) > best_count:
+                best_position, best_count = window[0][0], len(seen)
+                if best_count >= present:
+                    break
+        if best_position is not None:
+            start = max(0, best_position - length // 4)
+            if start:
+                space = text.find(" ", start, best_position)
+                start = space + 1 if space >= 0 else start
+    end = min(len(text), start + length)
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > start else end
+
+    parts = ["…"] if start else []
+    position = start
+    if pattern is not None:
+        for match in pattern.finditer(text, start, end):
+            parts.append(html.escape(text[position:match.start()]))
+            parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+            position = match.end()
+    parts.append(html.escape(text[position:end]))
+    if end < len(text):
+        parts.append("…")
+    return "".join(parts)
+
+
+_store = None
+_store_lock = threading.Lock()
+_loaded = False
+
+
+def get_text_store():
+    """
+    Map the text store at TEXT_STORE_DIR on first use; None when it is not configured.
+    """
+    global _store, _loaded
+    from django.conf import settings
+    if _loaded:
+        return _store
+    with _store_lock:
+        if not _loaded and settings.TEXT_STORE_DIR:
+            try:
+                _store = TextStore(settings.TEXT_STORE_DIR)
+                logger.info(f"Mapped text store at {settings.TEXT_STORE_DIR}: {len(_store):,} opinions")
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to map text store at {settings.TEXT_STORE_DIR}: {e}")
+        _loaded = True
+    return _store
@@ -0,0 +1,168 @@
+"""
+Per-stage latency instrumentation for the query path.
+
+Code on the request path wraps its stages in `with timing.stage("rank"):` and reports
+sizes with timing.record("docs", n). TimingMiddleware collects both for the current
+request (held in a context variable, so it follows the request into sync_to_async
+threads) and returns them in a Server-Timing header. Every stage duration and size is
+also added to per-process histograms, served by the metrics view.
+
+The cost per stage is two perf_counter() calls and a short locked update.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is unbounded)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+_current = contextvars.ContextVar("lawpy_timings", default=None)
+_lock = threading.Lock()
+_histograms = {}    # stage -> {"count", "sum_ms", "max_ms", "buckets"}
+_sizes = {}         # size name -> {"count", "sum", "max"}
+
+
+class RequestTimings:
+    def __init__(self):
+        self.stages = []    # (stage, milliseconds), in the order they finished
+        self.sizes = {}
+
+
+def _observe(name, ms):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {
+                "count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(BUCKETS_MS) + 1)
+            }
+        histogram["count"] += 1
+        histogram["sum_ms"] += ms
+        histogram["max_ms"] = max(histogram["max_ms"], ms)
+        histogram["buckets"][bisect_left(BUCKETS_MS, ms)] += 1
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the enclosed block as a stage of the current request.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        _observe(name, ms)
+        timings = _current.get()
+        if timings is not None:
+            timings.stages.append((name, ms))
+
+
+def record(name, value):
+    """
+    Record a size (keywords, postings scanned, documents matched, bytes cached, ...).
+    """
+    with _lock:
+        size = _sizes.get(name)
+        if size is None:
+            size = _sizes[name] = {"count": 0, "sum": 0, "max": 0}
+        size["count"] += 1
+        size["sum"] += value
+        size["max"] = max(size["max"], value)
+    timings = _current.get()
+    if timings is not None:
+        timings.sizes[name] = timings.sizes.get(name, 0) + value
+
+
+def server_timing(timings, total_ms):
+    """
+    Format a request's stages and sizes as a Server-Timing header value.
+    """
+    parts = [f"{name};dur={ms:.1f}" for name, ms in timings.stages]
+    parts.extend(f'{name};desc="{value}"' for name, value in timings.sizes.items())
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+class TimingMiddleware:
+    """
+    Collect stage timings for each request and return them in a Server-Timing header.
+
+    Works for sync and async views. For streamed responses only the stages that ran
+    before the headers were sent are included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, response, timings, started, token):
+        _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+        if timings.stages:
+            # Only requests that went through an instrumented stage count towards "request"
+            _observe("request", total_ms)
+            response["Server-Timing"] = server_timing(timings, total_ms)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _current.reset(token)
+            raise
+        return self._finish(response, timings, started, token)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            _current.reset(token)
+            raise
+        return self._finish(response, timings, started, token)
+
+
+def _percentile(histogram, fraction):
+    # Upper bound of the bucket holding the requested rank (max_ms for the last bucket)
+    rank = fraction * histogram["count"]
+    seen = 0
+    for i, count in enumerate(histogram["buckets"]):
+        seen += count
+        if count and seen >= rank:
+            return BUCKETS_MS[i] if i < len(BUCKETS_MS) else histogram["max_ms"]
+    return 0.0
+
+
+def snapshot():
+    """
+    Histograms of stage latencies and size statistics for this process.
+
+    Returns:
+        dict: {"buckets_ms": bounds, "stages": {...}, "sizes": {...}}
+    """
+    with _lock:
+        histograms = {name: dict(h, buckets=list(h["buckets"])) for name, h in _histograms.items()}
+        sizes = {name: dict(s) for name, s in _sizes.items()}
+    for histogram in histograms.values():
+        histogram["mean_ms"] = histogram["sum_ms"] / histogram["count"]
+        for label, fraction in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            histogram[label] = _percentile(histogram, fraction)
+    for size in sizes.values():
+        size["mean"] = size["sum"] / size["count"]
+    return {"buckets_ms": list(BUCKETS_MS), "stages": histograms, "sizes": sizes}
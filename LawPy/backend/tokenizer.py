@@ -0,0 +1,142 @@
+"""
+Python mirror of the text processing in scripts/process_opinions.py (process_batch).
+
+Cleaning, tokenisation, stop-word removal and the unigram/bigram/trigram filters
+follow the Spark job step for step, including its quirks (Spark's Tokenizer keeps the
+empty tokens left behind by single-letter removal, and they break n-gram adjacency),
+so terms produced here are spelled exactly like the indexed keywords.
+"""
+
+from collections import Counter
+import re
+
+# StopWordsRemover.loadDefaultStopWords("english")
+STOP_WORDS = frozenset("""
+i me my myself we our ours ourselves you your yours yourself yourselves he him his
+himself she her hers herself it its itself they them their theirs themselves what which
+who whom this that these those am is are was were be been being have has had having do
+does did doing a an the and but if or because as until while of at by for with about
+against between into through during before after above below to from up down in out on
+off over under again further then once here there when where why how all any both each
+few more most other some such no nor not only own same so than too very s t can will
+just don should now i'll you'll he'll she'll we'll they'll i'd you'd he'd she'd we'd
+they'd i'm you're he's she's it's we're they're i've we've you've they've isn't aren't
+wasn't weren't haven't hasn't hadn't don't doesn't didn't won't wouldn't shan't
+shouldn't mustn't can't couldn't cannot could here's how's let's ought that's there's
+what's when's where's who's why's would
+""".split())
+
+# Joins the indexed terms one query keyword expands to ("custodial|custodian|custody",
+# see vocabulary.resolve_keywords); the engines match any of them and count the group as
+# one keyword
+GROUP_SEPARATOR = "|"
+
+# ASCII semantics for \s and \b, as in Java regular expressions
+_URLS = re.compile(r'http\S+|www\S+|https\S+', re.ASCII)
+_NON_ALPHA = re.compile(r'[^a-zA-Z\s]', re.ASCII)
+_WHITESPACE = re.compile(r'\s+', re.ASCII)
+_EDGE_SPACE = re.compile(r'^\s+|\s+$', re.ASCII)
+_SINGLE_LETTER = re.compile(r'\b[a-z]\b', re.ASCII)
+_SPLIT = re.compile(r'\s', re.ASCII)
+_MULTI_SPACE = re.compile(r'\s{2,}', re.ASCII)
+
+
+def clean_text(text):
+    """
+    Lowercase, strip URLs and non-letters, normalise whitespace, drop single letters.
+    """
+    text = _URLS.sub('', text.lower())
+    text = _NON_ALPHA.sub(' ', text)
+    text = _WHITESPACE.sub(' ', text)
+    text = _EDGE_SPACE.sub('', text)
+    return _SINGLE_LETTER.sub(' ', text)
+
+
+def tokenize(text):
+    """
+    Return the filtered word list process_batch builds for a document.
+
+    Like Spark's Tokenizer (Java String.split on single whitespace characters), empty
+    tokens are kept except at the end of the list.
+    """
+    words = _SPLIT.split(clean_text(text))
+    while words and words[-1] == '':
+        words.pop()
+    return [word for word in words if word not in STOP_WORDS]
+
+
+def ngrams(words, n):
+    return [' '.join(words[i:i + n]) for i in range(len(words) - n + 1)]
+
+
+def _split_size(keyword):
+    # Spark SQL split(keyword, " ") keeps trailing empty strings
+    return len(keyword.split(' '))
+
+
+def keep_unigram(keyword):
+    return len(keyword) > 1
+
+
+def keep_bigram(keyword):
+    return len(keyword) > 3 and _split_size(keyword) == 2
+
+
+def keep_trigram(keyword):
+    return (
+        len(keyword) > 5
+        and _split_size(keyword) == 3
+        and not _MULTI_SPACE.search(keyword)
+        and not _SINGLE_LETTER.search(keyword)
+    )
+
+
+def document_terms(text, with_ngrams=True):
+    """
+    Count the unigram, bigram and trigram keywords process_batch indexes for a document.
+
+    Returns:
+        tuple: (Counter of keyword -> count, document length in tokens)
+    """
+    words = tokenize(text)
+    counts = Counter(word for word in words if keep_unigram(word))
+    if with_ngrams:
+        # keep_bigram/keep_trigram applied to the words instead of the joined phrases (tokens
+        # are lowercase letters or empty): a phrase always splits into n parts, a trigram has
+        # a double space exactly when its middle word is empty, and contains a single-letter
+        # word exactly when one of its words has length 1
+        counts.update(
+            f"{first} {second}" for first, second in zip(words, words[1:])
+            if len(first) + len(second) > 2
+        )
+        counts.update(
+            f"{first} {second} {third}" for first, second, third in zip(words, words[1:], words[2:])
+            if second and len(first) + len(second) + len(third) > 3
+            and len(first) != 1 and len(second) != 1 and len(third) != 1
+        )
+    length = sum(1 for word in words if len(word) > 1)
+    return counts, length
+
+
+def word_positions(text):
+    """
+    Token positions of each unigram keyword, as process_batch collects them with --positions.
+
+    Returns:
+        dict: keyword -> sorted list of positions in the filtered word list
+    """
+    positions = {}
+    for position, word in enumerate(tokenize(text)):
+        if keep_unigram(word):
+            positions.setdefault(word, []).append(position)
+    return positions
+
+
+def group_terms(keyword):
+    """
+    Return the indexed terms of a query keyword: the alternatives of an expansion group,
+    or the keyword itself.
+    """
+    if keyword.startswith('"') or GROUP_SEPARATOR not in keyword:
+        return [keyword]
+    return keyword.split(GROUP_SEPARATOR)
@@ -3,7 +3,11 @@ from . import views
 
 urlpatterns =[
     path('api/SubmitQuery',views.SubmitQuery,name="QuerySubmission"),
+    path('api/SubmitQueryAsync',views.SubmitQueryAsync,name="AsyncQuerySubmission"),
+    path('api/SearchStream',views.SearchStream,name="SearchStream"),
     path('test-mongodb/', views.test_mongodb, name="test-mongodb"),
     path('api/TestView',views.TestView,name="TestView"),
     path('api/results/',views.paginated_results,name="paginatedResults"),
+    path('api/stats',views.stats,name="stats"),
+    path('api/metrics',views.metrics,name="metrics"),
 ]
\ No newline at end of file
@@ -5,15 +5,14 @@ from rest_framework.views import APIView
 from rest_framework.decorators import api_view
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
-from pymongo import MongoClient
-from openai import OpenAI
 import json
-import os
 import logging
 from django.core.paginator import Paginator
-from django.core.cache import cache
+from asgiref.sync import sync_to_async
+from . import dense_index, doc_table, documents, keywords, mongo, packed_postings, result_cache, search_engine, timing, vocabulary
+from .tokenizer import group_terms, tokenize
 
 logger = logging.getLogger(__name__)
 # from .models import 
@@ -29,25 +28,85 @@ logger = logging.getLogger(__name__)
 
 # @csrf_exempt #add if doesnt work?
 
-def connect_to_mongodb(host: str = None) -> MongoClient:
-    try:
-        if host is None:
-            host = os.environ.get('MONGODB_HOST', 'localhost')
-            host = f"mongodb://{host}:27017"
-        client = MongoClient(host)
-        # Test the connection
-        client.admin.command('ping')
-        print(f"Successfully connected to MongoDB at {host}")
-        return client
-    except Exception as e:
-        print(f"Error connecting to MongoDB: {e}")
-        raise
+def _query_terms(keywords):
+    """
+    The indexed terms of the query keywords, with group keywords expanded.
+    """
+    return list(dict.fromkeys(term for keyword in keywords for term in group_terms(keyword)))
+
+def _matched_keyword(keywords):
+    """
+    Expression mapping a posting's term back to the query keyword (group) it came from.
+    """
+    branches = [
+        {"case": {"$in": ["$keyword", group_terms(keyword)]}, "then": keyword}
+        for keyword in keywords
+        if len(group_terms(keyword)) > 1
+    ]
+    if not branches:
+        return "$keyword"
+    return {"$switch": {"branches": branches, "default": "$keyword"}}
+
+def _match_pipeline(keywords, limit):
+    """
+    Aggregation over keyword_postings ranking documents by distinct matches, then total count.
+    """
+    return [
+        {
+            "$match": {
+                "keyword": {"$in": _query_terms(keywords)}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$id",  # Group by the document id field
+                "id": {"$first": "$id"},  # Preserve the id field for matching
+                "matchedKeywords": {"$addToSet": _matched_keyword(keywords)},
+                "totalScore": {"$sum": "$count"}
+            }
+        },
+        {
+            "$addFields": {
+                "distinctMatches": {"$size": "$matchedKeywords"}
+            }
+        },
+        {
+            "$sort": {
+                "distinctMatches": -1,  # First by number of distinct keywords matched
+                "totalScore": -1        # Then by total count (frequency)
+            }
+        },
+        {
+            "$limit": limit
+        }
+    ]
 
-def search_documents(client: MongoClient, keywords, limit: int = 100000, debug: bool = False):
+def _match_entry(doc):
+    return {
+        "docId": doc["id"],
+        "distinctMatches": doc["distinctMatches"],
+        "totalScore": doc["totalScore"],
+        "matchedKeywords": doc["matchedKeywords"]
+    }
+
+def _with_entity(entries):
+    """
+    The ranked entries whose document has an entity: one vectorised lookup in the
+    document table, or one $in on document_entities when there is none.
+    """
+    doc_ids = [entry["docId"] for entry in entries]
+    table = doc_table.get_table()
+    if table is not None:
+        known = table.contains(doc_ids).tolist()
+    else:
+        with timing.stage("entity_lookup"):
+            found = {doc["id"] for doc in mongo.document_entities().find({"id": {"$in": doc_ids}}, {"id": 1, "_id": 0})}
+        known = [doc_id in found for doc_id in doc_ids]
+    return [entry for entry, keep in zip(entries, known) if keep]
+
+def search_documents(keywords, limit: int = 100000, debug: bool = False):
     try:
-        db = client["lawpy"]
-        keywords_collection = db["keyword_postings"]
-        documents_collection = db["document_entities"]
+        keywords_collection = mongo.keyword_postings()
 
         # Print sample documents from each collection for debugging
         # if debug:
@@ -63,179 +122,236 @@ def search_documents(client: MongoClient, keywords, limit: int = 100000, debug:
         #         print(f"  '{keyword}': {count} occurrences")
 
         # First pipeline to get matching documents
-        pipeline = [
-            {
-                "$match": {
-                    "keyword": {"$in": keywords}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$id",  # Group by the document id field
-                    "id": {"$first": "$id"},  # Preserve the id field for matching
-                    "matchedKeywords": {"$addToSet": "$keyword"},
-                    "totalScore": {"$sum": "$count"}
-                }
-            },
-            {
-                "$addFields": {
-                    "distinctMatches": {"$size": "$matchedKeywords"}
-                }
-            },
-            {
-                "$sort": {
-                    "distinctMatches": -1,  # First by number of distinct keywords matched
-                    "totalScore": -1        # Then by total count (frequency)
-                }
-            },
-            {
-                "$limit": limit
-            }
-        ]
+        pipeline = _match_pipeline(keywords, limit)
 
         # Execute first pipeline to get top documents
-        matched_docs = list(keywords_collection.aggregate(pipeline))
+        with timing.stage("aggregate"):
+            matched_docs = list(keywords_collection.aggregate(pipeline))
 
         if debug:
-            print("\nAggregation pipeline results (before URL lookup):")
             for doc in matched_docs:
-                print(f"ID: {doc['id']}, Keywords: {doc['matchedKeywords']}, Score: {doc['totalScore']}")
+                logger.debug(f"Matched {doc['id']}: keywords {doc['matchedKeywords']}, score {doc['totalScore']}")
 
         if not matched_docs:
-            print("No matching documents found")
             return []
 
-        # Get document IDs from the matched documents
-        doc_ids = [doc["id"] for doc in matched_docs]
+        # Only ids and scores: url and title are looked up for the page being shown.
+        # Postings without an entity are dropped before anything is counted or paginated
+        return _with_entity([_match_entry(doc) for doc in matched_docs])
+
+    except Exception:
+        logger.exception("Error executing search")
+        raise
+
+def search_packed(keywords, limit: int = 100000):
+    """
+    Rank documents from the packed_postings collection (backend/packed_postings.py).
 
-        # Second query to get URLs for the matched document IDs
-        url_docs = list(documents_collection.find(
-            {"id": {"$in": doc_ids}},
-            {"id": 1, "url": 1,"title":1, "_id": 0}
+    Fetches one binary document per keyword chunk and decodes, merges and ranks the
+    postings here, in the same order as search_documents.
+    """
+    with timing.stage("fetch_packed"):
+        packed = list(mongo.packed_postings().find(
+            {"keyword": {"$in": _query_terms(keywords)}},
+            {"_id": 0, "keyword": 1, "df": 1, "docs": 1, "counts": 1}
         ))
+    timing.record("postings", sum(doc["df"] for doc in packed))
+    with timing.stage("merge_packed"):
+        results = packed_postings.rank(packed, keywords, limit)
+
+    return _with_entity(results) if results else results
+
+def _search_mongo(keywords, limit: int = 100000):
+    if settings.MONGO_POSTINGS == 'packed':
+        return search_packed(keywords, limit)
+    return search_documents(keywords, limit)
+
+def _ranking(requested):
+    """
+    Ranking requested by the client ('matches', 'bm25' or 'hybrid'), or the configured default.
+    """
+    if requested in ('matches', 'bm25', 'hybrid'):
+        return requested
+    return settings.SEARCH_RANKING
+
+def _search_hybrid(query, keywordList, index):
+    """
+    Keyword ranking (BM25 with an in-process index) fused with the dense vector ranking of
+    the question and keywords; the keyword ranking alone when no dense index is configured.
+    """
+    depth = settings.DENSE_FUSION_DEPTH
+    if index is not None:
+        keyword_results = index.search_bm25(keywordList, depth)
+    else:
+        keyword_results = _search_mongo(keywordList, depth)
+    dense = dense_index.get_dense_index()
+    hits = []
+    if dense is not None:
+        words = [word for text in [query, *keywordList] for word in tokenize(text) if len(word) > 1]
+        with timing.stage("dense"):
+            hits = dense.search(words, depth, settings.DENSE_NPROBE)
+    return dense_index.fuse(keyword_results, hits)
+
+def _keyword_list(keywordSet):
+    """
+    Normalised keywords, mapped onto indexed terms when a vocabulary is configured.
+    """
+    keywordList = sorted({result_cache.normalize_keyword(keyword) for keyword in keywordSet})
+    if vocabulary.get_vocabulary() is not None:
+        with timing.stage("vocabulary"):
+            keywordList = vocabulary.resolve_keywords(keywordList)
+    return keywordList
+
+def search_and_cache(query, keywordSet, ranking):
+    """
+    Rank documents for the extracted keywords and cache them for paginated_results.
+
+    Shared by SubmitQuery and the async endpoint, which runs it in a worker thread.
+    Results are cached as packed document ids and scores under the normalised keyword
+    set (backend/result_cache.py).
+
+    Returns:
+        JsonResponse: The SubmitQuery response, with the resultsKey to page through
+    """
+    keywordList = _keyword_list(keywordSet)
+    timing.record("keywords", len(keywordList))
+    try:
+        index = search_engine.get_index()
+        exhausted = True
+        if index is not None:
+            timing.record("postings", sum(
+                index.document_frequency(term) for keyword in keywordList for term in group_terms(keyword)
+            ))
+        with timing.stage("rank"):
+            if ranking == 'hybrid':
+                results = _search_hybrid(query, keywordList, index)
+            elif index is not None and settings.SEARCH_TOP_K:
+                # Rank only the first pages now; deeper pages continue the ranking on demand
+                cursor = search_engine.TopKCursor(keywordList, window=settings.SEARCH_TOP_K, ranking=ranking)
+                cursor.fetch(index, settings.SEARCH_TOP_K)
+                results, exhausted = cursor.results, cursor.exhausted
+            elif index is not None and ranking == 'bm25':
+                results = index.search_bm25(keywordList)
+            elif index is not None:
+                results = index.search(keywordList)
+            else:
+                # BM25 needs the index statistics; MongoDB only supports the match ranking
+                results = _search_mongo(keywordList)
         
-        if debug:
-            print("\nDocument URLs found:")
-            for doc in url_docs:
-                print(f"ID: {doc['id']}, URL: {doc['url']}")
-
-        # Create a mapping of document ID to URL
-        url_mapping = {doc["id"]: doc["url"] for doc in url_docs}
-        title_mapping = {doc["id"]: doc.get("title","") for doc in url_docs}
-
-        # Combine results
-        final_results = []
-        for doc in matched_docs:
-            if doc["id"] in url_mapping:
-                final_results.append({
-                    "docId": doc["id"],
-                    "url": url_mapping[doc["id"]],
-                    "title":title_mapping[doc["id"]],
-                    "distinctMatches": doc["distinctMatches"],
-                    "totalScore": doc["totalScore"],
-                    "matchedKeywords": doc["matchedKeywords"]
-                })
-
-        return final_results
+        # print("\nSearch Results:")
+        # print("==============")
+        # for idx, result in enumerate(results, 1):
+        #     print(f"\nResult {idx}:")
+        #     pprint.pprint(result)
+            
+    except Exception:
+        logger.exception("Error in main execution")
+        return JsonResponse({'message': 'MongoDB Extraction Error'}, status=400)
 
-    except Exception as e:
-        print(f"Error executing search: {e}")
-        raise
+    timing.record("docs", len(results))
+    if results:
+        with timing.stage("pack"):
+            ranked = result_cache.RankedResults.from_results(keywordList, ranking, results, exhausted)
+        with timing.stage("cache_set"):
+            key = result_cache.store(query, ranked)
+        return JsonResponse({'message':'Query returned results successfully', 'resultsKey': key},status=200)
+    return JsonResponse({'message' : 'No results'},status = 200)
 
 @csrf_exempt
 @api_view(['POST'])
 def SubmitQuery(request):
     if request.method == 'POST':
         query = request.data.get('query')
-        
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-        prompt = f"""Role: You are a case-law search engine assistant.
-
-            Task: From the user's question, extract 5-10 key legal search terms.
-
-            Requirements:
-            - Return ONLY a JSON array of lowercase keywords
-            - No explanations or other text
-            - Each term should be specific and useful for legal search
-            - Avoid generic terms like "case" or "law" unless part of a specific phrase
-
-            Input: {query}"""
+        ranking = _ranking(request.data.get('ranking'))
         
         keywordSet = set()
         
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a legal keyword extractor. Respond only with a JSON object containing an array of keywords under the 'keywords' key."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.4  # Lower temperature for more consistent output
-            )
-            # Get the response content
-            content = response.choices[0].message.content
-            # print(f"Raw response: {content}")
-            
-            # Parse the JSON response
-            response_data = json.loads(content)
-            
-            # Extract keywords from the response
-            if isinstance(response_data, dict) and 'keywords' in response_data:
-                keywords = response_data['keywords']
-            elif isinstance(response_data, list):
-                keywords = response_data
-            else:
-                print("Unexpected response format. Using empty set.")
-                
-            keywordSet = set(keywords) # Convert to set to remove any duplicates
-            
-        except Exception as e:
-            print(f"Error in keyword extraction: {e}")
+            # Cached per normalised question; identical concurrent questions share one LLM call
+            with timing.stage("keywords"):
+                keywordSet = set(keywords.extract_keywords(query))
+        except Exception:
+            logger.exception("Error in keyword extraction")
             return JsonResponse({'message': 'Keyword Extraction Error'}, status=400)
         
-        try:
-            client = connect_to_mongodb()
-        
-            
-            results = search_documents(client, list(keywordSet))
-            
-            # print("\nSearch Results:")
-            # print("==============")
-            # for idx, result in enumerate(results, 1):
-            #     print(f"\nResult {idx}:")
-            #     pprint.pprint(result)
-                
-        except Exception as e:
-            print(f"Error in main execution: {e}")
-            return JsonResponse({'message': 'MongoDB Extraction Error'}, status=400)
-        finally:
-            if 'client' in locals():
-                client.close()
-
-        res = []
-        # results =  [{'title': "In re St. Vincent's Services, Inc.", 'url': 'https://www.courtlistener.com/opinion/6356561/in-re-st-vincents-services-inc/', 'matchedKeywords': ['visitation', 'adoption', 'tiffany', 'flexibility', 'custody', 'foster parents']}, {'title': 'Matter of Tatiana R.', 'url': 'https://www.courtlistener.com/opinion/9460427/matter-of-tatiana-r/', 'matchedKeywords': ['visitation', 'adoption', 'flexibility', 'custody', 'foster parents']}, {'title': 'In re the Guardianship & Custody of Terrance G.', 'url': 'https://www.courtlistener.com/opinion/6356335/in-re-the-guardianship-custody-of-terrance-g/', 'matchedKeywords': ['visitation', 'adoption', 'tiffany', 'custody', 'foster parents']}, {'title': 'In re Baby Doe', 'url': 'https://www.courtlistener.com/opinion/6356436/in-re-baby-doe/', 'matchedKeywords': ['visitation', 'foster parents', 'adoption', 'custody', 'child welfare']}, {'title': 'Matter of Baby Doe', 'url': 'https://www.courtlistener.com/opinion/9460118/matter-of-baby-doe/', 'matchedKeywords': ['visitation', 'foster parents', 'adoption', 'custody', 'child welfare']}, {'title': 'Theresa O. v. Arthur P.', 'url': 'https://www.courtlistener.com/opinion/6307049/theresa-o-v-arthur-p/', 'matchedKeywords': ['visitation', 'adoption', 'tiffany', 'custody', 'foster parents']}, {'title': 'Matter of Theresa O v. Arthur P', 'url': 'https://www.courtlistener.com/opinion/9460280/matter-of-theresa-o-v-arthur-p/', 'matchedKeywords': ['visitation', 'adoption', 'tiffany', 'custody', 'foster parents']}, {'title': 'In re Tiffany A.', 'url': 'https://www.courtlistener.com/opinion/6356204/in-re-tiffany-a/', 'matchedKeywords': ['adoption', 'tiffany', 'flexibility', 'custody', 'foster parents']}, {'title': 'In re Jackie B.', 'url': 'https://www.courtlistener.com/opinion/5946325/in-re-jackie-b/', 'matchedKeywords': ['visitation', 'adoption', 'tiffany', 'custody', 'foster parents']}, {'title': 'In re Jackie B.', 'url': 'https://www.courtlistener.com/opinion/5946325/in-re-jackie-b/', 'matchedKeywords': ['visitation', 'adoption', 'tiffany', 'custody', 'foster parents']}]
-        for result in results:
-            res.append({
-                # 'docId': id,
-                'title' : result["title"],
-                'url':result['url'],
-                'matchedKeywords' : result['matchedKeywords']
-            })
-        
-        if res:
-            cache.set(f'query_results_{query}',res,timeout=1200)
-            print(f"Query '{query}' results cached.",res)
-            return JsonResponse({'message':'Query returned results successfully'},status=200)
-        return JsonResponse({'message' : 'No results'},status = 200)
+        return search_and_cache(query, keywordSet, ranking)
     return JsonResponse({'message': 'Invalid request'}, status=400)
 
+async def SubmitQueryAsync(request):
+    """
+    Async SubmitQuery for ASGI servers.
+
+    The LLM call is awaited on the event loop, so one worker can hold many in-flight
+    questions; ranking (CPU-bound, or blocking pymongo for the Mongo engine) runs in a
+    worker thread.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'message': 'Invalid request'}, status=400)
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'message': 'Invalid request'}, status=400)
+    query = data.get('query') or ''
+    ranking = _ranking(data.get('ranking'))
+
+    try:
+        with timing.stage("keywords"):
+            keywordSet = set(await keywords.aextract_keywords(query))
+    except Exception:
+        logger.exception("Error in keyword extraction")
+        return JsonResponse({'message': 'Keyword Extraction Error'}, status=400)
+
+    return await sync_to_async(search_and_cache, thread_sensitive=False)(query, keywordSet, ranking)
+
+# csrf_exempt() only wraps sync views on this Django version
+SubmitQueryAsync.csrf_exempt = True
+
+def _page_items(entries):
+    with timing.stage("hydrate"):
+        return documents.hydrate(entries)
+
 def paginated_results(request):
-    query = request.GET.get('query','').lower()
-    page = int(request.GET.get('page',1))
-    limit = int(request.GET.get('limit',10))
+    query = request.GET.get('query','')
+    try:
+        page = int(request.GET.get('page',1))
+        limit = int(request.GET.get('limit',10))
+    except ValueError:
+        return JsonResponse({'message': 'Invalid request'}, status=400)
+    if page < 1 or limit < 1:
+        # A zero limit has no pages to divide the results into, and pages count from 1
+        return JsonResponse({'message': 'Invalid request'}, status=400)
+    ranking = _ranking(request.GET.get('ranking'))
+    # The resultsKey returned by SubmitQuery, or the question, which maps to it
+    key = request.GET.get('key') or result_cache.lookup_key(query, ranking)
 
-    queryResults = cache.get(f'query_results_{query}',[])
+    with timing.stage("cache_get"):
+        queryResults = result_cache.load(key) if key else None
+    if queryResults is None:
+        queryResults = result_cache.RankedResults([], ranking)
+
+    index = search_engine.get_index()
+    if not queryResults.exhausted and index is not None:
+        end = page * limit + 1
+        if end > len(queryResults):
+            # Continue the top-k ranking past the cached prefix and cache the longer one
+            with timing.stage("rank"):
+                cursor = search_engine.TopKCursor(queryResults.keywords, window=settings.SEARCH_TOP_K, ranking=queryResults.ranking)
+                cursor.k = len(queryResults)
+                cursor.fetch(index, end)
+            queryResults = result_cache.RankedResults.from_results(
+                queryResults.keywords, queryResults.ranking, cursor.results, cursor.exhausted)
+            with timing.stage("cache_set"):
+                result_cache.store(query, queryResults)
+        known = len(queryResults)
+        more = not queryResults.exhausted
+        known_pages = (known + limit - 1) // limit
+        return JsonResponse({
+            'page': page,
+            'totalItems': known,
+            'totalPages': known_pages + 1 if more else max(known_pages, 1),
+            'hasMore': more,
+            'items': _page_items(queryResults[(page - 1) * limit:page * limit]),
+        })
 
     paginator = Paginator(queryResults,limit)
     page_obj = paginator.get_page(page)
@@ -244,11 +360,132 @@ def paginated_results(request):
         'page': page_obj.number,
         'totalItems': paginator.count,
         'totalPages': paginator.num_pages,
-        'items': list(page_obj.object_list),
+        'items': _page_items(list(page_obj.object_list)),
     })
 
 
 
+def _ranked_chunks(query, keywordList, ranking, limit, chunk):
+    """
+    Yield ranked entries in growing chunks, at most limit in total.
+
+    With an in-process index the top-k ranking is continued chunk by chunk, so the
+    first chunk only ranks as far as it needs to; with MongoDB the sorted aggregation
+    is read through its cursor batches.
+    """
+    index = search_engine.get_index()
+    if ranking == 'hybrid' or (index is None and settings.MONGO_POSTINGS == 'packed'):
+        # Fused and packed rankings are computed in one go; stream the ranked list in chunks
+        if ranking == 'hybrid':
+            results = _search_hybrid(query, keywordList, index)[:limit]
+        else:
+            results = search_packed(keywordList, limit)
+        sent = 0
+        while sent < len(results):
+            yield results[sent:sent + chunk]
+            sent += chunk
+            chunk = min(chunk * 2, settings.SEARCH_STREAM_MAX_CHUNK)
+        return
+    if index is None:
+        pipeline = _match_pipeline(keywordList, limit)
+        batch = []
+        for doc in mongo.keyword_postings().aggregate(pipeline, batchSize=chunk):
+            batch.append(_match_entry(doc))
+            if len(batch) >= chunk:
+                entries = _with_entity(batch)
+                if entries:
+                    yield entries
+                batch = []
+                chunk = min(chunk * 2, settings.SEARCH_STREAM_MAX_CHUNK)
+        entries = _with_entity(batch) if batch else []
+        if entries:
+            yield entries
+        return
+
+    cursor = search_engine.TopKCursor(keywordList, window=chunk, ranking=ranking)
+    sent = 0
+    while sent < limit:
+        end = min(sent + chunk, limit)
+        entries = cursor.fetch(index, end).results[sent:end]
+        if not entries:
+            return
+        yield entries
+        sent += len(entries)
+        chunk = min(chunk * 2, settings.SEARCH_STREAM_MAX_CHUNK)
+
+def _search_events(query, ranking, limit):
+    """
+    Events of a streamed search: keywords, then result chunks, then done (or error).
+    """
+    try:
+        with timing.stage("keywords"):
+            keywordSet = set(keywords.extract_keywords(query))
+    except Exception:
+        logger.exception("Error in keyword extraction")
+        yield 'error', {'message': 'Keyword Extraction Error'}
+        return
+    keywordList = _keyword_list(keywordSet)
+    yield 'keywords', {'keywords': keywordList}
+
+    sent = 0
+    try:
+        for entries in _ranked_chunks(query, keywordList, ranking, limit, settings.SEARCH_STREAM_CHUNK):
+            items = documents.hydrate(entries)
+            yield 'results', {'offset': sent, 'items': items}
+            sent += len(items)
+    except Exception:
+        logger.exception("Error in main execution")
+        yield 'error', {'message': 'MongoDB Extraction Error'}
+        return
+    yield 'done', {'totalItems': sent}
+
+def _ndjson(events):
+    for event, data in events:
+        yield json.dumps({'type': event, **data}) + "\n"
+
+def _sse(events):
+    for event, data in events:
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@csrf_exempt
+def SearchStream(request):
+    """
+    Streamed search: the extracted keywords as soon as they are known, then results
+    (title, url, matchedKeywords) in chunks as they are ranked.
+
+    Takes query, ranking and limit from the JSON body (POST) or the query string (GET,
+    for EventSource). Responds with Server-Sent Events when the client accepts
+    text/event-stream or passes format=sse, and newline-delimited JSON otherwise.
+    """
+    if request.method == 'POST':
+        try:
+            params = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'message': 'Invalid request'}, status=400)
+    elif request.method == 'GET':
+        params = request.GET
+    else:
+        return JsonResponse({'message': 'Invalid request'}, status=400)
+    query = params.get('query') or ''
+    ranking = _ranking(params.get('ranking'))
+    try:
+        limit = min(int(params.get('limit') or settings.SEARCH_STREAM_LIMIT), settings.SEARCH_STREAM_LIMIT)
+    except ValueError:
+        return JsonResponse({'message': 'Invalid request'}, status=400)
+    if limit < 1:
+        # Mongo rejects $limit 0 and a negative one; slices would drop results from the end
+        return JsonResponse({'message': 'Invalid request'}, status=400)
+
+    events = _search_events(query, ranking, limit)
+    if params.get('format') == 'sse' or 'text/event-stream' in request.headers.get('Accept', ''):
+        response = StreamingHttpResponse(_sse(events), content_type='text/event-stream')
+    else:
+        response = StreamingHttpResponse(_ndjson(events), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @csrf_exempt
 def TestView(request):
     logger.debug("GOT TEST VIEW")
@@ -256,14 +493,11 @@ def TestView(request):
 
 def test_mongodb(request):
     try:
-        # Get MongoDB host from environment variable or default to localhost
-        mongodb_host = os.environ.get('MONGODB_HOST', 'localhost')
-        
-        # Create a MongoDB client
-        client = MongoClient(f'mongodb://{mongodb_host}:27017/')
+        # Use this worker's pooled client
+        client = mongo.get_client()
         
         # Access the database
-        db = client['lawpy']
+        db = mongo.get_database()
         
         # Try to ping the database
         client.admin.command('ping')
@@ -289,4 +523,17 @@ def test_mongodb(request):
         return JsonResponse({
             'status': 'error',
             'message': f'MongoDB connection failed: {str(e)}'
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+def stats(request):
+    return JsonResponse({
+        'mongodb': mongo.pool_stats(),
+        'keywordCache': keywords.cache_stats(),
+        'documentCache': documents.cache_stats(),
+    })
+
+def metrics(request):
+    """
+    Latency histograms of the query path stages and size statistics, for this worker.
+    """
+    return JsonResponse(timing.snapshot())
@@ -0,0 +1,413 @@
+"""
+Vocabulary of the indexed keywords, used to map extracted keywords onto real terms.
+
+The LLM often returns keywords that are not spelled like any indexed n-gram ("foster
+parent" for "foster parents", "visitaton rights"), and those match nothing. Before
+retrieval, each keyword that is not an indexed term is resolved against the vocabulary:
+
+    1. its indexer form (backend/tokenizer.py normalisation), if that is a term
+    2. terms with the same stems ("foster parent" -> "foster parents")
+    3. terms whose words are each within a small edit distance of the keyword's words
+       (1 from 4 characters, 2 from 9, same first letter)
+    4. terms starting with it ("custod" -> "custody", "custodial"), or with a trailing *
+       only those
+
+keeping the VOCABULARY_MAX_EXPANSIONS most frequent terms of the first step that finds
+any. Several terms stay together as one group keyword ("custodial|custodian|custody",
+tokenizer.GROUP_SEPARATOR), which ranks as a single keyword matching any of them, so a
+document is not credited once per spelling of the same concept. Keywords that resolve
+to nothing are kept as they are (positional indexes can still match them as phrases).
+
+Vocabulary directory layout (written by scripts/process_opinions.py --vocabulary):
+    meta.json               format version, byte order and counts
+    terms.bin/.idx          UTF-8 terms in sorted order, offset-indexed
+    term_df.bin             int32 document frequency per term
+    word_terms.bin          int32 term numbers of the single-word terms, in sorted order
+    stem_keys.bin/.idx      distinct stem keys in sorted order
+    stem_offsets.bin        uint64 offsets into stem_terms.bin (num_stems + 1)
+    stem_terms.bin          int32 term numbers per stem key, most frequent first
+
+The sorted dictionaries are walked as implicit tries: prefix lookups are two binary
+searches, and the edit-distance search over the single words reuses the DP rows of the
+prefix shared with the previous word and skips every word under a prefix that is already
+too far away.
+"""
+
+from array import array
+from collections import OrderedDict
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .disk_index import _Column, _map, _write_column
+from .tokenizer import GROUP_SEPARATOR, tokenize
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Light suffix stripping, longest first; stems shorter than 3 letters are not taken
+_SUFFIXES = (
+    ("ments", ""), ("ment", ""), ("ness", ""), ("sses", "ss"), ("ings", ""), ("ions", ""),
+    ("edly", ""), ("ies", "y"), ("ied", "y"), ("ing", ""), ("ion", ""), ("ed", ""),
+    ("ly", ""), ("s", ""),
+)
+_KEEP_S = ("ss", "us", "is")
+_END = b"\xff"  # sorts after every UTF-8 continuation, so prefix + _END bounds a prefix range
+_CACHE_SIZE = 4096
+
+
+def stem(word):
+    """
+    Reduce a word to its stem: plural, -ing, -ed, -ion, -ment, ... stripped, then a final e.
+    """
+    if len(word) <= 3:
+        return word
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= 3:
+            if suffix == "s" and word.endswith(_KEEP_S):
+                break
+            word = word[:len(word) - len(suffix)] + replacement
+            break
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+def stem_key(term):
+    return " ".join(stem(word) for word in term.split(" "))
+
+
+def indexer_form(keyword):
+    """
+    The keyword as the indexer would have spelled it (lowercase letters, stop words removed).
+    """
+    return " ".join(word for word in tokenize(keyword) if word)
+
+
+def write_vocabulary(out_dir, term_dfs):
+    """
+    Write a vocabulary directory, next to out_dir and renamed into place.
+
+    Args:
+        out_dir (str): Destination directory
+        term_dfs (dict): Term -> document frequency
+
+    Returns:
+        dict: The meta.json contents
+    """
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    terms = sorted(term_dfs)
+    _write_column(tmp_dir, "terms", terms)
+    with open(os.path.join(tmp_dir, "term_df.bin"), 'wb') as f:
+        array('i', (term_dfs[term] for term in terms)).tofile(f)
+    with open(os.path.join(tmp_dir, "word_terms.bin"), 'wb') as f:
+        array('i', (number for number, term in enumerate(terms) if " " not in term)).tofile(f)
+
+    classes = {}
+    for number, term in enumerate(terms):
+        classes.setdefault(stem_key(term), []).append(number)
+    stem_keys = sorted(classes)
+    stem_offsets = array('Q', [0])
+    stem_terms = array('i')
+    for key in stem_keys:
+        stem_terms.extend(sorted(classes[key], key=lambda number: -term_dfs[terms[number]]))
+        stem_offsets.append(len(stem_terms))
+    _write_column(tmp_dir, "stem_keys", stem_keys)
+    with open(os.path.join(tmp_dir, "stem_offsets.bin"), 'wb') as f:
+        stem_offsets.tofile(f)
+    with open(os.path.join(tmp_dir, "stem_terms.bin"), 'wb') as f:
+        stem_terms.tofile(f)
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "num_terms": len(terms),
+        "num_stems": len(stem_keys),
+        "created": time.time()
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(out_dir):
+        old_dir = f"{out_dir}.old-{os.getpid()}"
+        os.rename(out_dir, old_dir)
+        os.rename(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.rename(tmp_dir, out_dir)
+    return meta
+
+
+def build_from_json(data_dir, out_dir):
+    """
+    Build a vocabulary directory from the keyword_postings.json written by process_opinions.py.
+    """
+    term_dfs = {}
+    with open(os.path.join(data_dir, "keyword_postings.json")) as f:
+        for line in f:
+            if line.strip():
+                keyword = json.loads(line)["keyword"]
+                term_dfs[keyword] = term_dfs.get(keyword, 0) + 1
+    return write_vocabulary(out_dir, term_dfs)
+
+
+class _Subset:
+    """
+    The entries of a _Column at the given (sorted) numbers, as a sorted column itself.
+    """
+
+    def __init__(self, column, numbers):
+        self.column = column
+        self.numbers = numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def raw(self, i):
+        return self.column.raw(self.numbers[i])
+
+    def __getitem__(self, i):
+        return self.column[self.numbers[i]]
+
+
+def _lower_bound(column, key, lo=0):
+    hi = len(column)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if column.raw(mid) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class Vocabulary:
+    """
+    Read-only view over a vocabulary directory.
+    """
+
+    def __init__(self, vocabulary_dir):
+        with open(os.path.join(vocabulary_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vocabulary format version {self.meta['version']} in {vocabulary_dir}")
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"Vocabulary {vocabulary_dir} was written on a {self.meta['byteorder']}-endian host")
+        self.terms = _Column(vocabulary_dir, "terms")
+        self.term_df = np.frombuffer(_map(os.path.join(vocabulary_dir, "term_df.bin")), dtype=np.int32)
+        self.word_terms = memoryview(_map(os.path.join(vocabulary_dir, "word_terms.bin"))).cast('i')
+        self.words = _Subset(self.terms, self.word_terms)
+        self.stem_keys = _Column(vocabulary_dir, "stem_keys")
+        self.stem_offsets = memoryview(_map(os.path.join(vocabulary_dir, "stem_offsets.bin"))).cast('Q')
+        self.stem_terms = memoryview(_map(os.path.join(vocabulary_dir, "stem_terms.bin"))).cast('i')
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return self.df(term) > 0
+
+    def df(self, term):
+        """
+        Document frequency of an indexed term; 0 when the term is not in the vocabulary.
+        """
+        key = term.encode('utf-8')
+        i = _lower_bound(self.terms, key)
+        if i < len(self.terms) and self.terms.raw(i) == key:
+            return int(self.term_df[i])
+        return 0
+
+    def _most_frequent(self, numbers, limit):
+        numbers = np.asarray(numbers, dtype=np.int64)
+        if len(numbers) > limit:
+            numbers = numbers[np.argsort(-self.term_df[numbers], kind="stable")[:limit]]
+        return [self.terms[int(number)] for number in numbers]
+
+    def prefix(self, prefix, limit):
+        """
+        The limit most frequent terms starting with prefix.
+        """
+        key = prefix.encode('utf-8')
+        lo = _lower_bound(self.terms, key)
+        hi = _lower_bound(self.terms, key + _END, lo)
+        if lo == hi:
+            return []
+        # Document frequencies of the whole range at once; pick the top ones without a full sort
+        df = self.term_df[lo:hi]
+        if hi - lo > limit:
+            top = np.argpartition(-df, limit - 1)[:limit]
+            top = top[np.argsort(-df[top], kind="stable")]
+        else:
+            top = np.argsort(-df, kind="stable")
+        return [self.terms[lo + int(i)] for i in top]
+
+    def stem_class(self, term, limit):
+        """
+        The limit most frequent terms with the same stems as term.
+        """
+        key = stem_key(term).encode('utf-8')
+        i = _lower_bound(self.stem_keys, key)
+        if i == len(self.stem_keys) or self.stem_keys.raw(i) != key:
+            return []
+        start = self.stem_offsets[i]
+        end = min(self.stem_offsets[i + 1], start + limit)
+        return [self.terms[self.stem_terms[j]] for j in range(start, end)]
+
+    def fuzzy_words(self, word, max_distance, limit):
+        """
+        The limit most frequent single-word terms with the same first letter at the
+        smallest edit distance <= max_distance from word.
+        """
+        words = self.words
+        first = word[:1].encode('utf-8')
+        i = _lower_bound(words, first)
+        n = _lower_bound(words, first + _END, i)
+        best = max_distance + 1
+        found = []
+        rows = [list(range(len(word) + 1))]
+        previous = ""
+        while i < n:
+            term = words[i]
+            # Rows for the prefix shared with the previous term are still valid
+            depth = 0
+            limit_depth = min(len(previous), len(term), len(rows) - 1)
+            while depth < limit_depth and previous[depth] == term[depth]:
+                depth += 1
+            del rows[depth + 1:]
+            pruned = False
+            while depth < len(term):
+                above = rows[depth]
+                char = term[depth]
+                row = [above[0] + 1]
+                for j in range(1, len(word) + 1):
+                    row.append(min(above[j] + 1, row[j - 1] + 1, above[j - 1] + (word[j - 1] != char)))
+                rows.append(row)
+                depth += 1
+                if min(row) > max_distance:
+                    pruned = True
+                    break
+            if pruned:
+                # Nothing under this prefix can get closer: skip past all of its terms
+                i = _lower_bound(words, term[:depth].encode('utf-8') + _END, i + 1)
+                previous = term[:depth]
+                continue
+            distance = rows[-1][-1]
+            if distance < best:
+                best, found = distance, [words.numbers[i]]
+            elif distance == best:
+                found.append(words.numbers[i])
+            previous = term
+            i += 1
+        return self._most_frequent(found, limit)
+
+    def fuzzy(self, form, limit):
+        """
+        The limit most frequent terms made of the form's words or their closest misspellings.
+        """
+        choices = []
+        for word in form.split(" "):
+            if word in self:
+                choices.append([word])
+            elif len(word) >= 4:
+                choices.append(self.fuzzy_words(word, 1 if len(word) < 9 else 2, limit) or [word])
+            else:
+                choices.append([word])
+        candidates = [""]
+        for alternatives in choices:
+            candidates = [f"{prefix} {word}" if prefix else word for prefix in candidates for word in alternatives]
+        numbers = []
+        for candidate in candidates:
+            key = candidate.encode('utf-8')
+            i = _lower_bound(self.terms, key)
+            if candidate != form and i < len(self.terms) and self.terms.raw(i) == key:
+                numbers.append(i)
+        return self._most_frequent(numbers, limit)
+
+    def resolve(self, keyword, limit):
+        """
+        Return the indexed terms a keyword stands for, or [] if none were found.
+        """
+        with self._lock:
+            cached = self._cache.get((keyword, limit))
+            if cached is not None:
+                self._cache.move_to_end((keyword, limit))
+                return cached
+        terms = self._resolve(keyword, limit)
+        with self._lock:
+            self._cache[(keyword, limit)] = terms
+            while len(self._cache) > _CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return terms
+
+    def _resolve(self, keyword, limit):
+        if keyword in self:
+            return [keyword]
+        form = indexer_form(keyword.rstrip("*"))
+        if not form:
+            return []
+        if keyword.endswith("*"):
+            return self.prefix(form, limit)
+        if form in self:
+            return [form]
+        terms = self.stem_class(form, limit)
+        if not terms:
+            terms = self.fuzzy(form, limit)
+        if not terms:
+            terms = self.prefix(form, limit)
+        return terms
+
+
+_vocabulary = None
+_vocabulary_lock = threading.Lock()
+_loaded = False
+
+
+def get_vocabulary():
+    """
+    Map the vocabulary at VOCABULARY_DIR on first use; None when it is not configured.
+    """
+    global _vocabulary, _loaded
+    from django.conf import settings
+    if _loaded:
+        return _vocabulary
+    with _vocabulary_lock:
+        if not _loaded and settings.VOCABULARY_DIR:
+            try:
+                _vocabulary = Vocabulary(settings.VOCABULARY_DIR)
+                logger.info(f"Mapped vocabulary at {settings.VOCABULARY_DIR}: {len(_vocabulary):,} terms")
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to map vocabulary at {settings.VOCABULARY_DIR}: {e}")
+        _loaded = True
+    return _vocabulary
+
+
+def resolve_keywords(keywords):
+    """
+    Replace each keyword by the indexed term it resolves to (itself when none), or by
+    the group keyword of its terms when it expands to several.
+
+    Returns:
+        list: Sorted, distinct keywords
+    """
+    from django.conf import settings
+    vocabulary = get_vocabulary()
+    if vocabulary is None:
+        return sorted(set(keywords))
+    resolved = set()
+    for keyword in keywords:
+        # Proximity queries are evaluated from positions as written
+        terms = [] if keyword.startswith('"') else vocabulary.resolve(keyword, settings.VOCABULARY_MAX_EXPANSIONS)
+        resolved.add(GROUP_SEPARATOR.join(sorted(set(terms))) if terms else keyword)
+    return sorted(resolved)
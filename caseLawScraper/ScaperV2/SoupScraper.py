@@ -63,7 +63,7 @@ for doc in collection.find({"batch": batch_id,"textBlock": {"$exists": False},"p
             print("◻️ Empty Count: ",emptyCount)
             collection.update_one(
                 {"_id": doc["_id"]},
-                {"$set": {"textBlock": " "}}
+                {"$set": {"textBlock": " "}, "$currentDate": {"scrapedAt": {"$type": "timestamp"}}}
             ) 
             continue
 
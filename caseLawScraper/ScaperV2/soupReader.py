@@ -26,7 +26,8 @@ for doc in collection.find({"plainBlock" : {"$exists": True}}):
             {"_id": doc["_id"]},
             {
                 "$set": {"textBlock": text_only},
-                "$unset": {"plainBlock": ""}
+                "$unset": {"plainBlock": ""},
+                "$currentDate": {"scrapedAt": {"$type": "timestamp"}}
             }
         )
 
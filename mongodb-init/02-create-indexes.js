@@ -1,9 +1,6 @@
 // MongoDB script to create indexes after data import
-// This runs second due to 02 prefix
-
-// Wait for MongoDB to be fully ready
-print("Waiting for MongoDB to be fully ready...");
-sleep(3000); // Wait a bit longer after import to ensure collections are ready
+// This runs second due to 02 prefix. Imports build their indexes on the staging collection
+// before swapping it in (docker-entrypoint-custom.sh), so this only fills in missing ones.
 
 // Function to safely check if a collection exists and create an index if it doesn't already exist
 function createIndexIfNeeded(db, collectionName, indexField, indexName) {
@@ -74,6 +71,16 @@ let results = {
     )
 };
 
+// Packed postings are optional (process_opinions.py --packed-postings)
+if (db.getCollectionNames().includes("packed_postings")) {
+    results.packed_postings_keyword = createIndexIfNeeded(
+        db,
+        "packed_postings",
+        "keyword",
+        "packed_keyword_idx"
+    );
+}
+
 // Verify created indexes
 print("\nVerifying created indexes:");
 
@@ -97,7 +104,21 @@ try {
     print("Could not verify document_entities indexes: " + error.message);
 }
 
+if (results.packed_postings_keyword !== undefined) {
+    try {
+        print("\nIndexes in packed_postings:");
+        db.packed_postings.getIndexes().forEach(idx => {
+            print(`- ${idx.name}: ${JSON.stringify(idx.key)}`);
+        });
+    } catch (error) {
+        print("Could not verify packed_postings indexes: " + error.message);
+    }
+}
+
 print("\nIndex creation script completed");
 print("Results summary:");
 print(`- keyword_postings.keyword index: ${results.keyword_postings_keyword ? "Verified" : "Failed"}`);
-print(`- document_entities.id index: ${results.document_entities_id ? "Verified" : "Failed"}`); 
\ No newline at end of file
+print(`- document_entities.id index: ${results.document_entities_id ? "Verified" : "Failed"}`);
+if (results.packed_postings_keyword !== undefined) {
+    print(`- packed_postings.keyword index: ${results.packed_postings_keyword ? "Verified" : "Failed"}`);
+}
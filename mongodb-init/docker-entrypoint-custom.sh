@@ -5,17 +5,24 @@ set -e
 mongod --bind_ip_all &
 MONGO_PID=$!
 
-# Wait for MongoDB to start
+# Wait for MongoDB to start accepting connections
 echo "Waiting for MongoDB to start..."
-sleep 10
+until mongosh --quiet --norc --eval "db.adminCommand('ping').ok" >/dev/null 2>&1; do
+    sleep 1
+done
 
 # Check if collections already exist before importing
 echo "Checking for existing collections..."
 
-# Function to check if a collection exists and import if it doesn't
+# Function to check if a collection exists and import if it doesn't.
+# The file is imported into <collection>_staging with parallel insertion workers, indexed,
+# and renamed over the collection, so queries never see it half-loaded or unindexed.
+# (scripts/load_mongodb.py does the same from the host for later reloads.)
 check_and_import_collection() {
     collection_name=$1
     file_name=$2
+    index_field=$3
+    index_name=$4
     
     # Check if collection exists and has documents
     collection_exists=$(mongosh --quiet --eval "db.getSiblingDB('lawpy').getCollectionNames().includes('$collection_name')" --norc | tr -d '\r')
@@ -31,8 +38,14 @@ check_and_import_collection() {
         echo "Collection $collection_name already exists with $collection_count documents. Skipping import."
         return 0
     elif [ -f "/data/import/$file_name" ]; then
-        echo "Importing $collection_name collection..."
-        mongoimport --db lawpy --collection "$collection_name" --file "/data/import/$file_name" --drop
+        echo "Importing $collection_name collection into ${collection_name}_staging..."
+        mongoimport --db lawpy --collection "${collection_name}_staging" --file "/data/import/$file_name" --drop \
+            --numInsertionWorkers "$(nproc)" --bypassDocumentValidation
+        mongosh --quiet --norc --eval "
+            const staging = db.getSiblingDB('lawpy')['${collection_name}_staging'];
+            staging.createIndex({ ${index_field}: 1 }, { name: '${index_name}' });
+            staging.renameCollection('${collection_name}', true);
+        "
         echo "$collection_name import completed!"
         return 0
     else
@@ -42,10 +55,14 @@ check_and_import_collection() {
 }
 
 # Check and import collections only if they don't exist
-check_and_import_collection "document_entities" "document_entities.json"
-check_and_import_collection "keyword_postings" "keyword_postings.json"
+check_and_import_collection "document_entities" "document_entities.json" "id" "id_idx"
+check_and_import_collection "keyword_postings" "keyword_postings.json" "keyword" "keyword_idx"
+# Optional: only written by process_opinions.py --packed-postings
+if [ -f "/data/import/packed_postings.json" ]; then
+    check_and_import_collection "packed_postings" "packed_postings.json" "keyword" "packed_keyword_idx"
+fi
 
-# Run the index creation script only if needed
+# Make sure collections imported before staging was used have their indexes
 echo "Ensuring indexes exist..."
 mongosh --file /docker-entrypoint-initdb.d/02-create-indexes.js
 
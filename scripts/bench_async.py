@@ -0,0 +1,100 @@
+"""
+Concurrency benchmark for the async query endpoint.
+
+Replaces the OpenAI call with a fixed-latency stub, serves searches from a synthetic
+in-process index, and fires requests with distinct questions (so no cache hits) at
+api/SubmitQueryAsync on one event loop and at the sync api/SubmitQuery from a thread
+pool. With a slow LLM the async throughput should grow with --concurrency, while the
+sync path is capped by the number of threads (workers) pinned to LLM calls.
+
+Usage:
+    python scripts/bench_async.py [--requests 400] [--concurrency 200] [--llm-delay 0.5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LawPy.settings')
+
+import django
+
+django.setup()
+
+from django.test import AsyncClient, Client
+
+from backend import keywords, search_engine, views
+from bench_bm25 import build_index
+
+KEYWORDS = ["term1", "term5", "term40", "term300"]
+# Questions are unique per run so the shared keyword cache never answers them
+RUN = uuid.uuid4().hex[:8]
+
+
+async def run_async(num_requests, concurrency):
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            response = await client.post('/api/SubmitQueryAsync', {'query': f'async question {RUN} {i}'},
+                                         content_type='application/json')
+            return response.status_code
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(one(i) for i in range(num_requests)))
+    return time.perf_counter() - started, statuses
+
+
+def run_sync(num_requests, threads):
+    client = Client()
+
+    def one(i):
+        response = client.post('/api/SubmitQuery', {'query': f'sync question {RUN} {i}'}, content_type='application/json')
+        return response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(one, range(num_requests)))
+    return time.perf_counter() - started, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark async vs sync SubmitQuery with a slow stub LLM.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200, help="in-flight requests for the async endpoint")
+    parser.add_argument("--sync-threads", type=int, default=8, help="threads (like WSGI workers) for the sync endpoint")
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="seconds per stubbed LLM call")
+    parser.add_argument("--docs", type=int, default=20000)
+    args = parser.parse_args()
+
+    search_engine.set_index(build_index(args.docs, 2000, 100, seed=42))
+
+    def slow_llm(query):
+        time.sleep(args.llm_delay)
+        return list(KEYWORDS)
+
+    async def aslow_llm(query):
+        await asyncio.sleep(args.llm_delay)
+        return list(KEYWORDS)
+
+    with mock.patch.object(keywords, 'extract_keywords_llm', slow_llm), \
+            mock.patch.object(keywords, 'aextract_keywords_llm', aslow_llm), \
+            mock.patch.object(keywords, 'print', lambda *a, **k: None, create=True), \
+            mock.patch.object(views, 'print', lambda *a, **k: None, create=True):
+        elapsed, statuses = asyncio.run(run_async(args.requests, args.concurrency))
+        print(f"⚡ async: {args.requests} requests at concurrency {args.concurrency}: "
+              f"{elapsed:.2f}s, {args.requests / elapsed:.1f} req/s, {statuses.count(200)} ok")
+        elapsed, statuses = run_sync(args.requests, args.sync_threads)
+        print(f"🐢 sync:  {args.requests} requests on {args.sync_threads} threads: "
+              f"{elapsed:.2f}s, {args.requests / elapsed:.1f} req/s, {statuses.count(200)} ok")
+
+
+if __name__ == "__main__":
+    main()
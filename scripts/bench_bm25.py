@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for BM25 scoring in the in-process search engine.
+
+Builds a synthetic index with a Zipfian term distribution and reports scoring
+throughput in postings/second for the vectorised BM25 ranking next to the
+per-document "distinct matches, then total count" ranking.
+
+Usage:
+    python scripts/bench_bm25.py [--docs 100000] [--terms 20000] [--queries 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+
+from backend.search_engine import InMemoryIndex
+
+
+def build_index(num_docs, num_terms, terms_per_doc, seed):
+    """
+    Build an InMemoryIndex where term i occurs with probability proportional to 1/(i+1).
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(num_terms)]
+    index = InMemoryIndex()
+    for doc in range(num_docs):
+        doc_id = f"{doc:024x}"
+        index.intern_document(doc_id, f"https://example.org/{doc}", f"Opinion {doc}", terms_per_doc)
+        counts = {}
+        for term in rng.choices(range(num_terms), weights=weights, k=terms_per_doc):
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            index.add_posting(f"term{term}", doc_id, count)
+    return index.finalize()
+
+
+def bench(label, search, queries, postings_per_query):
+    started = time.perf_counter()
+    for query in queries:
+        search(query)
+    elapsed = time.perf_counter() - started
+    total_postings = sum(postings_per_query)
+    print(f"{label:>10}: {elapsed / len(queries) * 1000:8.2f} ms/query, "
+          f"{total_postings / elapsed:14,.0f} postings/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25 scoring throughput.")
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--terms", type=int, default=20000)
+    parser.add_argument("--terms-per-doc", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--keywords", type=int, default=6, help="keywords per query")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"🏗️ Building synthetic index: {args.docs:,} documents, {args.terms:,} terms...")
+    index = build_index(args.docs, args.terms, args.terms_per_doc, args.seed)
+    print(f"📊 {len(index.postings_docs):,} postings")
+
+    # Mix frequent and rare terms, like LLM-extracted keywords
+    rng = random.Random(args.seed + 1)
+    vocabulary = sorted(index.terms, key=lambda term: int(term[4:]))
+    head = vocabulary[:200]
+    queries = [
+        rng.sample(head, args.keywords // 2) + rng.sample(vocabulary, args.keywords - args.keywords // 2)
+        for _ in range(args.queries)
+    ]
+    postings_per_query = [
+        sum(len(index.postings(keyword)[0]) for keyword in query if keyword in index.terms)
+        for query in queries
+    ]
+    print(f"🔎 {args.queries} queries, {sum(postings_per_query) / len(queries):,.0f} postings/query on average")
+
+    bench("bm25", lambda query: index.search_bm25(query, args.limit), queries, postings_per_query)
+    bench("matches", lambda query: index.search(query, args.limit), queries, postings_per_query)
+    bench("top-k", lambda query: index.search_top_k(query, args.limit), queries, postings_per_query)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+End-to-end load test for the search backend.
+
+Generates a synthetic opinions corpus with a Zipfian word distribution, builds the
+keyword postings with the indexer's own text processing (backend/tokenizer.py mirrors
+process_batch), and serves them from the in-process index, the memory-mapped binary
+index or a local MongoDB. The OpenAI call is replaced by a stub returning indexed
+keywords after --llm-delay seconds. Sessions of SubmitQuery followed by --pages
+paginated_results requests are then driven at a fixed concurrency, and latency
+percentiles, QPS and the server-side stage histograms (backend/timing.py) are written
+as JSON, so runs of different versions can be diffed.
+
+Usage:
+    python scripts/bench_search.py [--engine memory|mmap|mongo] [--docs 20000]
+        [--sessions 500] [--concurrency 16] [--output bench_search.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LawPy.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.test import Client
+
+from backend import keywords, search_engine, timing, views
+from backend.search_engine import InMemoryIndex
+from backend.tokenizer import STOP_WORDS, document_terms, word_positions
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def make_vocabulary(size, rng):
+    """
+    Distinct lowercase pseudo-words that survive the indexer's cleaning and stop-word removal.
+    """
+    words = set()
+    while len(words) < size:
+        word = "".join(rng.choice(LETTERS) for _ in range(rng.randint(3, 10)))
+        if word not in STOP_WORDS:
+            words.add(word)
+    return sorted(words)
+
+
+def make_opinion(vocabulary, weights, length, rng):
+    """
+    Opinion-like text: Zipf-distributed words with stop words, numbers and punctuation mixed in.
+    """
+    words = rng.choices(vocabulary, weights=weights, k=length)
+    fillers = ("the", "of", "and", "to", "in", "court", "v.", "§", "1983")
+    parts = []
+    for i, word in enumerate(words):
+        parts.append(word)
+        if rng.random() < 0.3:
+            parts.append(rng.choice(fillers))
+        if i % 17 == 16:
+            parts[-1] += "."
+    return " ".join(parts)
+
+
+def build_corpus(num_docs, vocabulary_size, words_per_doc, seed, positions=False, ngrams=True):
+    """
+    Generate the corpus and return (InMemoryIndex, postings, entities) built like process_batch,
+    optionally with word positions and without the n-gram postings.
+
+    Returns:
+        tuple: (finalized index, list of {keyword, id, count}, list of {id, url, title, length})
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    index = InMemoryIndex()
+    postings = []
+    entities = []
+    for doc in range(num_docs):
+        doc_id = f"{doc:024x}"
+        length = max(10, int(rng.gauss(words_per_doc, words_per_doc / 4)))
+        text = make_opinion(vocabulary, weights, length, rng)
+        counts, tokens = document_terms(text, ngrams)
+        entity = {"id": doc_id, "url": f"https://example.org/opinion/{doc}/", "title": f"Opinion {doc}", "length": tokens}
+        entities.append(entity)
+        index.intern_document(doc_id, entity["url"], entity["title"], tokens)
+        for keyword, count in counts.items():
+            postings.append({"keyword": keyword, "id": doc_id, "count": count})
+            index.add_posting(keyword, doc_id, count)
+        if positions:
+            for keyword, offsets in word_positions(text).items():
+                index.add_positions(keyword, doc_id, offsets)
+    return index.finalize(), postings, entities
+
+
+def load_mongodb(postings, entities, batch_size=10000):
+    """
+    Replace the benchmark database's collections with the synthetic corpus.
+    """
+    from backend import mongo
+
+    db = mongo.get_database()
+    for name, documents in (("keyword_postings", postings), ("document_entities", entities)):
+        db[name].drop()
+        for start in range(0, len(documents), batch_size):
+            db[name].insert_many([dict(doc) for doc in documents[start:start + batch_size]], ordered=False)
+    db["keyword_postings"].create_index("keyword")
+    db["keyword_postings"].create_index("id")
+    db["document_entities"].create_index("id")
+
+
+def make_llm(index, keywords_per_question, delay, seed):
+    """
+    Stub for keywords.extract_keywords_llm: stable, indexed keywords per question.
+    """
+    terms = sorted(index.terms)
+    by_df = sorted(terms, key=index.document_frequency, reverse=True)
+    head = by_df[:200]
+
+    def llm(query):
+        if delay:
+            time.sleep(delay)
+        rng = random.Random(f"{seed}:{query}")
+        half = keywords_per_question // 2
+        return rng.sample(head, half) + rng.sample(terms, keywords_per_question - half)
+
+    return llm
+
+
+def percentiles(samples):
+    """
+    Summary of latency samples in seconds, reported in milliseconds (nearest rank).
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(fraction):
+        return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": rank(0.50),
+        "p95_ms": rank(0.95),
+        "p99_ms": rank(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def run_load(questions, sessions, concurrency, pages, ranking):
+    """
+    Run sessions (SubmitQuery, then the first pages of results) from concurrency threads.
+
+    Returns:
+        tuple: (latencies by operation, error counts by operation, elapsed seconds)
+    """
+    latencies = {"submit": [], "results": [], "session": []}
+    errors = {"submit": 0, "results": 0}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def session(i):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = Client()
+        query = questions[i]
+        timings = []
+        started = time.perf_counter()
+        response = client.post('/api/SubmitQuery', {'query': query, 'ranking': ranking}, content_type='application/json')
+        submitted = time.perf_counter()
+        failed = {"submit": response.status_code != 200, "results": 0}
+        timings.append(("submit", submitted - started))
+        key = response.json().get("resultsKey") if response.status_code == 200 else None
+        for page in range(1, pages + 1 if key else 1):
+            page_started = time.perf_counter()
+            response = client.get('/api/results/', {'key': key, 'page': page, 'ranking': ranking})
+            timings.append(("results", time.perf_counter() - page_started))
+            failed["results"] += response.status_code != 200
+        timings.append(("session", time.perf_counter() - started))
+        with lock:
+            for name, seconds in timings:
+                latencies[name].append(seconds)
+            for name, count in failed.items():
+                errors[name] += count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(session, range(sessions)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test SubmitQuery + paginated_results on a synthetic corpus.")
+    parser.add_argument("--engine", choices=("memory", "mmap", "mongo"), default="memory")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocabulary", type=int, default=20000, help="distinct words in the corpus")
+    parser.add_argument("--words-per-doc", type=int, default=300)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--pages", type=int, default=2, help="results pages requested per session")
+    parser.add_argument("--questions", type=int, default=200, help="distinct questions (repeats hit the caches)")
+    parser.add_argument("--keywords", type=int, default=6, help="keywords returned by the stub LLM")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds per stubbed LLM call")
+    parser.add_argument("--ranking", choices=("matches", "bm25"), default="matches")
+    parser.add_argument("--positions", action="store_true", help="index word positions (in-process engines)")
+    parser.add_argument("--no-ngrams", dest="ngrams", action="store_false", help="index unigrams only")
+    parser.add_argument("--mongo-db", default="lawpy_bench", help="database used with --engine mongo")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_search.json")
+    args = parser.parse_args()
+
+    print(f"🏗️ Generating {args.docs:,} opinions over {args.vocabulary:,} words...")
+    started = time.perf_counter()
+    index, postings, entities = build_corpus(args.docs, args.vocabulary, args.words_per_doc, args.seed,
+                                            args.positions, args.ngrams)
+    build_seconds = time.perf_counter() - started
+    print(f"📊 {len(index.terms):,} keywords, {len(postings):,} postings in {build_seconds:.1f}s")
+
+    if args.engine == "memory":
+        search_engine.set_index(index)
+    elif args.engine == "mmap":
+        from backend.disk_index import DiskIndex, write_index
+        index_dir = os.path.join(tempfile.mkdtemp(prefix="lawpy-bench-"), "index")
+        write_index(index, index_dir)
+        search_engine.set_index(DiskIndex(index_dir))
+    else:
+        settings.DB = args.mongo_db
+        print(f"🍃 Loading the corpus into MongoDB database '{args.mongo_db}'...")
+        load_mongodb(postings, entities)
+        search_engine.set_index(None)
+
+    # Zipf-distributed repeats of distinct questions, unique per run so earlier runs'
+    # shared cache entries are never hit
+    run = uuid.uuid4().hex[:8]
+    rng = random.Random(args.seed + 1)
+    distinct = [f"question {run} {i}" for i in range(args.questions)]
+    questions = rng.choices(distinct, weights=[1 / (i + 1) for i in range(args.questions)], k=args.sessions)
+
+    llm = make_llm(index, args.keywords, args.llm_delay, args.seed)
+    print(f"🚀 {args.sessions} sessions ({1 + args.pages} requests each) at concurrency {args.concurrency}...")
+    with mock.patch.object(settings, 'KEYWORD_EXTRACTOR', 'llm'), \
+            mock.patch.object(keywords, 'extract_keywords_llm', llm), \
+            mock.patch.object(views, 'print', lambda *a, **k: None, create=True):
+        latencies, errors, elapsed = run_load(questions, args.sessions, args.concurrency, args.pages, args.ranking)
+
+    requests = len(latencies["submit"]) + len(latencies["results"])
+    report = {
+        "config": vars(args),
+        "environment": {
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "corpus": {
+            "documents": len(entities),
+            "keywords": len(index.terms),
+            "postings": len(postings),
+            "build_seconds": build_seconds,
+        },
+        "elapsed_seconds": elapsed,
+        "sessions_per_second": args.sessions / elapsed,
+        "requests_per_second": requests / elapsed,
+        "errors": errors,
+        "latency": {name: percentiles(samples) for name, samples in latencies.items()},
+        "server_stages": timing.snapshot()["stages"],
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, summary in report["latency"].items():
+        print(f"{name:>8}: p50 {summary['p50_ms']:8.2f} ms   p95 {summary['p95_ms']:8.2f} ms   "
+              f"p99 {summary['p99_ms']:8.2f} ms")
+    print(f"⚡ {report['sessions_per_second']:.1f} sessions/s, {report['requests_per_second']:.1f} requests/s, "
+          f"errors {errors}")
+    print(f"💾 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Build the dense document vectors and IVF index used by the "hybrid" ranking.
+
+Run after scripts/process_opinions.py: reads data/document_entities.json and the unigram
+postings of data/keyword_postings.json, embeds every opinion with TF-IDF + randomized
+truncated SVD and clusters the vectors into inverted lists, all locally with NumPy.
+Point LAWPY_DENSE_INDEX_DIR at the output directory.
+
+Usage:
+    python scripts/build_dense_index.py [--data data] [--output data/dense] [--dims 128]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+
+from backend.dense_index import build_from_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dense vector index from the indexer's JSON output.")
+    parser.add_argument("--data", default="data", help="directory with document_entities.json and keyword_postings.json")
+    parser.add_argument("--output", default="data/dense", help="dense index directory to write")
+    parser.add_argument("--dims", type=int, default=128, help="vector dimensions")
+    parser.add_argument("--min-df", type=int, default=2, help="ignore words in fewer documents")
+    parser.add_argument("--max-df", type=float, default=0.5, help="ignore words in a larger fraction of documents")
+    parser.add_argument("--max-terms", type=int, default=50000, help="most frequent words kept")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"🧮 Building dense index from {args.data} ({args.dims} dimensions)...")
+    started = time.perf_counter()
+    meta = build_from_json(args.data, args.output, dims=args.dims, min_df=args.min_df, max_df=args.max_df,
+                           max_terms=args.max_terms, seed=args.seed)
+    print(f"✅ Dense index written to {args.output}: {meta['num_docs']:,} documents, {meta['num_terms']:,} words, "
+          f"{meta['num_lists']:,} lists in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
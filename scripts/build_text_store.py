@@ -0,0 +1,72 @@
+"""
+Build the compressed opinion text store used for result snippets.
+
+Reads the scraped opinions (textBlock) either from the scraper's MongoDB database
+(court_listener_db.opinions), from the shards of scripts/convert_opinions.py or from
+data/opinions.json, builds a zlib preset dictionary
+from a sample of them and writes the block-compressed store with its id index.
+Point LAWPY_TEXT_STORE_DIR at the output directory.
+
+Usage:
+    python scripts/build_text_store.py [--shards data/opinions | --json data/opinions.json
+        | --mongo-uri mongodb://localhost:27017/] [--output data/text]
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+
+from backend.opinions import default_input, opinions_from_json, opinions_from_mongodb, opinions_from_shards
+from backend.text_store import TextStoreWriter, train_dictionary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the compressed opinion text store for snippets.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--shards", metavar="DIR",
+                        help="opinion shards from convert_opinions.py (default: data/opinions if it exists and is "
+                             "not older than data/opinions.json)")
+    source.add_argument("--json", help="exported opinions array (default: data/opinions.json)")
+    source.add_argument("--mongo-uri", help="read court_listener_db.opinions from this MongoDB instead")
+    parser.add_argument("--database", default="court_listener_db", help="scraper database with --mongo-uri")
+    parser.add_argument("--output", default="data/text", help="text store directory to write")
+    parser.add_argument("--sample", type=int, default=2000, help="opinions sampled for the compression dictionary")
+    args = parser.parse_args()
+    if not (args.shards or args.json or args.mongo_uri):
+        if os.path.isdir(default_input()):
+            args.shards = "data/opinions"
+        else:
+            args.json = "data/opinions.json"
+
+    def opinions():
+        if args.mongo_uri:
+            source = opinions_from_mongodb(args.mongo_uri, args.database)
+        elif args.shards:
+            source = opinions_from_shards(args.shards)
+        else:
+            source = opinions_from_json(args.json)
+        return ((opinion["doc_id"], opinion["text"]) for opinion in source if opinion["doc_id"] and opinion["text"].strip())
+
+    started = time.perf_counter()
+    print(f"📖 Building compression dictionary from {args.sample:,} opinions...")
+    zdict = train_dictionary(text for _, text in itertools.islice(opinions(), args.sample))
+
+    print(f"🗜️ Compressing opinions into {args.output}...")
+    writer = TextStoreWriter(args.output, zdict)
+    for count, (doc_id, text) in enumerate(opinions(), 1):
+        writer.add(doc_id, text)
+        if count % 10000 == 0:
+            print(f"📄 {count:,} opinions stored")
+    meta = writer.close()
+
+    ratio = meta["raw_bytes"] / meta["stored_bytes"] if meta["stored_bytes"] else 0
+    print(f"✅ Text store written: {meta['num_docs']:,} opinions, {meta['raw_bytes'] / 1e6:,.1f} MB of text "
+          f"in {meta['stored_bytes'] / 1e6:,.1f} MB ({ratio:.1f}x) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Convert the opinions export into JSON lines shards for the indexers.
+
+data/opinions.json is one JSON array, which Spark can only read with multiLine on a single
+task and index_opinions.py has to parse in one process. This streams the array one opinion
+at a time (memory stays flat) into data/opinions/part-00000.jsonl, ... with only the fields
+the indexers use (_id, link, title, textBlock, scrapedAt). Shards can be split and read in parallel:
+process_opinions.py and index_opinions.py read data/opinions when it exists.
+
+The output directory is written next to the old one and swapped in when complete.
+
+Usage:
+    python scripts/convert_opinions.py [--json data/opinions.json] [--output data/opinions]
+        [--shard-size 2000]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+
+from backend.opinions import iter_json_array
+
+FIELDS = ("_id", "link", "title", "textBlock", "scrapedAt")
+
+
+def convert(json_path, out_dir, shard_size):
+    """
+    Split the exported opinions array into JSON lines shards.
+
+    Args:
+        json_path (str): Exported opinions array
+        out_dir (str): Shard directory, replaced when the conversion is complete
+        shard_size (int): Opinions per shard
+
+    Returns:
+        tuple: (number of opinions, number of shards)
+    """
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    opinions = shards = 0
+    out = None
+    try:
+        with open(json_path, encoding='utf-8') as f:
+            for opinion in iter_json_array(f):
+                if opinions % shard_size == 0:
+                    if out is not None:
+                        out.close()
+                    out = open(os.path.join(tmp_dir, f"part-{shards:05d}.jsonl"), 'w', encoding='utf-8')
+                    shards += 1
+                out.write(json.dumps({field: opinion[field] for field in FIELDS if field in opinion},
+                                     ensure_ascii=False) + '\n')
+                opinions += 1
+                if opinions % 10000 == 0:
+                    print(f"📄 {opinions:,} opinions converted")
+        if out is not None:
+            out.close()
+    except BaseException:
+        if out is not None:
+            out.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if os.path.exists(out_dir):
+        old_dir = f"{out_dir}.old-{os.getpid()}"
+        os.rename(out_dir, old_dir)
+        os.rename(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.rename(tmp_dir, out_dir)
+    return opinions, shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the opinions export into JSON lines shards.")
+    parser.add_argument("--json", default="data/opinions.json", help="exported opinions array")
+    parser.add_argument("--output", default="data/opinions", help="shard directory to write")
+    parser.add_argument("--shard-size", type=int, default=2000, help="opinions per shard")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    print(f"✂️ Converting {args.json} into shards of {args.shard_size:,} opinions...")
+    opinions, shards = convert(args.json, args.output, args.shard_size)
+    print(f"✅ {opinions:,} opinions written to {shards:,} shards in {args.output} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
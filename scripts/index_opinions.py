@@ -0,0 +1,588 @@
+"""
+Index court opinions without Spark: a pure-Python alternative to process_opinions.py.
+
+Streams the opinions from data/opinions.json or from the scraper's MongoDB collection,
+tokenises them in a pool of worker processes with backend/tokenizer.py (the same rules
+as process_batch) and writes keyword_postings.json and document_entities.json (and
+keyword_positions.json with --positions) with the same rows as the Spark job. Only the
+content is the same: Spark writes compact JSON in partition order, so the files are not
+byte for byte equal to the Spark job's. When the export has been split into shards
+(scripts/convert_opinions.py, data/opinions by default) each worker parses whole shards
+itself, so reading the input scales with the workers too.
+
+Each worker counts the terms of the documents it is sent and keeps the resulting lines
+in memory, spilling them as sorted run files split by the first letter of the keyword.
+The runs of each letter are then merged in parallel (a k-way heapq.merge), each into
+its own range of the output file. Postings come out grouped by keyword, then sorted by document
+id, and entities sorted by document id, so the output of this script is byte for byte the same on
+every run and with any number of workers.
+
+With --segments DIR the run is incremental (backend/segments.py): only the opinions added or
+re-scraped since the source mark of the previous run are read (backend/opinions.py), those
+whose content fingerprint differs from their indexed copy's are indexed into a new delta
+segment, and the old copies get tombstones. --deletions also removes the indexed opinions
+missing from the source. The workers serving DIR pick the new generation up without a
+restart, and scripts/merge_segments.py merges the segments in the background.
+--update-mongo-uri applies the same delta to the lawpy collections instead of reloading
+them, and --document-table makes the document table follow DIR.
+
+Usage:
+    python scripts/index_opinions.py [--shards data/opinions | --json data/opinions.json
+        | --mongo-uri mongodb://localhost:27017/] [--workers 8] [--positions] [--no-ngrams] [--binary-index DIR] [--vocabulary DIR]
+        [--document-table DIR] [--packed-postings]
+    python scripts/index_opinions.py --segments data/segments [--positions] [--merge]
+        [--deletions] [--update-mongo-uri mongodb://localhost:27017/] [--document-table DIR]
+"""
+
+import argparse
+from collections import Counter
+import heapq
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+
+from backend.opinions import (
+    changed_since, default_input, mongodb_ids, mongodb_mark, opinions_from_json, opinions_from_mongodb,
+    opinions_from_shard, opinions_from_shards, shard_paths
+)
+from backend.tokenizer import document_terms, word_positions
+
+# Keywords start with a letter, or with a space when a bigram/trigram begins with the empty
+# token single-letter removal leaves behind; bucket 0 holds those, 1-26 the letters
+NUM_BUCKETS = 27
+BATCH_DOCUMENTS = 64
+# Open run files per merge; more runs are merged in several passes
+MERGE_FAN_IN = 64
+
+
+class _Runs:
+    """
+    Output lines of one kind in a worker, spilled as sorted run files per bucket.
+    """
+
+    def __init__(self, tmp_dir, kind, worker, buckets=NUM_BUCKETS):
+        self.tmp_dir = tmp_dir
+        self.kind = kind
+        self.worker = worker
+        self.lines = [[] for _ in range(buckets)]
+        # First letter of a keyword -> the lines of its bucket
+        self.by_letter = {chr(96 + bucket): self.lines[bucket] for bucket in range(1, buckets)}
+        self.pending = 0
+        self.spills = 0
+
+    def bucket(self, keyword):
+        return self.by_letter.get(keyword[0], self.lines[0])
+
+    def spill(self):
+        for bucket, lines in enumerate(self.lines):
+            if not lines:
+                continue
+            lines.sort()
+            path = os.path.join(self.tmp_dir, f"{self.kind}-{bucket:02d}-{self.worker:03d}-{self.spills:05d}.run")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+            lines.clear()
+        self.pending = 0
+        self.spills += 1
+
+
+def index_worker(worker, tasks, results, tmp_dir, positions, ngrams, spill_lines):
+    """
+    Worker process: index the document batches from tasks until None, then report.
+
+    Args:
+        worker (int): Worker number, part of the run file names
+        tasks (Queue): Lists of opinions (see backend/opinions.py) or shard paths to read,
+            None to stop
+        results (Queue): Receives (worker, statistics) once all runs are written
+        tmp_dir (str): Directory for the run files
+        positions (bool): Also write the word positions
+        ngrams (bool): Also index bigrams and trigrams
+        spill_lines (int): Lines kept in memory before they are written as runs
+    """
+    postings = _Runs(tmp_dir, "postings", worker)
+    entities = _Runs(tmp_dir, "entities", worker, buckets=1)
+    position_runs = _Runs(tmp_dir, "positions", worker) if positions else None
+    runs = [kind for kind in (postings, entities, position_runs) if kind is not None]
+    stats = {"documents": 0, "postings": 0, "without_postings": 0, "sample_without_postings": []}
+
+    while True:
+        batch = tasks.get()
+        if batch is None:
+            break
+        if isinstance(batch, str):
+            batch = opinions_from_shard(batch)
+        for opinion in batch:
+            counts, length = document_terms(opinion["text"], ngrams)
+            doc_id = json.dumps(opinion["doc_id"])
+            entities.lines[0].append(json.dumps({
+                "id": opinion["doc_id"],
+                "url": opinion["url"],
+                "title": opinion["title"],
+                "length": length
+            }) + '\n')
+            entities.pending += 1
+            # Keywords are lowercase letters and spaces only, so they need no JSON escaping
+            for keyword, count in counts.items():
+                postings.bucket(keyword).append(f'{{"keyword": "{keyword}", "id": {doc_id}, "count": {count}}}\n')
+            postings.pending += len(counts)
+            if positions:
+                document_positions = word_positions(opinion["text"])
+                for keyword, offsets in document_positions.items():
+                    position_runs.bucket(keyword).append(
+                        f'{{"keyword": "{keyword}", "id": {doc_id}, "positions": [{", ".join(map(str, offsets))}]}}\n'
+                    )
+                position_runs.pending += len(document_positions)
+
+            stats["documents"] += 1
+            stats["postings"] += len(counts)
+            if not counts:
+                stats["without_postings"] += 1
+                if len(stats["sample_without_postings"]) < 5:
+                    stats["sample_without_postings"].append(opinion["doc_id"])
+
+            if sum(kind.pending for kind in runs) >= spill_lines:
+                for kind in runs:
+                    kind.spill()
+
+    for kind in runs:
+        kind.spill()
+    results.put((worker, stats))
+
+
+def _merge_files(paths, out):
+    # Lines are compared as UTF-8 bytes, which orders them like the strings the runs were sorted as
+    files = [open(path, 'rb') for path in paths]
+    try:
+        out.writelines(heapq.merge(*files))
+    finally:
+        for f in files:
+            f.close()
+
+
+def merge_bucket(job):
+    """
+    Merge the sorted runs of one kind and bucket into their place in the output file.
+
+    The merged lines take exactly as many bytes as the runs, so every bucket's offset in
+    the output is known up front and the buckets are merged in parallel.
+
+    Args:
+        job (tuple): (output path, byte offset of the bucket, run file paths)
+    """
+    out_path, offset, paths = job
+    level = 0
+    while len(paths) > MERGE_FAN_IN:
+        merged = []
+        for start in range(0, len(paths), MERGE_FAN_IN):
+            group = paths[start:start + MERGE_FAN_IN]
+            path = f"{paths[0]}.pass{level}-{start // MERGE_FAN_IN:05d}"
+            with open(path, 'wb') as out:
+                _merge_files(group, out)
+            for run in group:
+                os.remove(run)
+            merged.append(path)
+        paths = merged
+        level += 1
+    with open(out_path, 'r+b') as out:
+        out.seek(offset)
+        _merge_files(paths, out)
+    for run in paths:
+        os.remove(run)
+
+
+def _put(tasks, batch, workers):
+    # Block while the workers catch up, but fail instead of hanging if one of them died
+    while True:
+        try:
+            tasks.put(batch, timeout=1)
+            return
+        except queue.Full:
+            for process in workers:
+                if not process.is_alive() and process.exitcode != 0:
+                    raise RuntimeError(f"Indexing worker {process.name} exited with code {process.exitcode}")
+
+
+def index(opinions, data_dir, workers, positions=False, ngrams=True, spill_lines=1000000, shards=None):
+    """
+    Index the opinions into data_dir with a pool of worker processes.
+
+    Args:
+        opinions (iterable): Opinions as yielded by backend/opinions.py (None with shards)
+        data_dir (str): Directory for keyword_postings.json, document_entities.json and
+            keyword_positions.json; each file is replaced when it is complete
+        workers (int): Worker processes
+        positions (bool): Also write keyword_positions.json
+        ngrams (bool): Also index bigrams and trigrams
+        spill_lines (int): Output lines each worker keeps in memory before writing a run
+        shards (list): Shard paths the workers read themselves, instead of opinions
+
+    Returns:
+        dict: Statistics (documents, postings, documents without postings with a sample)
+    """
+    tmp_dir = os.path.join(data_dir, f".index-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        tasks = multiprocessing.Queue(maxsize=2 * workers)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=index_worker, name=f"indexer-{worker}",
+                args=(worker, tasks, results, tmp_dir, positions, ngrams, spill_lines)
+            )
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        batch = []
+        read = 0
+        for path in shards or ():
+            _put(tasks, path, processes)
+        for opinion in opinions or ():
+            batch.append(opinion)
+            if len(batch) == BATCH_DOCUMENTS:
+                _put(tasks, batch, processes)
+                batch = []
+            read += 1
+            if read % 10000 == 0:
+                print(f"📄 {read:,} opinions read")
+        if batch:
+            _put(tasks, batch, processes)
+        for _ in processes:
+            _put(tasks, None, processes)
+
+        stats = Counter()
+        samples = []
+        for _ in processes:
+            while True:
+                try:
+                    _, worker_stats = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    failed = [process for process in processes if not process.is_alive() and process.exitcode != 0]
+                    if failed:
+                        raise RuntimeError(f"Indexing worker {failed[0].name} exited with code {failed[0].exitcode}")
+            samples.extend(worker_stats.pop("sample_without_postings"))
+            stats.update(worker_stats)
+        for process in processes:
+            process.join()
+        print(f"✅ {stats['documents']:,} opinions tokenised, {stats['postings']:,} postings")
+
+        kinds = {"postings": "keyword_postings.json", "entities": "document_entities.json"}
+        if positions:
+            kinds["positions"] = "keyword_positions.json"
+        jobs = []
+        run_files = os.listdir(tmp_dir)
+        for kind, file_name in kinds.items():
+            out_path = os.path.join(tmp_dir, file_name)
+            offset = 0
+            for bucket in range(NUM_BUCKETS):
+                prefix = f"{kind}-{bucket:02d}-"
+                runs = sorted(os.path.join(tmp_dir, name) for name in run_files if name.startswith(prefix))
+                if runs:
+                    jobs.append((out_path, offset, runs))
+                    offset += sum(os.path.getsize(run) for run in runs)
+            with open(out_path, 'wb') as out:
+                out.truncate(offset)
+
+        print(f"🔀 Merging sorted runs ({len(jobs)} buckets)...")
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(merge_bucket, jobs, chunksize=1)
+
+        for file_name in kinds.values():
+            os.replace(os.path.join(tmp_dir, file_name), os.path.join(data_dir, file_name))
+        if not positions and os.path.exists(os.path.join(data_dir, "keyword_positions.json")):
+            # Stale positions would no longer match the postings
+            os.remove(os.path.join(data_dir, "keyword_positions.json"))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    stats = dict(stats)
+    stats["sample_without_postings"] = samples[:5]
+    return stats
+
+
+def write_packed_postings(postings_file, output_file):
+    """
+    Write the packed_postings collection for mongoimport from the keyword-sorted postings.
+
+    Returns:
+        tuple: (number of keywords, number of packed documents)
+    """
+    from backend.packed_postings import pack, to_extended_json
+
+    num_keywords = 0
+    num_documents = 0
+    keyword, postings = None, []
+    with open(postings_file) as f, open(output_file, 'w') as out:
+        for line in f:
+            posting = json.loads(line)
+            if posting["keyword"] != keyword and postings:
+                for document in pack(keyword, postings):
+                    out.write(to_extended_json(document) + '\n')
+                    num_documents += 1
+                num_keywords += 1
+                postings = []
+            keyword = posting["keyword"]
+            postings.append((posting["id"], posting["count"]))
+        if postings:
+            for document in pack(keyword, postings):
+                out.write(to_extended_json(document) + '\n')
+                num_documents += 1
+            num_keywords += 1
+    return num_keywords, num_documents
+
+
+def index_segment(read, root, workers, positions=False, ngrams=True, spill_lines=1000000, apply=None,
+                  source_ids=None):
+    """
+    Index the opinions added or changed since the last run into a new segment of root.
+
+    Only the opinions the source reports as added or re-scraped since the mark recorded
+    by the last run are read; of those, the ones whose content fingerprint matches their
+    live copy's are skipped. The work is in proportion to what changed, not to the corpus.
+
+    Args:
+        read (callable): Called as read(mark of the last run or None), returns the opinions
+            added or re-scraped since (as yielded by backend/opinions.py) and the new mark,
+            which may be filled in while the opinions are iterated
+        root (str): Segment directory (created on the first run, which indexes everything)
+        workers, positions, ngrams, spill_lines: As for index()
+        apply (callable): Called as apply(delta directory or None, ids of the replaced
+            documents) before the new generation is published, e.g. to update MongoDB;
+            if it fails nothing is published and the next run applies the same changes
+        source_ids (callable): Returns the ids of every opinion in the source; when given,
+            live documents missing from it are deleted (this reads every id)
+
+    Returns:
+        dict: Statistics, with the published generation and its number of segments
+            when anything changed
+    """
+    from backend import segments
+
+    with segments.write_lock(root):
+        manifest = segments.read_manifest(root)
+        live = segments.SegmentedIndex(root, manifest)
+        opinions, mark = read(manifest["source"])
+        fingerprints = {}
+        replaced = []
+
+        def changed():
+            for opinion in opinions:
+                fingerprint = segments.fingerprint(opinion)
+                previous = live.fingerprint(opinion["doc_id"])
+                if previous != fingerprint and opinion["doc_id"] not in fingerprints:
+                    fingerprints[opinion["doc_id"]] = fingerprint
+                    if previous is not None:
+                        replaced.append(opinion["doc_id"])
+                    yield opinion
+
+        delta_dir = os.path.join(root, f".delta-{os.getpid()}")
+        shutil.rmtree(delta_dir, ignore_errors=True)
+        os.makedirs(delta_dir)
+        try:
+            stats = index(changed(), delta_dir, workers, positions, ngrams, spill_lines)
+            stats["replaced"] = len(replaced)
+            deleted = []
+            if source_ids is not None:
+                current = set(source_ids())
+                deleted = [doc_id for doc_id in live.live_ids() if doc_id not in current]
+            stats["deleted"] = len(deleted)
+            replaced += deleted
+            if stats["documents"] or replaced or mark != manifest["source"]:
+                delta = delta_dir if stats["documents"] else None
+                if apply is not None and (delta or replaced):
+                    apply(delta, replaced)
+                manifest = segments.add_segment(root, delta, fingerprints, replaced, mark)
+                stats["generation"] = manifest["generation"]
+                stats["segments"] = len(manifest["segments"])
+        finally:
+            shutil.rmtree(delta_dir, ignore_errors=True)
+    return stats
+
+
+def _delta_ids(delta_dir):
+    if delta_dir is None:
+        return []
+    with open(os.path.join(delta_dir, "document_entities.json")) as f:
+        return [json.loads(line)["id"] for line in f if line.strip()]
+
+
+def update_mongodb(uri, database, delta_dir, replaced, batch_size=10000):
+    """
+    Apply an incremental run to the keyword_postings and document_entities collections.
+
+    Every row of the replaced and of the newly indexed documents is deleted before the
+    delta's rows are inserted, so the collections match a full reload without dropping
+    them, and applying the same run twice (e.g. after a failure) changes nothing.
+    """
+    import pymongo
+
+    client = pymongo.MongoClient(uri)
+    try:
+        db = client[database]
+        # Deleting a document's postings needs an index on id besides keyword_idx
+        db["keyword_postings"].create_index("id", name="id_idx")
+        ids = list(dict.fromkeys([*replaced, *_delta_ids(delta_dir)]))
+        for start in range(0, len(ids), 1000):
+            chunk = {"id": {"$in": ids[start:start + 1000]}}
+            db["keyword_postings"].delete_many(chunk)
+            db["document_entities"].delete_many(chunk)
+        if delta_dir is None:
+            return
+        for name in ("document_entities", "keyword_postings"):
+            batch = []
+            with open(os.path.join(delta_dir, f"{name}.json")) as f:
+                for line in f:
+                    batch.append(json.loads(line))
+                    if len(batch) == batch_size:
+                        db[name].insert_many(batch, ordered=False)
+                        batch = []
+            if batch:
+                db[name].insert_many(batch, ordered=False)
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate keyword postings and document entities without Spark.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--shards", metavar="DIR",
+                        help="opinion shards from convert_opinions.py (default: data/opinions if it exists and is "
+                             "not older than data/opinions.json)")
+    source.add_argument("--json", help="exported opinions array (default: data/opinions.json)")
+    source.add_argument("--mongo-uri", help="read court_listener_db.opinions from this MongoDB instead")
+    parser.add_argument("--database", default="court_listener_db", help="scraper database with --mongo-uri")
+    parser.add_argument("--data", default="data", help="directory to write the postings and entities to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per core)")
+    parser.add_argument("--spill-lines", type=int, default=1000000,
+                        help="output lines each worker keeps in memory before writing a sorted run")
+    parser.add_argument("--positions", action="store_true",
+                        help="also write keyword_positions.json (word positions per document)")
+    parser.add_argument("--no-ngrams", dest="ngrams", action="store_false", help="skip the bigram/trigram postings")
+    parser.add_argument("--binary-index", metavar="DIR", help="also write a memory-mappable binary index to DIR")
+    parser.add_argument("--document-table", metavar="DIR", help="also publish a new version of the document table in DIR")
+    parser.add_argument("--packed-postings", action="store_true", help="also write packed_postings.json")
+    parser.add_argument("--vocabulary", metavar="DIR", help="also write the keyword vocabulary to DIR")
+    parser.add_argument("--segments", metavar="DIR",
+                        help="index only the opinions added or changed since the last run, as a new segment in DIR")
+    parser.add_argument("--merge", action="store_true", help="with --segments, merge segments afterwards")
+    parser.add_argument("--update-mongo-uri", metavar="URI",
+                        help="with --segments, apply the changes to the lawpy collections at this MongoDB")
+    parser.add_argument("--deletions", action="store_true",
+                        help="with --segments, also remove the opinions deleted from the source (reads every id)")
+    args = parser.parse_args()
+    if args.segments and (args.binary_index or args.vocabulary or args.packed_postings):
+        parser.error("--segments cannot be combined with the full build outputs")
+    if (args.merge or args.update_mongo_uri or args.deletions) and not args.segments:
+        parser.error("--merge, --update-mongo-uri and --deletions need --segments")
+
+    if not (args.shards or args.json or args.mongo_uri):
+        if os.path.isdir(default_input()):
+            args.shards = "data/opinions"
+        else:
+            args.json = "data/opinions.json"
+    shards = None
+    if args.segments:
+        if args.mongo_uri:
+            def read(since):
+                # Marked before reading: opinions changed while the run reads are left to the next one
+                mark = mongodb_mark(args.mongo_uri, args.database)
+                return opinions_from_mongodb(args.mongo_uri, args.database, since=since, until=mark), mark
+
+            def source_ids():
+                return mongodb_ids(args.mongo_uri, args.database)
+        else:
+            # The files are filtered while they are parsed, in this process
+            def reader():
+                return opinions_from_shards(args.shards) if args.shards else opinions_from_json(args.json)
+
+            def read(since):
+                mark = dict(since or {"last_id": None, "scraped_at": None})
+                return changed_since(reader(), since, mark), mark
+
+            def source_ids():
+                return (opinion["doc_id"] for opinion in reader())
+        print(f"📚 Reading the opinions changed since the last run from "
+              f"{args.database + '.opinions' if args.mongo_uri else args.shards or args.json}...")
+    elif args.mongo_uri:
+        print(f"📚 Streaming opinions from {args.database}.opinions with {args.workers} workers...")
+        opinions = opinions_from_mongodb(args.mongo_uri, args.database)
+    elif args.shards:
+        shards = shard_paths(args.shards)
+        print(f"📚 Reading {len(shards):,} opinion shards from {args.shards} with {args.workers} workers...")
+        opinions = None
+    else:
+        print(f"📚 Streaming opinions from {args.json} with {args.workers} workers...")
+        opinions = opinions_from_json(args.json)
+
+    started = time.perf_counter()
+    if args.segments:
+        def apply(delta_dir, replaced):
+            if args.update_mongo_uri:
+                print("\n🍃 Applying the changes to MongoDB...")
+                update_mongodb(args.update_mongo_uri, "lawpy", delta_dir, replaced)
+                print(f"✅ {len(replaced):,} documents replaced or removed")
+
+        stats = index_segment(read, args.segments, args.workers, args.positions, args.ngrams,
+                              args.spill_lines, apply, source_ids if args.deletions else None)
+        if "generation" not in stats:
+            print(f"✨ No opinions changed since the last run ({time.perf_counter() - started:.1f}s)")
+        else:
+            print(f"✨ Indexed {stats['documents']:,} new or changed opinions into {stats['postings']:,} postings, "
+                  f"{stats['deleted']:,} deleted, in {time.perf_counter() - started:.1f}s")
+            print(f"✅ Generation {stats['generation']} published with {stats['segments']} segments")
+        if args.document_table:
+            from backend.doc_table import publish_segments
+            version = publish_segments(args.document_table, args.segments)
+            print(f"📇 Document table version {version} follows {args.segments}")
+        if args.merge:
+            from backend import segments
+            with segments.write_lock(args.segments):
+                manifest = segments.merge(args.segments)
+            if manifest:
+                print(f"🔀 Merged into generation {manifest['generation']} with {len(manifest['segments'])} segments")
+        return
+
+    stats = index(opinions, args.data, args.workers, args.positions, args.ngrams, args.spill_lines, shards)
+    print(f"✨ Indexed {stats['documents']:,} opinions into {stats['postings']:,} postings "
+          f"in {time.perf_counter() - started:.1f}s")
+    if stats["without_postings"]:
+        print(f"⚠️ Warning: {stats['without_postings']:,} documents have no postings")
+        print("Sample of missing UIDs:", stats["sample_without_postings"])
+
+    postings_file = os.path.join(args.data, "keyword_postings.json")
+    if args.packed_postings:
+        print("\n📦 Packing postings per keyword...")
+        num_keywords, num_documents = write_packed_postings(postings_file, os.path.join(args.data, "packed_postings.json"))
+        print(f"✅ Packed {stats['postings']:,} postings into {num_documents:,} documents for {num_keywords:,} keywords")
+
+    if args.binary_index:
+        from backend.disk_index import build_from_json
+        print(f"\n🗂️ Building binary index in {args.binary_index}...")
+        meta = build_from_json(args.data, args.binary_index)
+        print(f"✅ Binary index written: {meta['num_terms']:,} terms, {meta['num_docs']:,} documents, {meta['num_postings']:,} postings")
+
+    if args.vocabulary:
+        from backend.vocabulary import build_from_json as build_vocabulary
+        print(f"\n🔤 Building keyword vocabulary in {args.vocabulary}...")
+        meta = build_vocabulary(args.data, args.vocabulary)
+        print(f"✅ Vocabulary written: {meta['num_terms']:,} terms in {meta['num_stems']:,} stem classes")
+
+    if args.document_table:
+        from backend.doc_table import publish_from_json
+        print(f"\n📇 Publishing document table in {args.document_table}...")
+        version = publish_from_json(args.document_table, args.data)
+        print(f"✅ Document table version {version} is current")
+
+
+if __name__ == "__main__":
+    main()
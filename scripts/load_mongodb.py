@@ -0,0 +1,157 @@
+"""
+Load the indexer's output into MongoDB without ever exposing a partial collection.
+
+Each collection is loaded into <name>_staging: the JSON lines file is cut into byte
+ranges at line boundaries and a pool of processes, each with its own connection,
+inserts them with unordered bulk inserts. The indexes the backend queries are built on
+the staging collection once it is complete (one build instead of maintaining them on
+every insert), and the staging collections are then renamed over the live ones with
+dropTarget. Each rename is atomic for its own collection: a query sees either the old
+collection or the new, fully indexed one. The renames are separate operations, though,
+so a query that runs between two of them can read a new collection next to an old one
+(say, new keyword_postings with old document_entities). Every collection is loaded and
+indexed before the first rename, which keeps that window to the few milliseconds the
+renames take.
+
+Usage:
+    python scripts/load_mongodb.py [--uri mongodb://localhost:27017/] [--data data]
+        [--workers 8] [--batch-size 5000]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import pymongo
+from bson import json_util
+
+# Collection -> (file written by the indexers, indexes as (field, name) like 02-create-indexes.js)
+COLLECTIONS = {
+    "document_entities": ("document_entities.json", [("id", "id_idx")]),
+    "keyword_postings": ("keyword_postings.json", [("keyword", "keyword_idx")]),
+    # Optional, Extended JSON (process_opinions.py / index_opinions.py --packed-postings)
+    "packed_postings": ("packed_postings.json", [("keyword", "packed_keyword_idx")]),
+}
+RANGE_BYTES = 32 << 20
+
+_db = None
+
+
+def _connect(uri, database):
+    global _db
+    _db = pymongo.MongoClient(uri)[database]
+
+
+def file_ranges(path, range_bytes=RANGE_BYTES):
+    """
+    Cut a JSON lines file into (start, end) byte ranges that begin and end at line boundaries.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + range_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def load_range(job):
+    """
+    Pool worker: insert the lines of one byte range into a collection.
+
+    Returns:
+        int: Documents inserted
+    """
+    collection, path, start, end, batch_size, extended = job
+    loads = json_util.loads if extended else json.loads
+    target = _db[collection]
+    inserted = 0
+    batch = []
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            if line.strip():
+                batch.append(loads(line))
+            if len(batch) == batch_size:
+                target.insert_many(batch, ordered=False, bypass_document_validation=True)
+                inserted += len(batch)
+                batch = []
+    if batch:
+        target.insert_many(batch, ordered=False, bypass_document_validation=True)
+        inserted += len(batch)
+    return inserted
+
+
+def load_staging(pool, db, name, path, batch_size):
+    """
+    Load path into <name>_staging in parallel and build its indexes.
+
+    Returns:
+        int: Documents loaded
+    """
+    staging = f"{name}_staging"
+    db.drop_collection(staging)
+    db.create_collection(staging)
+    jobs = [(staging, path, start, end, batch_size, name == "packed_postings") for start, end in file_ranges(path)]
+    loaded = sum(pool.imap_unordered(load_range, jobs))
+    counted = db[staging].estimated_document_count()
+    if counted != loaded:
+        raise RuntimeError(f"{staging} holds {counted:,} documents, {loaded:,} were inserted")
+    db[staging].create_indexes([
+        pymongo.IndexModel([(field, pymongo.ASCENDING)], name=index_name) for field, index_name in COLLECTIONS[name][1]
+    ])
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load the indexer output into MongoDB and swap each collection in.")
+    parser.add_argument("--uri", default=os.environ.get("MONGODB_URI", "mongodb://localhost:27017/"),
+                        help="MongoDB to load into (default: MONGODB_URI or localhost)")
+    parser.add_argument("--database", default="lawpy")
+    parser.add_argument("--data", default="data", help="directory with the indexer's JSON lines files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="loader processes, each with its own connection (default: one per core)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="documents per unordered bulk insert")
+    args = parser.parse_args()
+
+    collections = {
+        name: os.path.join(args.data, file_name)
+        for name, (file_name, _) in COLLECTIONS.items()
+        if os.path.exists(os.path.join(args.data, file_name))
+    }
+    for name in ("document_entities", "keyword_postings"):
+        if name not in collections:
+            parser.error(f"{COLLECTIONS[name][0]} not found in {args.data}")
+
+    client = pymongo.MongoClient(args.uri)
+    db = client[args.database]
+    started = time.perf_counter()
+    try:
+        with multiprocessing.Pool(args.workers, initializer=_connect, initargs=(args.uri, args.database)) as pool:
+            for name, path in collections.items():
+                print(f"📥 Loading {path} into {name}_staging with {args.workers} workers...")
+                loaded = load_staging(pool, db, name, path, args.batch_size)
+                print(f"✅ {loaded:,} documents loaded and indexed")
+
+        # All staging collections are complete before any is swapped in, so the renames
+        # run back to back; each is atomic on its own, not across the collections
+        for name in collections:
+            db[f"{name}_staging"].rename(name, dropTarget=True)
+        print(f"🔁 Swapped in {', '.join(collections)} one at a time in {time.perf_counter() - started:.1f}s")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Merge the segments written by scripts/index_opinions.py --segments.
+
+Small delta segments are merged into larger ones and segments with many tombstones are
+rewritten without their deleted documents (see backend/segments.py merge_plan). Searches
+keep using the previous generation while a merge runs, and indexing runs wait for it.
+Run it after each refresh, from cron, or in the background with --every.
+
+Usage:
+    python scripts/merge_segments.py data/segments [--max-segments 8] [--max-deleted 0.3]
+        [--every 600]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+
+from backend import segments
+
+
+def merge_once(args):
+    started = time.perf_counter()
+    with segments.write_lock(args.segments):
+        manifest = segments.merge(args.segments, args.max_segments, args.max_deleted)
+    if manifest is None:
+        return False
+    num_docs = sum(entry["num_docs"] - entry["num_deleted"] for entry in manifest["segments"])
+    print(f"✅ Generation {manifest['generation']}: {len(manifest['segments'])} segments, {num_docs:,} documents "
+          f"(merged in {time.perf_counter() - started:.1f}s)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the incremental index segments.")
+    parser.add_argument("segments", help="segment directory written by index_opinions.py --segments")
+    parser.add_argument("--max-segments", type=int, default=8, help="merge further while there are more segments")
+    parser.add_argument("--max-deleted", type=float, default=0.3,
+                        help="rewrite segments with a larger fraction of deleted documents")
+    parser.add_argument("--every", type=int, metavar="SECONDS", help="keep running, checking at this interval")
+    args = parser.parse_args()
+
+    if not segments.is_segmented(args.segments):
+        parser.error(f"{args.segments} has no segment manifest")
+    while True:
+        if not merge_once(args) and not args.every:
+            print("✨ Nothing to merge")
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
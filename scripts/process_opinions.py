@@ -2,24 +2,40 @@
 Script to process court opinions and generate keyword postings and document entities.
 This script uses PySpark to efficiently process large volumes of legal text data,
 extracting keywords and creating searchable postings for legal document search.
+The corpus is indexed in one distributed pass, partitioned by document id; --batch
+processes it a batch of documents at a time instead, for machines short on memory.
+The input is read from the JSON lines shards of scripts/convert_opinions.py when they
+exist, which Spark splits across all cores, or else from the data/opinions.json array.
 """
 
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, lower, regexp_replace, explode, count, length, trim, size, split, expr
+from pyspark.sql.functions import col, lower, regexp_replace, explode, posexplode, length, size, split, expr, collect_list, sort_array
 import os
+import sys
 import json
 import gc
-from bson import ObjectId
+import shutil
+import argparse
 
-def process_batch(df):
+# The binary index format lives in the Django backend so the workers and the indexer share it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'LawPy'))
+
+from backend.opinions import default_input
+
+# Document length in indexed tokens, stored with the entities for BM25 length normalisation
+DOCUMENT_LENGTH = "size(filter(filtered_words, w -> length(w) > 1))"
+# The fields convert_opinions.py keeps; giving the schema saves a pass over the shards to infer it
+OPINION_SCHEMA = "_id STRUCT<`$oid`: STRING>, link STRING, title STRING, textBlock STRING"
+
+def prepare_documents(df):
     """
-    Process a batch of documents to extract keywords and create postings.
-    
+    Clean and tokenise the documents and remove stop words.
+
     Args:
-        df (DataFrame): PySpark DataFrame containing document text
-        
+        df (DataFrame): PySpark DataFrame with doc_id and text columns
+
     Returns:
-        list: List of keyword postings with document IDs and counts
+        DataFrame: df with the filtered_words column (the tokens every keyword is built from)
     """
     
     # Clean text by removing URLs, special characters, and normalizing whitespace
@@ -52,18 +68,21 @@ def process_batch(df):
     remover = StopWordsRemover(inputCol="words", outputCol="filtered_words")
     standard_stop_words = StopWordsRemover.loadDefaultStopWords("english")
     remover.setStopWords(standard_stop_words)
-    df = remover.transform(df)
-    
-    # Generate n-grams for phrase matching
-    from pyspark.ml.feature import NGram
-    bigram = NGram(n=2, inputCol="filtered_words", outputCol="bigrams")
-    df = bigram.transform(df)
-    
-    trigram = NGram(n=3, inputCol="filtered_words", outputCol="trigrams")
-    df = trigram.transform(df)
-    
-    # Process each type of posting separately to manage memory
-    result_postings = []
+    return remover.transform(df)
+
+def keyword_postings(df, ngrams=True):
+    """
+    Build the (doc_id, keyword, count) postings of prepared documents.
+
+    Args:
+        df (DataFrame): Output of prepare_documents
+        ngrams (bool): Create bigram and trigram postings (phrases can be matched from
+            positions instead)
+
+    Returns:
+        list: One DataFrame per keyword kind (words, then bigrams and trigrams), so they can be
+              collected or streamed one at a time
+    """
     
     # Create postings for single words with frequency counts
     word_postings = df.select(
@@ -74,11 +93,16 @@ def process_batch(df):
         (col("keyword") != "")     # Remove empty strings
     ).groupBy("doc_id", "keyword").count()
     
-    # Collect and clear memory
-    word_postings_list = word_postings.collect()
-    result_postings.extend(word_postings_list)
-    word_postings = None
-    gc.collect()
+    if not ngrams:
+        return [word_postings]
+    
+    # Generate n-grams for phrase matching
+    from pyspark.ml.feature import NGram
+    bigram = NGram(n=2, inputCol="filtered_words", outputCol="bigrams")
+    df = bigram.transform(df)
+    
+    trigram = NGram(n=3, inputCol="filtered_words", outputCol="trigrams")
+    df = trigram.transform(df)
     
     # Create postings for bigrams (2-word phrases)
     bigram_postings = df.select(
@@ -90,12 +114,6 @@ def process_batch(df):
         (size(split("keyword", " ")) == 2)  # Ensure exactly two words
     ).groupBy("doc_id", "keyword").count()
     
-    # Collect and clear memory
-    bigram_postings_list = bigram_postings.collect()
-    result_postings.extend(bigram_postings_list)
-    bigram_postings = None
-    gc.collect()
-    
     # Create postings for trigrams (3-word phrases)
     trigram_postings = df.select(
         col("doc_id"),
@@ -108,24 +126,401 @@ def process_batch(df):
         (~col("keyword").rlike(r'\b[a-z]\b'))  # No single-letter words
     ).groupBy("doc_id", "keyword").count()
     
-    # Collect and clear memory
-    trigram_postings_list = trigram_postings.collect()
-    result_postings.extend(trigram_postings_list)
-    trigram_postings = None
+    return [word_postings, bigram_postings, trigram_postings]
+
+def keyword_positions(df):
+    """
+    Token positions of each word of prepared documents, as (doc_id, keyword, positions).
+
+    Positions are counted over filtered_words like the n-grams (the empty tokens left by
+    single-letter removal keep their slot, so phrases stay aligned).
+    """
+    return df.select(
+        col("doc_id"),
+        posexplode("filtered_words").alias("pos", "keyword")
+    ).filter(
+        length("keyword") > 1
+    ).groupBy("doc_id", "keyword").agg(
+        sort_array(collect_list("pos")).alias("positions")
+    )
+
+def process_batch(df, positions=False, ngrams=True):
+    """
+    Process a batch of documents to extract keywords and create postings.
+    
+    Args:
+        df (DataFrame): PySpark DataFrame containing document text
+        positions (bool): Also collect the token positions of every word
+        ngrams (bool): Create bigram and trigram postings (phrases can be matched from
+            positions instead)
+        
+    Returns:
+        tuple: (list of keyword postings with document IDs and counts,
+                list of document lengths in tokens for BM25 scoring,
+                list of word positions per document, empty unless positions is set)
+    """
+    df = prepare_documents(df)
+    doc_lengths = df.select(col("doc_id"), expr(DOCUMENT_LENGTH).alias("length")).collect()
+    
+    # Collect one kind of posting at a time to manage memory
+    result_postings = []
+    for postings in keyword_postings(df, ngrams):
+        result_postings.extend(postings.collect())
+        postings = None
+        gc.collect()
+    
+    position_rows = keyword_positions(df).collect() if positions else []
     
     # Clean up the main dataframe
     df = None
     gc.collect()
     
-    return result_postings
+    return result_postings, doc_lengths, position_rows
+
+def write_packed_postings(spark, postings_file, output_file):
+    """
+    Group the postings by keyword and write the packed_postings collection for mongoimport.
+
+    Args:
+        spark (SparkSession): Active Spark session
+        postings_file (str): keyword_postings.json written by the batches
+        output_file (str): Extended JSON lines output, one document per keyword chunk
+
+    Returns:
+        tuple: (number of keywords, number of packed documents)
+    """
+    from pyspark.sql.functions import collect_list, struct
+    from backend.packed_postings import pack, to_extended_json
+
+    grouped = spark.read.json(postings_file) \
+        .groupBy("keyword") \
+        .agg(collect_list(struct("id", "count")).alias("postings"))
+
+    num_keywords = 0
+    num_documents = 0
+    with open(output_file, 'w') as f:
+        # Keywords arrive one partition at a time, so the driver never holds them all
+        for row in grouped.toLocalIterator():
+            for document in pack(row.keyword, [(posting.id, posting["count"]) for posting in row.postings]):
+                f.write(to_extended_json(document) + '\n')
+                num_documents += 1
+            num_keywords += 1
+    return num_keywords, num_documents
+
+def parse_args():
+    """
+    Parse command line options for the indexer.
+    """
+    parser = argparse.ArgumentParser(description="Generate keyword postings and document entities from court opinions.")
+    parser.add_argument(
+        "--binary-index", metavar="DIR",
+        help="also write a memory-mappable binary index to DIR (e.g. data/index) for LAWPY_SEARCH_ENGINE=mmap"
+    )
+    parser.add_argument(
+        "--document-table", metavar="DIR",
+        help="also publish a new version of the document table in DIR (LAWPY_DOCUMENT_TABLE_DIR); running workers pick it up"
+    )
+    parser.add_argument(
+        "--packed-postings", action="store_true",
+        help="also write data/packed_postings.json (binary per-keyword postings, LAWPY_MONGO_POSTINGS=packed)"
+    )
+    parser.add_argument(
+        "--vocabulary", metavar="DIR",
+        help="also write the keyword vocabulary (prefix, stem and misspelling lookups) to DIR for LAWPY_VOCABULARY_DIR"
+    )
+    parser.add_argument(
+        "--positions", action="store_true",
+        help="also write data/keyword_positions.json (word positions per document) for phrase and proximity queries"
+    )
+    parser.add_argument(
+        "--no-ngrams", dest="ngrams", action="store_false",
+        help="skip the bigram/trigram postings; phrases are then matched from positions (use with --positions)"
+    )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="low-memory mode: index --batch-size documents at a time, rereading the input for every batch"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100,
+        help="documents per batch with --batch (default 100)"
+    )
+    parser.add_argument(
+        "--input",
+        help="opinion shards directory (convert_opinions.py) or exported array "
+             "(default: data/opinions if it exists and is not older than data/opinions.json, "
+             "else data/opinions.json)"
+    )
+    parser.add_argument(
+        "--partitions", type=int,
+        help="partitions the documents are hashed into by id (default 4 per core; 8 with --batch)"
+    )
+    return parser.parse_args()
+
+def write_entities(f, rows):
+    """
+    Write (doc_id, url, title, length) rows to document_entities.json.
+    """
+    for doc_id, url, title, doc_length in rows:
+        entity_doc = {
+            "id": doc_id,
+            "url": url,
+            "title": title,  # Include the title in the output
+            "length": doc_length
+        }
+        f.write(json.dumps(entity_doc) + '\n')
+
+def write_postings(f, rows):
+    """
+    Write (doc_id, keyword, count) rows to keyword_postings.json.
+    """
+    for posting in rows:
+        posting_doc = {
+            "keyword": posting.keyword,
+            "id": posting.doc_id,
+            "count": posting["count"]
+        }
+        f.write(json.dumps(posting_doc) + '\n')
+
+def write_positions(f, rows):
+    """
+    Write (doc_id, keyword, positions) rows to keyword_positions.json.
+    """
+    for row in rows:
+        f.write(json.dumps({"keyword": row.keyword, "id": row.doc_id, "positions": row.positions}) + '\n')
+
+def write_json_lines(df, output_file):
+    """
+    Write a DataFrame as JSON lines from the executors and append them to output_file.
+
+    Every task writes its partition to a part file in a directory next to output_file; the
+    parts are then appended to output_file by a plain byte copy, so no row passes through
+    the driver and its memory stays flat whatever the corpus size. The parts are not kept
+    as compressed shards because every reader of the output (mongoimport in the MongoDB
+    image, load_mongodb.py and the index, vocabulary and document table builders) takes
+    one uncompressed JSON lines file, as index_opinions.py writes it.
+
+    Args:
+        df (DataFrame): Rows to write, with the columns in output order
+        output_file (str): JSON lines file to append to
+
+    Returns:
+        int: Number of lines appended
+    """
+    parts_dir = f"{output_file}.parts"
+    df.write.mode("overwrite").json(parts_dir)
+
+    lines = 0
+    with open(output_file, 'ab') as out:
+        for name in sorted(os.listdir(parts_dir)):
+            if not name.startswith("part-"):
+                continue
+            with open(os.path.join(parts_dir, name), 'rb') as part:
+                while True:
+                    chunk = part.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    lines += chunk.count(b'\n')
+    shutil.rmtree(parts_dir)
+    return lines
+
+def select_documents(opinions):
+    """
+    The columns the indexer uses from the scraped opinions.
+    """
+    return opinions.select(
+        col("link").alias("url"),
+        col("textBlock").alias("text"),
+        col("_id.$oid").alias("doc_id"),  # Use existing MongoDB _id field
+        col("title").alias("title")  # Select the title field
+    ).na.fill("")
+
+def index_single_pass(opinions, args, output_files):
+    """
+    Index the whole corpus in one distributed pass.
+
+    The documents are hash-partitioned by doc_id once. Every aggregation groups by
+    (doc_id, keyword), which that partitioning already satisfies, so tokenising, n-grams and
+    counting run on all cores without another shuffle. The executors write the results
+    (write_json_lines).
+
+    Args:
+        opinions (DataFrame): The scraped opinions
+        args (Namespace): Command line options
+        output_files (dict): Output path per kind ("entities", "postings", "positions")
+
+    Returns:
+        tuple: (number of entities, number of postings)
+    """
+    from functools import reduce
+    from pyspark import StorageLevel
+
+    print(f"🧩 Partitioning documents by id into {args.partitions} partitions...")
+    df = select_documents(opinions).repartition(args.partitions, "doc_id")
+    # Only the tokens are reused by every output; keep them instead of the raw text
+    df = prepare_documents(df).select("doc_id", "url", "title", "filtered_words") \
+        .persist(StorageLevel.MEMORY_AND_DISK)
+
+    try:
+        print("📄 Writing document entities...")
+        entities = df.select(
+            col("doc_id").alias("id"), "url", "title", expr(DOCUMENT_LENGTH).alias("length")
+        )
+        total_entities = write_json_lines(entities, output_files["entities"])
+        print(f"✅ {total_entities:,} entities")
+
+        print("🔑 Writing postings...")
+        postings = reduce(
+            lambda left, right: left.union(right),
+            [kind.select("keyword", col("doc_id").alias("id"), "count") for kind in keyword_postings(df, args.ngrams)]
+        )
+        total_postings = write_json_lines(postings, output_files["postings"])
+        print(f"✅ {total_postings:,} postings")
+
+        if args.positions:
+            print("📍 Writing word positions...")
+            positions = keyword_positions(df).select("keyword", col("doc_id").alias("id"), "positions")
+            total_positions = write_json_lines(positions, output_files["positions"])
+            print(f"✅ {total_positions:,} word position lists")
+    finally:
+        df.unpersist()
+
+    return total_entities, total_postings
+
+def check_uid_consistency(spark, output_files):
+    """
+    Compare the document ids of the written entities and postings with two anti-joins.
+
+    Runs on the executors over the output files, reading only their id field.
+
+    Returns:
+        tuple: (ids in entities but not in postings, ids in postings but not in entities),
+               each as (count, sample of up to 5 ids)
+    """
+    entity_ids = spark.read.schema("id STRING").json(output_files["entities"])
+    posting_ids = spark.read.schema("id STRING").json(output_files["postings"]).distinct()
+
+    missing = []
+    for ids, others in ((entity_ids, posting_ids), (posting_ids, entity_ids)):
+        absent = ids.join(others, "id", "left_anti")
+        missing.append((absent.count(), [row.id for row in absent.limit(5).collect()]))
+    return tuple(missing)
+
+def index_batches(opinions, args, output_files):
+    """
+    Index the corpus batch_size documents at a time (the low-memory mode).
+
+    Each batch filters the whole input again, so this gets slower with corpus size; use
+    it only when a single pass does not fit the machine.
+
+    Args and return value are those of index_single_pass.
+    """
+    # Configure batch processing parameters
+    batch_size = args.batch_size  # Number of documents per batch
+    max_batches = None    # Process all documents (or set to limit processing)
+    
+    total_docs = opinions.count()
+    print(f"📑 Total documents to process: {total_docs:,}")
+    
+    # Calculate batch processing parameters
+    max_docs = total_docs if max_batches is None else min(total_docs, max_batches * batch_size)
+    num_batches = (max_docs + batch_size - 1) // batch_size
+    print(f"📦 Will process {max_docs:,} documents in {num_batches} batches of {batch_size}")
+    
+    # Prepare document IDs for batch processing
+    print("🔍 Preparing document IDs for batch processing...")
+    doc_ids = opinions.select("link", "_id").limit(max_docs).collect()
+    
+    # Initialize tracking variables
+    total_entities = 0
+    total_postings = 0
+    
+    # Process documents in batches
+    for batch_idx in range(num_batches):
+        start_idx = batch_idx * batch_size
+        end_idx = min(start_idx + batch_size, max_docs)
+        
+        # Skip if we're out of documents
+        if start_idx >= len(doc_ids):
+            break
+            
+        # Get document IDs for current batch
+        batch_links = [doc["link"] for doc in doc_ids[start_idx:end_idx]]
+        
+        if not batch_links:
+            print(f"⚠️ No documents in batch {batch_idx+1}, skipping")
+            continue
+            
+        print(f"\n📦 Processing batch {batch_idx+1}/{num_batches} (documents {start_idx+1}-{end_idx})")
+        print(f"📄 Batch contains {len(batch_links)} documents")
+        
+        # Filter and process current batch
+        current_batch = opinions.filter(col("link").isin(batch_links))
+        
+        # Verify batch data
+        batch_count = current_batch.count()
+        print(f"✅ Retrieved {batch_count} documents for processing")
+        
+        if batch_count == 0:
+            print("⚠️ No documents could be retrieved, skipping")
+            continue
+        
+        # Transform data for processing
+        df = select_documents(current_batch)
+        
+        # Extract entities and process keywords
+        entities = df.select("doc_id", "url", "title").collect()
+        print("🔑 Processing keywords...")
+        postings_list, doc_lengths, position_rows = process_batch(df, args.positions, args.ngrams)
+        lengths = {row.doc_id: row.length for row in doc_lengths}
+        
+        # Write entities to output file
+        with open(output_files["entities"], 'a') as f:
+            write_entities(
+                f, ((entity.doc_id, entity.url, entity.title, lengths.get(entity.doc_id, 0)) for entity in entities)
+            )
+        
+        # Write postings to output file
+        with open(output_files["postings"], 'a') as f:
+            write_postings(f, postings_list)
+        
+        # Write word positions to output file
+        if args.positions:
+            with open(output_files["positions"], 'a') as f:
+                write_positions(f, position_rows)
+        
+        # Update totals and print batch summary
+        total_entities += len(entities)
+        total_postings += len(postings_list)
+        
+        print(f"\n📊 Batch {batch_idx+1} summary:")
+        print(f"- 📄 Entities: {len(entities):,}")
+        print(f"- 🔑 Postings: {len(postings_list):,}")
+        print(f"📈 Running totals: {total_entities:,} entities, {total_postings:,} postings")
+        
+        # Clean up batch data
+        current_batch = None
+        df = None
+        entities = None
+        postings_list = None
+        position_rows = None
+        gc.collect()
+
+    return total_entities, total_postings
 
 def main():
     """
     Main function to process court opinions and generate searchable postings.
-    Sets up Spark session, processes documents in batches, and writes results to files.
+    Sets up Spark session, indexes the documents (in one pass, or in batches with --batch),
+    and writes results to files.
     """
-    # Set environment variables for Spark
-    os.environ['PYSPARK_PYTHON'] = os.path.join(os.getcwd(), '.venv/bin/python')
+    args = parse_args()
+    if args.partitions is None:
+        # A few partitions per core keeps every core busy; batches are too small for that
+        args.partitions = 8 if args.batch else 4 * (os.cpu_count() or 2)
+
+    # Run the Python workers with this interpreter unless told otherwise
+    os.environ.setdefault('PYSPARK_PYTHON', sys.executable)
     
     # Initialize Spark session with optimized configuration
     spark = SparkSession.builder \
@@ -133,8 +528,8 @@ def main():
         .master("local[*]") \
         .config("spark.driver.memory", "12g") \
         .config("spark.executor.memory", "8g") \
-        .config("spark.sql.shuffle.partitions", "8") \
-        .config("spark.default.parallelism", "8") \
+        .config("spark.sql.shuffle.partitions", str(args.partitions)) \
+        .config("spark.default.parallelism", str(args.partitions)) \
         .config("spark.driver.extraJavaOptions", "-Djava.security.manager=allow") \
         .config("spark.executor.extraJavaOptions", "-Djava.security.manager=allow") \
         .config("spark.driver.host", "localhost") \
@@ -146,128 +541,45 @@ def main():
         print("🚀 Starting court opinions processing...")
         
         # Define output file paths
-        keyword_output_file = "data/keyword_postings.json"
-        entity_output_file = "data/document_entities.json"
+        output_files = {
+            "postings": "data/keyword_postings.json",
+            "entities": "data/document_entities.json",
+            "positions": "data/keyword_positions.json"
+        }
         
         # Initialize output files
-        with open(keyword_output_file, 'w') as f:
+        with open(output_files["postings"], 'w') as f:
             f.write('')
-        with open(entity_output_file, 'w') as f:
+        with open(output_files["entities"], 'w') as f:
             f.write('')
-        
-        # Configure batch processing parameters
-        batch_size = 100      # Number of documents per batch
-        max_batches = None    # Process all documents (or set to limit processing)
+        if args.positions:
+            with open(output_files["positions"], 'w') as f:
+                f.write('')
+        elif os.path.exists(output_files["positions"]):
+            # Stale positions would no longer match the postings
+            os.remove(output_files["positions"])
         
         # Read and analyze input data
-        print("📚 Reading input JSON file...")
-        sample_df = spark.read \
-            .option("multiLine", "true") \
-            .option("mode", "PERMISSIVE") \
-            .json("data/opinions.json")
+        input_path = args.input or default_input()
+        if os.path.isdir(input_path):
+            print(f"📚 Reading opinion shards from {input_path}...")
+            opinions = spark.read \
+                .schema(OPINION_SCHEMA) \
+                .option("mode", "PERMISSIVE") \
+                .json(os.path.join(input_path, "part-*.jsonl"))
+        else:
+            # One JSON array can only be parsed by a single task; see convert_opinions.py
+            print(f"📚 Reading input JSON file {input_path}...")
+            opinions = spark.read \
+                .option("multiLine", "true") \
+                .option("mode", "PERMISSIVE") \
+                .json(input_path)
             
         print("📊 Data schema:")
-        sample_df.printSchema()
-        
-        total_docs = sample_df.count()
-        print(f"📑 Total documents to process: {total_docs:,}")
+        opinions.printSchema()
         
-        # Calculate batch processing parameters
-        max_docs = total_docs if max_batches is None else min(total_docs, max_batches * batch_size)
-        num_batches = (max_docs + batch_size - 1) // batch_size
-        print(f"📦 Will process {max_docs:,} documents in {num_batches} batches of {batch_size}")
-        
-        # Prepare document IDs for batch processing
-        print("🔍 Preparing document IDs for batch processing...")
-        doc_ids = sample_df.select("link", "_id").limit(max_docs).collect()
-        
-        # Initialize tracking variables
-        total_entities = 0
-        total_postings = 0
-        entity_uids = set()
-        posting_uids = set()
-        
-        # Process documents in batches
-        for batch_idx in range(num_batches):
-            start_idx = batch_idx * batch_size
-            end_idx = min(start_idx + batch_size, max_docs)
-            
-            # Skip if we're out of documents
-            if start_idx >= len(doc_ids):
-                break
-                
-            # Get document IDs for current batch
-            batch_links = [doc["link"] for doc in doc_ids[start_idx:end_idx]]
-            
-            if not batch_links:
-                print(f"⚠️ No documents in batch {batch_idx+1}, skipping")
-                continue
-                
-            print(f"\n📦 Processing batch {batch_idx+1}/{num_batches} (documents {start_idx+1}-{end_idx})")
-            print(f"📄 Batch contains {len(batch_links)} documents")
-            
-            # Filter and process current batch
-            from pyspark.sql.functions import array, lit
-            current_batch = sample_df.filter(col("link").isin(batch_links))
-            
-            # Verify batch data
-            batch_count = current_batch.count()
-            print(f"✅ Retrieved {batch_count} documents for processing")
-            
-            if batch_count == 0:
-                print("⚠️ No documents could be retrieved, skipping")
-                continue
-            
-            # Transform data for processing
-            df = current_batch.select(
-                col("link").alias("url"),
-                col("textBlock").alias("text"),
-                col("_id.$oid").alias("doc_id"),  # Use existing MongoDB _id field
-                col("title").alias("title")  # Select the title field
-            ).na.fill("")
-            
-            # Extract entities and process keywords
-            entities = df.select("doc_id", "url", "title").collect()
-            print("🔑 Processing keywords...")
-            postings_list = process_batch(df)
-            
-            # Write entities to output file
-            with open(entity_output_file, 'a') as f:
-                for entity in entities:
-                    entity_doc = {
-                        "id": entity.doc_id,
-                        "url": entity.url,
-                        "title": entity.title  # Include the title in the output
-                    }
-                    f.write(json.dumps(entity_doc) + '\n')
-                    entity_uids.add(entity.doc_id)
-            
-            # Write postings to output file
-            with open(keyword_output_file, 'a') as f:
-                for posting in postings_list:
-                    posting_doc = {
-                        "keyword": posting.keyword,
-                        "id": posting.doc_id,
-                        "count": posting["count"]
-                    }
-                    f.write(json.dumps(posting_doc) + '\n')
-                    posting_uids.add(posting.doc_id)
-            
-            # Update totals and print batch summary
-            total_entities += len(entities)
-            total_postings += len(postings_list)
-            
-            print(f"\n📊 Batch {batch_idx+1} summary:")
-            print(f"- 📄 Entities: {len(entities):,}")
-            print(f"- 🔑 Postings: {len(postings_list):,}")
-            print(f"📈 Running totals: {total_entities:,} entities, {total_postings:,} postings")
-            
-            # Clean up batch data
-            current_batch = None
-            df = None
-            entities = None
-            postings_list = None
-            gc.collect()
+        index = index_batches if args.batch else index_single_pass
+        total_entities, total_postings = index(opinions, args, output_files)
         
         # Print final processing summary
         print("\n✨ Processing complete!")
@@ -276,22 +588,44 @@ def main():
         
         # Validate UID consistency between collections
         print("\n🔍 Validating UID consistency between collections...")
-        missing_in_postings = entity_uids - posting_uids
-        missing_in_entities = posting_uids - entity_uids
+        missing_in_postings, missing_in_entities = check_uid_consistency(spark, output_files)
         
-        if missing_in_postings:
-            print(f"⚠️ Warning: {len(missing_in_postings)} UIDs found in entities but not in postings")
-            print("Sample of missing UIDs:", list(missing_in_postings)[:5])
+        if missing_in_postings[0]:
+            print(f"⚠️ Warning: {missing_in_postings[0]:,} UIDs found in entities but not in postings")
+            print("Sample of missing UIDs:", missing_in_postings[1])
         
-        if missing_in_entities:
-            print(f"⚠️ Warning: {len(missing_in_entities)} UIDs found in postings but not in entities")
-            print("Sample of missing UIDs:", list(missing_in_entities)[:5])
+        if missing_in_entities[0]:
+            print(f"⚠️ Warning: {missing_in_entities[0]:,} UIDs found in postings but not in entities")
+            print("Sample of missing UIDs:", missing_in_entities[1])
         
-        if not missing_in_postings and not missing_in_entities:
+        if not missing_in_postings[0] and not missing_in_entities[0]:
             print("✅ All UIDs match between entities and postings collections")
+
+        if args.packed_postings:
+            print("\n📦 Packing postings per keyword...")
+            num_keywords, num_documents = write_packed_postings(spark, output_files["postings"], "data/packed_postings.json")
+            print(f"✅ Packed {total_postings:,} postings into {num_documents:,} documents for {num_keywords:,} keywords")
         
     finally:
         spark.stop()
 
+    if args.binary_index:
+        from backend.disk_index import build_from_json
+        print(f"\n🗂️ Building binary index in {args.binary_index}...")
+        meta = build_from_json("data", args.binary_index)
+        print(f"✅ Binary index written: {meta['num_terms']:,} terms, {meta['num_docs']:,} documents, {meta['num_postings']:,} postings")
+
+    if args.vocabulary:
+        from backend.vocabulary import build_from_json as build_vocabulary
+        print(f"\n🔤 Building keyword vocabulary in {args.vocabulary}...")
+        meta = build_vocabulary("data", args.vocabulary)
+        print(f"✅ Vocabulary written: {meta['num_terms']:,} terms in {meta['num_stems']:,} stem classes")
+
+    if args.document_table:
+        from backend.doc_table import publish_from_json
+        print(f"\n📇 Publishing document table in {args.document_table}...")
+        version = publish_from_json(args.document_table, "data")
+        print(f"✅ Document table version {version} is current")
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file